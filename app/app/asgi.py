@@ -13,4 +13,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once django is set up
+from core import invalidation, warmup  # noqa: E402
+from core.events import EventStreamApp  # noqa: E402
+
+# serves the event stream of the changes next to django
+application = EventStreamApp(django_application)
+
+# primes this worker before its first request
+warmup.on_startup()
+
+# keeps the caches in the memory of every worker up to date,
+# listening from the first request of each worker on
+invalidation.start()
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,15 +51,39 @@ INSTALLED_APPS = [
     'recipe',
 ]
 
+# workers only serving the api leave out the admin, which imports
+# every admin class and builds its urls at startup
+API_ONLY = os.environ.get('API_ONLY', '0') == '1'
+if API_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
 MIDDLEWARE = [
+    'core.middleware.RequestProfileMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.MemoryLimitMiddleware',
+    'core.middleware.AdmissionMiddleware',
+    'core.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'core.middleware.BrowserMiddleware',
+]
+
+# run by BrowserMiddleware for every route except the API_PREFIXES,
+# the token authenticated api does not use sessions, csrf or messages
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+API_PREFIXES = ['/api/user/', '/api/recipe/', '/api/debug/']
+
+# the admin checks only look for these middleware in MIDDLEWARE,
+# BrowserMiddleware runs them for the admin
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 ROOT_URLCONF = 'app.urls'
 
@@ -93,6 +119,115 @@ DATABASES = {
     }
 }
 
+# read replicas are given as a comma separated list of hosts,
+# they share the credentials of the default database
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host
+):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# seconds a client reads from the primary after writing something
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+# cache holding the pins, every worker has to see them, so not one
+# with a copy in the memory of the worker
+DATABASE_REPLICA_PIN_CACHE = 'shared'
+
+# replicas lagging more than this many seconds are not used
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 2))
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = 5
+
+# number of hash partitions of the recipe tables, 0 keeps plain tables.
+# only read by the migration, use the partition_recipes command later on.
+RECIPE_PARTITIONS = int(os.environ.get('DB_RECIPE_PARTITIONS', 0))
+
+# a small cache in every worker in front of a shared one, see
+# core.cache. the shared tier is a directory of files unless
+# CACHE_BACKEND and CACHE_LOCATION point to memcached or redis.
+# bumping CACHE_VERSION makes every worker ignore the old values
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TieredCache',
+        'VERSION': int(os.environ.get('CACHE_VERSION', 1)),
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+        },
+    },
+    'shared': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'recipe-cache'),
+        ),
+    },
+}
+# a directory of files is only shared by the workers of one host, run
+# several hosts against memcached or redis. a file cache deletes a
+# third of its files at random once it holds MAX_ENTRIES, which would
+# drop replica pins and throttle counters, so it gets room for them
+if CACHES['shared']['BACKEND'].endswith('.FileBasedCache'):
+    CACHES['shared']['OPTIONS'] = {'MAX_ENTRIES': 100000}
+if sys.argv[1:2] == ['test']:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
+# seconds the results of a cached() queryset are kept, see
+# core.querycache. 0 turns the query cache off
+QUERY_CACHE_TIMEOUT = int(os.environ.get('QUERY_CACHE_TIMEOUT', 60))
+
+# NOTIFY every worker of changed users, recipes, tags, ingredients,
+# tokens and tables, so they can cache them in memory, see
+# core.invalidation. off, every worker reads through those caches
+INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', '1') == '1'
+
+# the last good response of a list is served for up to this many
+# seconds while the database fails, see core.stale. 0 turns it off
+LIST_STALE_MAX_AGE = int(os.environ.get('LIST_STALE_MAX_AGE', 300))
+# seconds before a kept list is replaced by a newer good response
+LIST_STALE_KEEP_INTERVAL = 30
+# seconds a worker serves the kept lists after a database failure
+LIST_STALE_PRESSURE_SECONDS = 10
+
+# requests a worker runs at once before AdmissionMiddleware turns
+# them away, see core.admission. 0 turns admission control off
+ADMISSION_WORKER_LIMIT = int(os.environ.get('ADMISSION_WORKER_LIMIT', 32))
+# per class, the requests in flight at most, the share of the worker
+# limit they may use, the latency above which fewer are let in and how
+# long they may have waited at the proxy
+ADMISSION_CLASSES = {
+    'read': {
+        'concurrency': 32, 'share': 1.0,
+        'target_ms': 200, 'max_queue_ms': 1000,
+    },
+    'write': {
+        'concurrency': 16, 'share': 0.8,
+        'target_ms': 500, 'max_queue_ms': 500,
+    },
+    'login': {
+        'concurrency': 4, 'share': 0.5,
+        'target_ms': 500, 'max_queue_ms': 500,
+    },
+    'upload': {
+        'concurrency': 2, 'share': 0.25,
+        'target_ms': 2000, 'max_queue_ms': 200,
+    },
+}
+ADMISSION_EXEMPT_PREFIXES = ['/metrics', '/api/debug/']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -142,10 +277,100 @@ STATIC_ROOT = '/vol/web/static'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# when set, scraping /metrics/ needs an "Authorization: Bearer <token>"
+# header. set PROMETHEUS_MULTIPROC_DIR to aggregate all worker processes.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# time the phases of every request, see core.timing
+REQUEST_TIMING = os.environ.get('REQUEST_TIMING', '0') == '1'
+SLOW_REQUEST_THRESHOLD_MS = int(
+    os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500)
+)
+# share of the slow requests that get logged
+SLOW_REQUEST_SAMPLE_RATE = float(
+    os.environ.get('SLOW_REQUEST_SAMPLE_RATE', 1.0)
+)
+
+# what happens when a view goes over the budgets it declares, any of
+# log, raise and timeout, see core.budgets. the tests raise.
+REQUEST_BUDGET_MODES = [
+    mode for mode in
+    os.environ.get('REQUEST_BUDGET_MODES', 'log,timeout').split(',')
+    if mode
+]
+if sys.argv[1:2] == ['test']:
+    REQUEST_BUDGET_MODES = ['raise', 'timeout']
+
+# sampling profiles of live workers, see core.profiling. they are
+# stored in a temporary directory unless PROFILE_DIR is set
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+PROFILE_MAX_SECONDS = 60
+# seconds a signed X-Profile header stays valid
+PROFILE_TOKEN_MAX_AGE = 10 * 60
+PROFILE_REQUEST_INTERVAL = 0.001
+
+# memory diagnostics, see core.memory. MEMORY_TRACE_FRAMES starts
+# tracemalloc with tracebacks of that many frames in every process
+MEMORY_TRACE_FRAMES = int(os.environ.get('MEMORY_TRACE_FRAMES', 0))
+MEMORY_SNAPSHOT_DIR = os.environ.get('MEMORY_SNAPSHOT_DIR', '')
+# workers using more resident memory get recycled, 0 turns it off
+MEMORY_HIGH_WATER_MB = int(os.environ.get('MEMORY_HIGH_WATER_MB', 0))
+MEMORY_RECYCLE_SIGNAL = 'SIGTERM'
+
+# seconds the response of a request with an Idempotency-Key is kept
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# share of the keyed requests that also delete the expired keys,
+# purge_idempotency_keys does it from a cron job instead
+IDEMPOTENCY_PURGE_SAMPLE_RATE = float(
+    os.environ.get('IDEMPOTENCY_PURGE_SAMPLE_RATE', 0.01)
+)
+
+# list recipes from the tag/ingredient snapshots stored on them
+# instead of joining the link tables
+RECIPE_LIST_SNAPSHOTS = os.environ.get('RECIPE_LIST_SNAPSHOTS', '1') == '1'
+
+# server-sent event streams of the changes, served by app/asgi.py
+EVENT_STREAM_MAX_CONNECTIONS = int(
+    os.environ.get('EVENT_STREAM_MAX_CONNECTIONS', 10000)
+)
+EVENT_STREAM_HEARTBEAT = 15
+
+
+# only json in production, the browsable api renders an html page
+# with forms when a browser asks for it
+API_JSON_ONLY = os.environ.get(
+    'API_JSON_ONLY', '0' if DEBUG else '1'
+) == '1'
+API_RENDERERS = ['rest_framework.renderers.JSONRenderer']
+if not API_JSON_ONLY:
+    API_RENDERERS.append('rest_framework.renderers.BrowsableAPIRenderer')
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': API_RENDERERS,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.ScopedTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'read': os.environ.get('THROTTLE_READ_RATE', '600/min'),
+        'write': os.environ.get('THROTTLE_WRITE_RATE', '120/min'),
+        'upload': os.environ.get('THROTTLE_UPLOAD_RATE', '20/min'),
+        'login': os.environ.get('THROTTLE_LOGIN_RATE', '10/min'),
+    },
 }
 
+# seconds between two syncs of a throttle bucket with the shared cache
+THROTTLE_SYNC_INTERVAL = 1
+
+# build what django and DRF create lazily before the first request,
+# see core.warmup
+WARMUP = os.environ.get('WARMUP', '1') == '1'
+
+# directory of the schema files written by generate_schema, without
+# it every process generates the schema once on first use
+OPENAPI_SCHEMA_DIR = os.environ.get('OPENAPI_SCHEMA_DIR', '')
+OPENAPI_SCHEMA_MAX_AGE = 24 * 60 * 60
+
 # this setting enables us to upload images into browsable docs interface
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# imported once django is set up
+from core import invalidation, warmup  # noqa: E402
+
+# primes this worker before its first request
+warmup.on_startup()
+
+# keeps the caches in the memory of every worker up to date,
+# listening from the first request of each worker on
+invalidation.start()
@@ -0,0 +1,135 @@
+"""
+Admission control of the requests of a worker.
+
+Every request belongs to a class, the scopes of the throttles: read,
+write, login or upload. AdmissionMiddleware turns a request away with
+a 503 and Retry-After before its view runs when
+
+- its class already has as many requests in flight as it may. The
+  limit shrinks while the recent requests of the class are slower
+  than its target, so a struggling database gets fewer queries
+  instead of more waiting ones.
+- the whole worker is busier than the share of the class allows.
+  Reads may use every slot, uploads only a quarter, so expensive
+  requests are shed first and cheap reads keep going.
+- it already waited in the queue of the proxy for longer than its
+  class allows, going by the X-Request-Start header. Sync workers
+  only see one request at a time, this is where they shed load.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from core import metrics
+
+
+# weight of the latest request in the average latency of its class
+ALPHA = 0.2
+
+
+class ClassState:
+    """Requests of a class in flight and their recent latency."""
+
+    __slots__ = ('in_flight', 'latency')
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency = 0.0
+
+
+_lock = threading.Lock()
+_classes = {}
+_in_flight = {'total': 0}
+
+
+def reset():
+    """Forget the state of this worker."""
+    with _lock:
+        _classes.clear()
+        _in_flight['total'] = 0
+
+
+def request_class(request, view_func):
+    """Return the class of a request, like the throttle scope."""
+    initkwargs = getattr(view_func, 'initkwargs', None) or {}
+    scope = initkwargs.get('throttle_scope') or getattr(
+        getattr(view_func, 'cls', None), 'throttle_scope', None
+    )
+    if scope in settings.ADMISSION_CLASSES:
+        return scope
+    if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return 'read'
+    return 'write'
+
+
+def is_exempt(request):
+    """Return True for requests that are always admitted."""
+    return request.path.startswith(tuple(settings.ADMISSION_EXEMPT_PREFIXES))
+
+
+def queue_seconds(request, now=None):
+    """Return how long a request waited at the proxy, None if unknown.
+
+    X-Request-Start is t= followed by the epoch in seconds,
+    milliseconds or microseconds, depending on the proxy.
+    """
+    value = request.META.get('HTTP_X_REQUEST_START', '')
+    value = value[2:] if value.startswith('t=') else value
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    now = time.time() if now is None else now
+    return max(0.0, now - started)
+
+
+def _limit(config, state):
+    """Return how many requests of a class may be in flight."""
+    limit = config['concurrency']
+    target = config['target_ms'] / 1000
+    if state.latency > target:
+        limit = limit * target / state.latency
+    return max(1, int(limit))
+
+
+def admit(request, request_class):
+    """Return None if the request may run, else seconds to retry after.
+
+    An admitted request must be reported to done() once it finished.
+    """
+    config = settings.ADMISSION_CLASSES[request_class]
+    waited = queue_seconds(request)
+    if waited is not None and waited * 1000 > config['max_queue_ms']:
+        metrics.SHED_REQUESTS.labels(request_class, 'queued').inc()
+        return 1
+
+    with _lock:
+        state = _classes.setdefault(request_class, ClassState())
+        worker_limit = settings.ADMISSION_WORKER_LIMIT * config['share']
+        if (
+            state.in_flight >= _limit(config, state)
+            or _in_flight['total'] >= max(1, worker_limit)
+        ):
+            metrics.SHED_REQUESTS.labels(request_class, 'busy').inc()
+            return max(1, math.ceil(state.latency))
+        state.in_flight += 1
+        _in_flight['total'] += 1
+    return None
+
+
+def done(request_class, seconds):
+    """Report an admitted request as finished after some seconds."""
+    with _lock:
+        state = _classes.setdefault(request_class, ClassState())
+        state.in_flight = max(0, state.in_flight - 1)
+        _in_flight['total'] = max(0, _in_flight['total'] - 1)
+        if state.latency:
+            state.latency += ALPHA * (seconds - state.latency)
+        else:
+            state.latency = seconds
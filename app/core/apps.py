@@ -1,6 +1,17 @@
+import tracemalloc
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # registers the signal handlers
+        from core import signals  # noqa: F401
+
+        # traces allocations from the start, see core.memory
+        if settings.MEMORY_TRACE_FRAMES and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
@@ -0,0 +1,48 @@
+"""
+Token authentication with the tokens kept in the memory of the worker.
+"""
+import pickle
+
+from rest_framework.authentication import TokenAuthentication
+
+from core import invalidation
+
+
+# key -> (user id, pickled (user, token))
+_tokens = invalidation.LocalCache()
+
+
+def _on_user_changed(user_id):
+    if not user_id:
+        _tokens.clear()
+        return
+    _tokens.evict_where(lambda value: str(value[0]) == user_id)
+
+
+# a changed user may be inactive now, a deleted token is no longer
+# valid, both are evicted in every worker
+invalidation.subscribe('user', _on_user_changed)
+invalidation.subscribe('token', _on_user_changed)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication looking a token up once per worker.
+
+    Only while the worker listens to the invalidation bus, otherwise
+    every request looks its token up.
+    """
+
+    def authenticate_credentials(self, key):
+        since = invalidation.epoch()
+        cached = _tokens.get(key)
+        if cached is not None:
+            # every request gets its own copy of the user
+            return pickle.loads(cached[1])
+
+        user, token = super().authenticate_credentials(key)
+        _tokens.set(
+            key,
+            (user.pk, pickle.dumps((user, token), pickle.HIGHEST_PROTOCOL)),
+            since,
+        )
+        return user, token
@@ -0,0 +1,273 @@
+"""
+Benchmark of the API routes.
+
+Requests go through the whole django stack in process, so the
+numbers include middleware, auth, serialization and rendering but
+not the network or the wsgi server.
+"""
+import io
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core.middleware import QueryCounter
+from core.models import Recipe, Tag, Ingredient
+
+
+BENCH_EMAIL = 'benchmark@example.com'
+BENCH_PASSWORD = 'benchmark-pass-123'
+
+
+def seed(recipes=200, tags=20, ingredients=50):
+    """Create the benchmark user and its data if missing."""
+    user = get_user_model().objects.filter(email=BENCH_EMAIL).first()
+    if user is None:
+        user = get_user_model().objects.create_user(
+            BENCH_EMAIL, BENCH_PASSWORD, name='Benchmark'
+        )
+
+    if not Recipe.objects.filter(user=user).exists():
+        tag_objs = Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag {i}') for i in range(tags)
+        )
+        ingredient_objs = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=f'ingredient {i}')
+            for i in range(ingredients)
+        )
+        recipe_objs = Recipe.objects.bulk_create(
+            Recipe(
+                user=user,
+                title=f'recipe {i}',
+                time_minutes=10 + i % 50,
+                price=Decimal('5.00'),
+                description='benchmark recipe',
+            )
+            for i in range(recipes)
+        )
+        for i, recipe in enumerate(recipe_objs):
+            recipe.tags.add(*tag_objs[i % tags:i % tags + 3])
+            recipe.ingredients.add(
+                *ingredient_objs[i % ingredients:i % ingredients + 5]
+            )
+
+    token, created = Token.objects.get_or_create(user=user)
+    return user, token
+
+
+def _image():
+    """Return a small jpeg to upload."""
+    data = io.BytesIO()
+    Image.new('RGB', (64, 64)).save(data, format='JPEG')
+    data.name = 'bench.jpg'
+    data.seek(0)
+    return data
+
+
+def scenarios(user):
+    """Return {name: function(client)} of the benchmarked requests."""
+    recipe = Recipe.objects.filter(user=user).order_by('id').first()
+    tag_ids = list(
+        Tag.objects.filter(user=user).values_list('id', flat=True)[:3]
+    )
+    ingredient_ids = list(
+        Ingredient.objects.filter(user=user).values_list('id', flat=True)[:3]
+    )
+    recipes_url = reverse('recipe:recipe-list')
+
+    return {
+        'recipe-list': lambda c: c.get(recipes_url),
+        'recipe-detail': lambda c: c.get(
+            reverse('recipe:recipe-detail', args=[recipe.id])
+        ),
+        'recipe-filter-tags': lambda c: c.get(
+            recipes_url, {'tags': ','.join(map(str, tag_ids))}
+        ),
+        'recipe-filter-ingredients': lambda c: c.get(
+            recipes_url, {'ingredients': ','.join(map(str, ingredient_ids))}
+        ),
+        'recipe-upload-image': lambda c: c.post(
+            reverse('recipe:recipe-upload-image', args=[recipe.id]),
+            {'image': _image()},
+        ),
+        'tag-list': lambda c: c.get(reverse('recipe:tag-list')),
+        'ingredient-list': lambda c: c.get(reverse('recipe:ingredient-list')),
+        'token-create': lambda c: c.post(
+            reverse('user:token'),
+            {'email': BENCH_EMAIL, 'password': BENCH_PASSWORD},
+        ),
+    }
+
+
+def _client(token):
+    """Return a client authenticated with the token."""
+    # with DEBUG and no ALLOWED_HOSTS django accepts localhost
+    host = 'localhost'
+    allowed = [h for h in settings.ALLOWED_HOSTS if h != '*']
+    if allowed:
+        host = allowed[0].lstrip('.')
+    return Client(HTTP_HOST=host, HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def percentile(values, percent):
+    """Return the nearest rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def _timed_request(request, client):
+    """Run a request, return (seconds, queries, ok)."""
+    counter = QueryCounter()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        response = request(client)
+    duration = time.perf_counter() - start
+    return duration, counter.count, response.status_code < 400
+
+
+def run_scenario(request, token, requests, concurrency):
+    """Run a scenario and return its statistics."""
+
+    def worker(count):
+        # test clients and db connections are not shared between threads
+        client = _client(token)
+        try:
+            return [_timed_request(request, client) for _ in range(count)]
+        finally:
+            connections.close_all()
+
+    shares = [
+        requests // concurrency + (1 if i < requests % concurrency else 0)
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    if concurrency == 1:
+        # runs in the calling thread, so it also works inside a test
+        # transaction, and the connection is left open
+        client = _client(token)
+        results = [_timed_request(request, client) for _ in range(requests)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = [
+                result
+                for batch in executor.map(worker, shares)
+                for result in batch
+            ]
+    elapsed = time.perf_counter() - start
+
+    durations = sorted(result[0] * 1000 for result in results)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for result in results if not result[2]),
+        'p50_ms': round(percentile(durations, 50), 2),
+        'p95_ms': round(percentile(durations, 95), 2),
+        'p99_ms': round(percentile(durations, 99), 2),
+        'mean_ms': round(sum(durations) / len(durations), 2),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'queries_per_request': round(
+            sum(result[1] for result in results) / len(results), 2
+        ),
+    }
+
+
+def run(requests=200, concurrency=4, only=None):
+    """Run the benchmark and return the results."""
+    user, token = seed()
+    results = {}
+
+    # the benchmark measures the api, not how fast it gets throttled
+    rest_framework = {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {},
+    }
+    with override_settings(REST_FRAMEWORK=rest_framework):
+        for name, request in scenarios(user).items():
+            if only and name not in only:
+                continue
+            # warm up caches and connections before measuring
+            run_scenario(request, token, min(5, requests), 1)
+            results[name] = run_scenario(
+                request, token, requests, concurrency
+            )
+
+    return {
+        'meta': {
+            'requests': requests,
+            'concurrency': concurrency,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'scenarios': results,
+    }
+
+
+def compare_stacks(requests=200, only=None):
+    """Benchmark the api with and without the browser middleware.
+
+    Returns the results of both runs and the p50 latency saved per
+    request by skipping the browser middleware on the api routes.
+    """
+    with override_settings(API_PREFIXES=[]):
+        full = run(requests=requests, concurrency=1, only=only)
+    lean = run(requests=requests, concurrency=1, only=only)
+
+    return {
+        'full': full,
+        'lean': lean,
+        'saved_p50_ms': {
+            name: round(
+                stats['p50_ms'] - lean['scenarios'][name]['p50_ms'], 2
+            )
+            for name, stats in full['scenarios'].items()
+        },
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Return a list of regressions of results against a baseline.
+
+    A scenario regresses when its p95 latency grew by more than
+    tolerance or when it runs more queries per request.
+    """
+    regressions = []
+    for name, base in baseline['scenarios'].items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {base["p95_ms"]}ms -> {current["p95_ms"]}ms'
+            )
+        if current['queries_per_request'] > base['queries_per_request']:
+            regressions.append(
+                f'{name}: queries/request {base["queries_per_request"]}'
+                f' -> {current["queries_per_request"]}'
+            )
+    return regressions
+
+
+def load(path):
+    """Read results from a json file."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path):
+    """Write results to a json file."""
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,121 @@
+"""
+Query count and statement timeout budgets of the api views.
+
+Views declare a Budget per action in a budgets dict, for example
+{'list': Budget(queries=4, timeout_ms=2000)}, views that are not
+viewsets use the lowercase http method instead of the action.
+QueryBudgetMiddleware counts the queries of every request and acts
+on the REQUEST_BUDGET_MODES:
+
+- log: log requests running more queries than their budget
+- raise: raise QueryBudgetExceeded, which fails the tests
+- timeout: set the statement_timeout of the budget on the postgres
+  connections the request uses, so runaway queries are cancelled
+"""
+import logging
+from collections import namedtuple
+
+from psycopg2 import errorcodes
+
+from django.db import DatabaseError, OperationalError
+
+
+logger = logging.getLogger(__name__)
+
+Budget = namedtuple('Budget', ['queries', 'timeout_ms'])
+Budget.__new__.__defaults__ = (None, None)
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its view allows."""
+
+
+def budget_for(request, view_func):
+    """Return the Budget of the view and action of a request, if any."""
+    view_class = getattr(view_func, 'cls', None)
+    budgets = getattr(view_class, 'budgets', None)
+    if not budgets:
+        return None
+
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return budgets.get(actions.get(method) or method)
+
+
+def is_timeout(exception):
+    """Return True if a query was cancelled by its statement_timeout."""
+    return (
+        isinstance(exception, OperationalError)
+        and getattr(exception.__cause__, 'pgcode', None)
+        == errorcodes.QUERY_CANCELED
+    )
+
+
+class BudgetTracker:
+    """Database execute wrapper counting the queries of a request.
+
+    When it has a timeout it also sets it on every postgres
+    connection before the first query of the request on it.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.budget = None
+        self.timeout_ms = None
+        self.timed_connections = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.timeout_ms:
+            self._set_timeout(context)
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def _set_timeout(self, context):
+        connection = context['connection']
+        if connection.vendor != 'postgresql':
+            return
+        if any(c is connection for c in self.timed_connections):
+            return
+
+        # the raw cursor skips the execute wrappers
+        context['cursor'].cursor.execute(
+            f'SET statement_timeout = {int(self.timeout_ms)}'
+        )
+        self.timed_connections.append(connection)
+
+    def reset_timeouts(self):
+        """Give the connections their default statement_timeout back.
+
+        Like the SET of the timeout it skips the execute wrappers, so
+        the metrics and timings do not count it as a query of the view.
+        """
+        for connection in self.timed_connections:
+            if connection.connection is None:
+                # closed, the next one starts with the default
+                continue
+            try:
+                with connection.wrap_database_errors:
+                    with connection.connection.cursor() as cursor:
+                        cursor.execute('SET statement_timeout TO DEFAULT')
+            except DatabaseError:
+                # only fails in a broken transaction, whose
+                # rollback undoes the SET as well
+                pass
+        self.timed_connections = []
+
+    def check(self, request, modes):
+        """Log or raise if the request went over its query budget."""
+        budget = self.budget
+        if budget is None or budget.queries is None:
+            return
+        if self.count <= budget.queries:
+            return
+
+        message = (
+            f'{request.method} {request.path} ran {self.count} queries, '
+            f'its budget is {budget.queries}'
+        )
+        if 'log' in modes:
+            logger.warning('query budget exceeded: %s', message)
+        if 'raise' in modes:
+            raise QueryBudgetExceeded(message)
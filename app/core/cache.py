@@ -0,0 +1,308 @@
+"""
+Two tier cache: a small LRU in every worker in front of a shared cache.
+
+Reads are served from the memory of the worker when they can, which
+costs no round trip, and from the shared tier otherwise. A value stays
+in the local tier for LOCAL_TIMEOUT seconds at most, so a change made
+by another worker shows up after that at the latest.
+
+get_or_set with a callable protects expensive values from stampedes:
+
+- a value is recomputed a little before it expires, the sooner the
+  longer it took to compute, by a random one of its readers
+  (probabilistic early expiration) while the others keep using it
+- one thread of one worker of the cluster computes a value at a time,
+  the others keep the old value while there is one, or wait for it
+
+The cluster wide lock needs an atomic add on the shared tier, which
+memcached, redis and the database cache have. The file based cache,
+used when nothing else is configured, gets a lock file instead.
+"""
+import math
+import os
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+from core import metrics
+
+
+# value computed by get_or_set, with the time.time() it expires at
+# and the seconds it took to compute
+Entry = namedtuple('Entry', ['value', 'expires', 'delta'])
+
+MISSING = object()
+FLIGHT_LOCKS = 64
+
+# name -> LocalTier, shared by the threads of the worker
+_locals = {}
+_locals_lock = threading.Lock()
+
+
+class LocalTier:
+    """LRU of pickled values in the memory of a worker."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        # held by the thread computing a value, keys share them
+        # so there is a fixed number of them
+        self.flights = [threading.Lock() for _ in range(FLIGHT_LOCKS)]
+
+    def get(self, key):
+        """Return the value of a key, MISSING if it is not here."""
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return MISSING
+            pickled, expires = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return MISSING
+            self.data.move_to_end(key)
+        # every reader gets its own copy, like from the shared tier
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout):
+        """Keep a value for some seconds, dropping the least recent."""
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (pickled, time.monotonic() + timeout)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def flight(self, key):
+        """Return the lock of the computation of a key in this worker."""
+        return self.flights[hash(key) % FLIGHT_LOCKS]
+
+
+def _file_lock(path, timeout):
+    """Create a lock file, return True if this process got it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for _ in range(2):
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.path.getmtime(path) < timeout:
+                return False
+            # left behind by a worker that died computing
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return False
+
+
+class TieredCache(BaseCache):
+    """Cache backend with a local LRU in front of a shared cache.
+
+    OPTIONS:
+        SHARED: alias of the shared cache, 'shared' by default
+        MAX_ENTRIES: size of the local tier
+        LOCAL_TIMEOUT: seconds a value is kept in the local tier
+        BETA: above 1 recomputes earlier, below 1 later
+        LOCK_TIMEOUT: seconds a computation can hold its lock
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.beta = options.get('BETA', 1.0)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 30)
+        with _locals_lock:
+            self.local = _locals.setdefault(
+                name, LocalTier(self._max_entries)
+            )
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _key(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def _seconds(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+    def _set_local(self, key, value, timeout):
+        seconds = self.local_timeout
+        if isinstance(value, Entry) and value.expires is not None:
+            seconds = min(seconds, value.expires - time.time())
+        elif timeout is not None:
+            seconds = min(seconds, timeout)
+        if seconds > 0:
+            self.local.set(key, value, seconds)
+        else:
+            self.local.delete(key)
+
+    def _get(self, key):
+        """Return what is stored for a made key, MISSING if nothing."""
+        value = self.local.get(key)
+        if value is not MISSING:
+            metrics.CACHE_LOOKUPS.labels('local', 'hit').inc()
+            return value
+
+        value = self.shared.get(key, MISSING)
+        if value is MISSING:
+            metrics.CACHE_LOOKUPS.labels('shared', 'miss').inc()
+            return MISSING
+        metrics.CACHE_LOOKUPS.labels('shared', 'hit').inc()
+        self._set_local(key, value, None)
+        return value
+
+    @staticmethod
+    def _value(stored):
+        return stored.value if isinstance(stored, Entry) else stored
+
+    def get(self, key, default=None, version=None):
+        stored = self._get(self._key(key, version))
+        if stored is MISSING:
+            return default
+        return self._value(stored)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        timeout = self._seconds(timeout)
+        self.shared.set(key, value, timeout)
+        self._set_local(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        timeout = self._seconds(timeout)
+        added = self.shared.add(key, value, timeout)
+        if added:
+            self._set_local(key, value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self.local.delete(key)
+        return self.shared.touch(key, self._seconds(timeout))
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self.local.delete(key)
+        return self.shared.delete(key)
+
+    def incr(self, key, delta=1, version=None):
+        # counters only live in the shared tier, a local copy
+        # would be outdated by the next increment of any worker
+        key = self._key(key, version)
+        self.local.delete(key)
+        return self.shared.incr(key, delta)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def _recompute_early(self, stored):
+        """Return True if this reader should recompute a value now."""
+        if not isinstance(stored, Entry) or stored.expires is None:
+            return False
+        # 1 - random() is never 0, log of it is negative
+        early = -stored.delta * self.beta * math.log(1 - random.random())
+        return time.time() + early >= stored.expires
+
+    def _lock(self, key):
+        """Take the cluster wide lock of a key, True if we got it."""
+        shared = self.shared
+        if isinstance(shared, FileBasedCache):
+            path = shared._key_to_file(key) + '.lock'
+            return _file_lock(path, self.lock_timeout)
+        return shared.add(f'{key}:lock', os.getpid(), self.lock_timeout)
+
+    def _unlock(self, key):
+        shared = self.shared
+        if isinstance(shared, FileBasedCache):
+            try:
+                os.remove(shared._key_to_file(key) + '.lock')
+            except FileNotFoundError:
+                pass
+        else:
+            shared.delete(f'{key}:lock')
+
+    def _compute(self, key, default, timeout):
+        start = time.monotonic()
+        value = default()
+        delta = time.monotonic() - start
+        metrics.CACHE_COMPUTES.inc()
+
+        expires = None if timeout is None else time.time() + timeout
+        entry = Entry(value, expires, delta)
+        self.shared.set(key, entry, timeout)
+        self._set_local(key, entry, timeout)
+        return value
+
+    def _wait(self, key, default, timeout):
+        """Wait for the value another worker is computing."""
+        deadline = time.monotonic() + self.lock_timeout
+        pause = 0.005
+        while time.monotonic() < deadline:
+            time.sleep(pause)
+            stored = self.shared.get(key, MISSING)
+            if stored is not MISSING:
+                self._set_local(key, stored, None)
+                return self._value(stored)
+            pause = min(pause * 2, 0.1)
+
+        # the other worker is stuck, better twice than never
+        return self._compute(key, default, timeout)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """Return the value of a key, computed by default() if needed.
+
+        Only one caller of the cluster computes a missing or expiring
+        value at a time.
+        """
+        if not callable(default):
+            return super().get_or_set(key, default, timeout, version)
+
+        key = self._key(key, version)
+        timeout = self._seconds(timeout)
+        stored = self._get(key)
+        if stored is not MISSING and not self._recompute_early(stored):
+            return self._value(stored)
+
+        with self.local.flight(key):
+            # another thread of this worker may have just done it
+            latest = self._get(key)
+            if latest is not MISSING and (
+                stored is MISSING
+                or getattr(latest, 'expires', None) != stored.expires
+            ):
+                return self._value(latest)
+
+            if self._lock(key):
+                try:
+                    return self._compute(key, default, timeout)
+                finally:
+                    self._unlock(key)
+
+        if stored is not MISSING:
+            # another worker is refreshing it, ours is still good
+            return self._value(stored)
+        return self._wait(key, default, timeout)
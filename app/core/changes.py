@@ -0,0 +1,144 @@
+"""
+Change log of recipes, tags and ingredients for client sync.
+"""
+import base64
+import binascii
+
+from asgiref.local import Local
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from core.models import ChangeLog, Recipe, Tag, Ingredient
+
+
+# postgres NOTIFY channel waking up the event streams, see core.events
+CHANNEL = 'recipe_changes'
+
+KINDS = {
+    Recipe: 'recipe',
+    Tag: 'tag',
+    Ingredient: 'ingredient',
+}
+
+# users being deleted, their changes are deleted with them
+_state = Local()
+
+
+def _deleting_users():
+    if not hasattr(_state, 'users'):
+        _state.users = set()
+    return _state.users
+
+
+def user_deleting(user_id):
+    _deleting_users().add(user_id)
+
+
+def user_deleted(user_id):
+    _deleting_users().discard(user_id)
+
+
+def _lock_user(user_id):
+    # locking the user makes concurrent writes of one user commit in
+    # the order of their change ids, so a cursor never skips a change
+    if connection.in_atomic_block:
+        list(
+            get_user_model().objects.select_for_update()
+            .filter(pk=user_id).values_list('pk', flat=True)
+        )
+
+
+def _notify(user_id, change_id):
+    """Wake up the event streams of a user once the change commits."""
+    # postgres only delivers a NOTIFY when its transaction commits
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_notify(%s, %s)', [CHANNEL, f'{user_id}:{change_id}']
+        )
+
+
+def latest_change_id(user_id):
+    """Return the id of the last change of a user, 0 without any."""
+    change = ChangeLog.objects.filter(
+        user_id=user_id
+    ).order_by('-id').values_list('id', flat=True).first()
+    return change or 0
+
+
+def log_change(instance, action):
+    """Record a change of a recipe, tag or ingredient."""
+    if instance.user_id in _deleting_users():
+        return
+
+    _lock_user(instance.user_id)
+    change = ChangeLog.objects.create(
+        user_id=instance.user_id,
+        kind=KINDS[type(instance)],
+        object_id=instance.pk,
+        action=action,
+    )
+    _notify(instance.user_id, change.id)
+
+
+def log_changes(user_id, model, object_ids, action):
+    """Record the same change of many objects of a user."""
+    object_ids = list(object_ids)
+    if not object_ids or user_id in _deleting_users():
+        return
+
+    _lock_user(user_id)
+    logged = ChangeLog.objects.bulk_create(
+        ChangeLog(
+            user_id=user_id,
+            kind=KINDS[model],
+            object_id=object_id,
+            action=action,
+        )
+        for object_id in object_ids
+    )
+    _notify(user_id, max(change.id or 0 for change in logged))
+
+
+def encode_cursor(change_id):
+    """Return the opaque cursor of a change id."""
+    return base64.urlsafe_b64encode(str(change_id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the change id of a cursor, raise ValueError if invalid."""
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError('Invalid cursor.')
+
+
+def read_changes(user, after, limit):
+    """Return (changes, last id, has more) of a user after a change id.
+
+    Several changes of one object are merged into its last action,
+    except that an object created in the page is reported as created.
+    """
+    rows = list(
+        ChangeLog.objects.filter(user=user, id__gt=after)
+        .order_by('id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    merged = {}
+    for row in rows:
+        key = (row.kind, row.object_id)
+        action = row.action
+        previous = merged.pop(key, None)
+        if previous == ChangeLog.CREATED and action == ChangeLog.UPDATED:
+            action = ChangeLog.CREATED
+        # popping and adding again keeps them in order of last change
+        merged[key] = action
+
+    last_id = rows[-1].id if rows else after
+    return merged, last_id, has_more
@@ -0,0 +1,48 @@
+"""
+Helpers for the recipe counters of tags and ingredients.
+
+The handlers in core.signals keep recipe_count in step with the links,
+whoever changes them: the api, the admin, recipe.tags.add(),
+tag.recipe_set.remove(), clear() and set() from either side, and
+deleting recipes one by one or with a queryset.
+
+Writes that skip the signals are not counted: bulk_create or update()
+on the link tables, raw sql and the COPY of seed_data, which writes
+the counts itself. Run reconcile_recipe_counts after those.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+# recipe field -> column of its link table pointing at the counted model
+COUNTED_FIELDS = {
+    'tags': 'tag_id',
+    'ingredients': 'ingredient_id',
+}
+
+
+def adjust_recipe_counts(model, ids, delta):
+    """Add delta to the recipe_count of the given objects."""
+    # never going below zero keeps a drifted counter from
+    # failing the check constraint, reconcile fixes it later
+    if ids:
+        model.objects.filter(id__in=ids).update(
+            recipe_count=Greatest(F('recipe_count') + delta, 0)
+        )
+
+
+def reconcile_recipe_counts(model, through, column):
+    """Recount recipe_count from the link table, return rows fixed.
+
+    column is the column of the link table pointing at model,
+    like tag_id.
+    """
+    counts = through.objects.filter(
+        **{column: OuterRef('pk')}
+    ).order_by().values(column).annotate(count=Count('id')).values('count')
+
+    return model.objects.annotate(
+        actual=Coalesce(Subquery(counts), 0)
+    ).exclude(recipe_count=F('actual')).update(
+        recipe_count=Coalesce(Subquery(counts), 0)
+    )
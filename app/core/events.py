@@ -0,0 +1,281 @@
+"""
+Server-Sent Events stream of the changes of a user.
+
+EventStreamApp serves the stream in app/asgi.py and passes every other
+request to django. Writing the change log sends a postgres NOTIFY with
+the user and change id, and one LISTEN connection per process wakes up
+the streams of that user. A waiting stream is only a few objects on
+the event loop, so a process can hold thousands of them.
+
+The events only carry the cursor of the last change, clients read the
+changes themselves from the changes API.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from rest_framework.authtoken.models import Token
+
+from core import changes
+
+
+logger = logging.getLogger(__name__)
+
+PATH = '/api/recipe/events/'
+
+
+class Subscription:
+    """A stream waiting for the changes of a user."""
+
+    __slots__ = ('user_id', 'last_id', 'changed')
+
+    def __init__(self, user_id, last_id):
+        self.user_id = user_id
+        self.last_id = last_id
+        self.changed = asyncio.Event()
+
+    def notify(self, change_id):
+        if change_id > self.last_id:
+            self.last_id = change_id
+            self.changed.set()
+
+
+class Listener:
+    """The LISTEN connection of the process, shared by all streams.
+
+    It connects with the first stream and disconnects after the last
+    one, and after connecting it catches up on what it might have
+    missed while it was not listening.
+    """
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.count = 0
+        self._task = None
+
+    def subscribe(self, user_id, last_id):
+        subscription = Subscription(user_id, last_id)
+        self.subscriptions[user_id].add(subscription)
+        self.count += 1
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        user_subscriptions = self.subscriptions.get(subscription.user_id)
+        if user_subscriptions is not None:
+            user_subscriptions.discard(subscription)
+            if not user_subscriptions:
+                del self.subscriptions[subscription.user_id]
+        self.count -= 1
+        if self.count == 0 and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def dispatch(self, payload):
+        """Wake up the streams of the user of a notification."""
+        user_id, change_id = map(int, payload.split(':'))
+        for subscription in self.subscriptions.get(user_id, ()):
+            subscription.notify(change_id)
+
+    def _connect(self):
+        params = connections['default'].get_connection_params()
+        listen_connection = psycopg2.connect(**params)
+        listen_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with listen_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {changes.CHANNEL}')
+        return listen_connection
+
+    async def _catch_up(self):
+        """Notify the streams of changes made while not listening."""
+        for user_id in list(self.subscriptions):
+            change_id = await sync_to_async(changes.latest_change_id)(user_id)
+            for subscription in self.subscriptions.get(user_id, ()):
+                subscription.notify(change_id)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        delay = 1
+        while True:
+            try:
+                await self._listen(loop)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('event stream listener failed')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    async def _listen(self, loop):
+        listen_connection = await loop.run_in_executor(None, self._connect)
+        readable = asyncio.Event()
+        loop.add_reader(listen_connection.fileno(), readable.set)
+        try:
+            await self._catch_up()
+            while True:
+                await readable.wait()
+                readable.clear()
+                # raises once the server closed the connection
+                listen_connection.poll()
+                while listen_connection.notifies:
+                    self.dispatch(listen_connection.notifies.pop(0).payload)
+        finally:
+            loop.remove_reader(listen_connection.fileno())
+            listen_connection.close()
+
+
+listener = Listener()
+
+
+def authenticate(headers, query_string):
+    """Return the user id of a token from the header or ?token=.
+
+    Browsers can not set headers on an EventSource, so the token is
+    also accepted in the query string.
+    """
+    key = None
+    auth = headers.get(b'authorization', b'').decode('latin1').split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        key = auth[1]
+    else:
+        key = parse_qs(query_string.decode('latin1')).get('token', [None])[0]
+    if not key:
+        return None
+
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user_id
+
+
+def _event(change_id):
+    """Return the message telling a client about new changes."""
+    data = json.dumps({'cursor': changes.encode_cursor(change_id)})
+    return f'id: {change_id}\nevent: changes\ndata: {data}\n\n'.encode()
+
+
+async def _respond(send, status, detail, headers=()):
+    """Send a json error response."""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': detail}).encode(),
+    })
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class EventStreamApp:
+    """ASGI app serving the event stream, other requests go to django."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != PATH:
+            return await self.application(scope, receive, send)
+        if scope['method'] != 'GET':
+            return await _respond(send, 405, 'Method not allowed.')
+
+        # like django does at the start and end of every request,
+        # the stream does not go through its handler
+        await sync_to_async(close_old_connections)()
+        try:
+            await self.respond(scope, receive, send)
+        finally:
+            await sync_to_async(close_old_connections)()
+
+    async def respond(self, scope, receive, send):
+        headers = dict(scope['headers'])
+        user_id = await sync_to_async(authenticate)(
+            headers, scope['query_string']
+        )
+        if user_id is None:
+            return await _respond(
+                send, 401, 'Invalid token.',
+                [(b'www-authenticate', b'Token')],
+            )
+        if listener.count >= settings.EVENT_STREAM_MAX_CONNECTIONS:
+            return await _respond(
+                send, 503, 'Too many event streams.', [(b'retry-after', b'5')]
+            )
+
+        await self.stream(user_id, headers, receive, send)
+
+    async def stream(self, user_id, headers, receive, send):
+        try:
+            last_event_id = int(headers.get(b'last-event-id', b''))
+        except ValueError:
+            last_event_id = None
+
+        # subscribing first means no change falls between the lookup
+        # of the last change and listening for the next ones
+        subscription = listener.subscribe(user_id, last_event_id or 0)
+        disconnected = asyncio.ensure_future(_disconnected(receive))
+        try:
+            latest = await sync_to_async(changes.latest_change_id)(user_id)
+            if last_event_id is None:
+                subscription.last_id = max(subscription.last_id, latest)
+            else:
+                # a reconnecting client gets what it missed right away
+                subscription.notify(latest)
+
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': b'retry: 5000\n\n',
+                'more_body': True,
+            })
+
+            while True:
+                changed = asyncio.ensure_future(
+                    subscription.changed.wait()
+                )
+                done, pending = await asyncio.wait(
+                    {changed, disconnected},
+                    timeout=settings.EVENT_STREAM_HEARTBEAT,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    changed.cancel()
+                    break
+                if changed in done:
+                    subscription.changed.clear()
+                    body = _event(subscription.last_id)
+                else:
+                    # keeps proxies from closing an idle stream
+                    changed.cancel()
+                    body = b': keepalive\n\n'
+                await send({
+                    'type': 'http.response.body',
+                    'body': body,
+                    'more_body': True,
+                })
+        finally:
+            disconnected.cancel()
+            listener.unsubscribe(subscription)
@@ -0,0 +1,144 @@
+"""
+Idempotency-Key support for API actions.
+
+The first request with a key stores its response and later requests
+with the same key get that response replayed. The key row is inserted
+in the same transaction as the action, so a duplicate arriving while
+the first one still runs blocks on the unique index until the first
+commits, and then replays its response instead of running again.
+
+Expired keys are deleted by a sample of the keyed requests and by the
+purge_idempotency_keys command, a key found expired is replaced.
+"""
+import functools
+import hashlib
+import json
+import random
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def _describe(value):
+    """Make uploaded files part of the fingerprint by name and size."""
+    if isinstance(value, UploadedFile):
+        return f'{value.name}:{value.size}'
+    return str(value)
+
+
+def fingerprint(request):
+    """Return a hash of what a request asks for."""
+    data = request.data
+    if hasattr(data, 'dict'):
+        data = data.dict()
+    payload = json.dumps(
+        [request.method, request.path, data],
+        sort_keys=True,
+        default=_describe,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def expired_before():
+    """Return the creation time before which keys are expired."""
+    return timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def purge_expired():
+    """Delete the expired keys of all users, return how many."""
+    deleted, _ = IdempotencyKey.objects.filter(
+        created_at__lt=expired_before()
+    ).delete()
+    return deleted
+
+
+def _claim(user, key, request_fingerprint):
+    """Insert the row of a key, or return the row already there."""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=request_fingerprint
+            )
+    except IntegrityError:
+        return IdempotencyKey.objects.get(user=user, key=key)
+
+
+def _replay(record, request_fingerprint):
+    """Return the stored response of a key."""
+    if record.fingerprint != request_fingerprint:
+        return Response(
+            {'detail': f'{HEADER} was already used for another request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    data = json.loads(zlib.decompress(bytes(record.response)))
+    return Response(
+        data,
+        status=record.status_code,
+        headers={**record.headers, REPLAYED_HEADER: 'true'},
+    )
+
+
+def idempotent(handler):
+    """Make a viewset action idempotent for requests with a key."""
+
+    @functools.wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {'detail': f'{HEADER} is too long.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if random.random() < settings.IDEMPOTENCY_PURGE_SAMPLE_RATE:
+            purge_expired()
+
+        request_fingerprint = fingerprint(request)
+        with transaction.atomic():
+            record = _claim(request.user, key, request_fingerprint)
+            if record.created_at < expired_before():
+                # not purged yet, the key is free to use again
+                record.delete()
+                record = _claim(request.user, key, request_fingerprint)
+            if record.status_code is not None:
+                return _replay(record, request_fingerprint)
+
+            response = handler(self, request, *args, **kwargs)
+
+            # failures are not stored so the client can retry them
+            if response.status_code >= 500:
+                transaction.set_rollback(True)
+                return response
+
+            record.status_code = response.status_code
+            record.response = zlib.compress(
+                json.dumps(response.data, cls=DjangoJSONEncoder).encode()
+            )
+            # the headers set by the action, like the ETag of an upload,
+            # the content type is set again when the replay is rendered
+            record.headers = {
+                name: value for name, value in response.items()
+                if name != 'Content-Type'
+            }
+            record.save(update_fields=['status_code', 'response', 'headers'])
+
+        return response
+
+    return wrapper
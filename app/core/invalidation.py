@@ -0,0 +1,243 @@
+"""
+Invalidation bus of the caches kept in the memory of the workers.
+
+Saving or deleting a user, recipe, tag, ingredient or token publishes
+a message like 'user:12' with a postgres NOTIFY, and so does every
+table the query cache bumps, as 'table:core_tag'. Postgres delivers
+them when the transaction commits, drops them on a rollback and sends
+the same message of a transaction only once.
+
+Every worker runs a BusListener thread LISTENing for them, started by
+its first request, which hands
+each message to the handlers subscribed to its topic, so a LocalCache
+drops what changed within milliseconds of the commit. The caches only
+keep values while the listener is connected. A worker that is not
+listening reads through them, and after reconnecting they are emptied
+since the messages sent in between are lost.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.cache import TieredCache
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache_invalidation'
+
+# topic -> functions called with the key of each message
+_handlers = defaultdict(list)
+_caches = []
+_listening = threading.Event()
+_lock = threading.Lock()
+_epoch = 0
+# the listener of this process, and the process it belongs to
+_listener = {'pid': None, 'thread': None}
+
+
+def subscribe(topic, handler):
+    """Call handler(key) for every message of a topic."""
+    _handlers[topic].append(handler)
+
+
+def is_listening():
+    """Return True while this worker receives the messages."""
+    return _listening.is_set()
+
+
+def epoch():
+    """Return the number of messages this worker received so far.
+
+    A value read from the database before a message arrived may be
+    outdated already, see LocalCache.set.
+    """
+    return _epoch
+
+
+def dispatch(payload):
+    """Hand a message to the handlers of its topic."""
+    global _epoch
+    topic, _, key = payload.partition(':')
+    with _lock:
+        _epoch += 1
+    for handler in _handlers.get(topic, ()):
+        try:
+            handler(key)
+        except Exception:
+            logger.exception('invalidation of %s failed', payload)
+
+
+def publish(topic, key=''):
+    """Tell every worker that something changed, on commit.
+
+    An empty key means everything of the topic.
+    """
+    if not settings.INVALIDATION_BUS:
+        return
+    message = f'{topic}:{key}'
+    # this worker does not wait for its own message to arrive
+    dispatch(message)
+
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, message])
+
+
+def clear_caches():
+    """Empty every LocalCache of this worker."""
+    for local_cache in _caches:
+        local_cache.clear()
+
+
+class LocalCache:
+    """Dict in the memory of a worker emptied by the bus messages."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.data = {}
+        _caches.append(self)
+
+    def get(self, key, default=None):
+        if not is_listening():
+            return default
+        return self.data.get(key, default)
+
+    def set(self, key, value, since):
+        """Keep a value read when epoch() was since.
+
+        A message that arrived after the value was read may be about
+        it, so the value is not kept.
+        """
+        if not is_listening() or since != _epoch:
+            return
+        if len(self.data) >= self.max_entries:
+            self.data.clear()
+        self.data[key] = value
+
+    def evict(self, key):
+        self.data.pop(key, None)
+
+    def evict_where(self, test):
+        """Evict the values test(value) is True for."""
+        for key, value in list(self.data.items()):
+            if test(value):
+                self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+class BusListener(threading.Thread):
+    """Thread receiving the messages of the bus for this worker."""
+
+    def __init__(self):
+        super().__init__(name='invalidation-bus', daemon=True)
+        self.stopped = threading.Event()
+
+    def run(self):
+        delay = 1
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            try:
+                self.listen()
+            except Exception:
+                logger.exception('invalidation bus listener failed')
+            if time.monotonic() - started > 60:
+                delay = 1
+            self.stopped.wait(delay)
+            delay = min(delay * 2, 30)
+
+    def stop(self):
+        """Stop listening and wait for the thread to end."""
+        self.stopped.set()
+        self.join()
+
+    def connect(self):
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        # a dead connection is noticed without waiting for a message
+        params.update(
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+        )
+        listen_connection = psycopg2.connect(**params)
+        listen_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        return listen_connection
+
+    def listen(self):
+        listen_connection = self.connect()
+        try:
+            with listen_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            # anything cached before may have changed since
+            clear_caches()
+            _listening.set()
+            idle = 0
+            while not self.stopped.is_set():
+                if not select.select([listen_connection], [], [], 1)[0]:
+                    idle += 1
+                    if idle >= 60:
+                        # raises if the server went away
+                        with listen_connection.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        idle = 0
+                    continue
+                idle = 0
+                listen_connection.poll()
+                while listen_connection.notifies:
+                    dispatch(listen_connection.notifies.pop(0).payload)
+        finally:
+            _listening.clear()
+            listen_connection.close()
+
+
+def keeps_memory_caches():
+    """Return True if the workers cache anything in their memory.
+
+    With a cache backend that is not in memory, like a plain redis or
+    memcached, the workers read through the LocalCaches as well and
+    need no connection to the bus.
+    """
+    return isinstance(caches['default'], (TieredCache, LocMemCache))
+
+
+def _start_listener(**kwargs):
+    pid = os.getpid()
+    if _listener['pid'] == pid:
+        return
+    with _lock:
+        if _listener['pid'] == pid:
+            return
+        _listener['pid'] = pid
+        _listener['thread'] = BusListener()
+        _listener['thread'].start()
+
+
+def start():
+    """Listen in every worker from its first request on.
+
+    Called by the entry points. They are imported by the master of a
+    preforking server before it forks, and by commands and tests that
+    never serve a request, so the thread is not started right away.
+    """
+    if not settings.INVALIDATION_BUS or not keeps_memory_caches():
+        return
+    if connections[DEFAULT_DB_ALIAS].vendor != 'postgresql':
+        return
+    request_started.connect(_start_listener, dispatch_uid='invalidation-bus')
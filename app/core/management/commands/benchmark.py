@@ -0,0 +1,101 @@
+"""
+Django command to benchmark the API against the local database.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    """Django command to measure latency and queries of the API routes."""
+
+    help = (
+        'Benchmark the API routes, save the results as json and '
+        'compare them to a baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            dest='scenarios',
+            help='Only run this scenario, can be repeated.',
+        )
+        parser.add_argument('--output', help='Write the results here.')
+        parser.add_argument('--baseline', help='Compare with these results.')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Allowed relative p95 growth before it is a regression.',
+        )
+        parser.add_argument(
+            '--compare-middleware',
+            action='store_true',
+            help='Measure the overhead the browser middleware would add '
+                 'to the api routes.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('Requests and concurrency must be positive.')
+
+        if options['compare_middleware']:
+            return self._compare_middleware(options)
+
+        results = benchmark.run(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            only=options['scenarios'],
+        )
+
+        self.stdout.write(
+            f'{"scenario":<28}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"req/s":>9}{"queries":>9}{"errors":>8}'
+        )
+        for name, stats in results['scenarios'].items():
+            self.stdout.write(
+                f'{name:<28}{stats["p50_ms"]:>9}{stats["p95_ms"]:>9}'
+                f'{stats["p99_ms"]:>9}{stats["throughput_rps"]:>9}'
+                f'{stats["queries_per_request"]:>9}{stats["errors"]:>8}'
+            )
+
+        if options['output']:
+            benchmark.save(results, options['output'])
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if options['baseline']:
+            regressions = benchmark.compare(
+                results,
+                benchmark.load(options['baseline']),
+                options['tolerance'],
+            )
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(regression))
+                raise CommandError(f'{len(regressions)} regressions found.')
+            self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    def _compare_middleware(self, options):
+        """Print the p50 of the api with and without browser middleware."""
+        results = benchmark.compare_stacks(
+            requests=options['requests'], only=options['scenarios']
+        )
+
+        self.stdout.write(
+            f'{"scenario":<28}{"full p50":>10}{"lean p50":>10}{"saved":>9}'
+        )
+        for name, saved in results['saved_p50_ms'].items():
+            self.stdout.write(
+                f'{name:<28}'
+                f'{results["full"]["scenarios"][name]["p50_ms"]:>10}'
+                f'{results["lean"]["scenarios"][name]["p50_ms"]:>10}'
+                f'{saved:>9}'
+            )
+
+        if options['output']:
+            benchmark.save(results, options['output'])
+            self.stdout.write(f'Results written to {options["output"]}')
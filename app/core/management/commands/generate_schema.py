@@ -0,0 +1,28 @@
+"""
+Django command to pre-generate the OpenAPI schema.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import schema
+
+
+class Command(BaseCommand):
+    """Django command to write the compressed OpenAPI schema files."""
+
+    help = 'Generate the OpenAPI schema into OPENAPI_SCHEMA_DIR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory', default=settings.OPENAPI_SCHEMA_DIR
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not options['directory']:
+            raise CommandError(
+                'Set OPENAPI_SCHEMA_DIR or pass --directory.'
+            )
+
+        for path in schema.write(options['directory']):
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path}.'))
@@ -0,0 +1,45 @@
+"""
+Django command to partition the recipe tables by user.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+    """Django command to convert recipe tables to partitioned tables."""
+
+    help = 'Hash partition the recipe tables, or undo it with --undo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=getattr(settings, 'RECIPE_PARTITIONS', 0) or 16,
+        )
+        parser.add_argument('--undo', action='store_true')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning needs a postgres database.')
+
+        partitioned = partitioning.is_partitioned(connection)
+        if options['undo']:
+            if not partitioned:
+                raise CommandError('Recipe tables are not partitioned.')
+            partitions = 0
+        else:
+            if partitioned:
+                raise CommandError('Recipe tables are already partitioned.')
+            partitions = options['partitions']
+            if partitions < 2:
+                raise CommandError('Use at least 2 partitions.')
+
+        self.stdout.write('Converting recipe tables...')
+        with transaction.atomic():
+            partitioning.partition_tables(connection, partitions)
+
+        self.stdout.write(self.style.SUCCESS('Recipe tables converted!'))
@@ -0,0 +1,18 @@
+"""
+Django command to delete expired idempotency keys.
+"""
+from django.core.management.base import BaseCommand
+
+from core.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    """Django command to delete expired idempotency keys."""
+
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL.'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        deleted = purge_expired()
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} keys.'))
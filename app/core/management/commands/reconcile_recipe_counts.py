@@ -0,0 +1,24 @@
+"""
+Django command to recount the recipes of tags and ingredients.
+"""
+from django.core.management.base import BaseCommand
+
+from core.counters import reconcile_recipe_counts
+from core.models import Recipe, Tag, Ingredient
+
+
+class Command(BaseCommand):
+    """Django command to fix drifted recipe counters."""
+
+    help = 'Recount recipe_count of tags and ingredients.'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        tags = reconcile_recipe_counts(Tag, Recipe.tags.through, 'tag_id')
+        ingredients = reconcile_recipe_counts(
+            Ingredient, Recipe.ingredients.through, 'ingredient_id'
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed {tags} tags and {ingredients} ingredients.'
+        ))
@@ -0,0 +1,44 @@
+"""
+Django command to warm up and profile the startup of a worker.
+"""
+from django.core.management.base import BaseCommand
+
+from core import warmup
+
+
+class Command(BaseCommand):
+    """Django command to run the warm-up steps and report their cost."""
+
+    help = 'Run the worker warm-up and report the time of each step.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--imports',
+            type=int,
+            default=0,
+            help='Also list the N slowest imports of app.wsgi.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        for name, step in warmup.run().items():
+            line = (
+                f'{name}: {step["ms"]}ms, '
+                f'{step["modules_imported"]} modules imported'
+            )
+            if 'error' in step:
+                self.stdout.write(self.style.ERROR(f'{line}, {step["error"]}'))
+            else:
+                self.stdout.write(line)
+
+        if options['imports']:
+            self.stdout.write('cumulative ms    self ms  module')
+            for cumulative, own, depth, module in warmup.import_profile(
+                top=options['imports']
+            ):
+                self.stdout.write(
+                    f'{cumulative:13.1f} {own:10.1f}  '
+                    f'{"  " * depth}{module}'
+                )
+
+        self.stdout.write(self.style.SUCCESS('Warm-up done.'))
@@ -0,0 +1,203 @@
+"""
+Memory diagnostics of a worker with tracemalloc.
+
+Staff turn tracing on in a worker through the debug api, take
+snapshots and compare them. Snapshots are dumped to disk, so any
+worker can load and compare them later. Allocations are attributed
+to the innermost frame of our apps that made them, so a leak shows up
+as a line of recipe, user or core code instead of somewhere deep in
+django.
+
+With MEMORY_HIGH_WATER_MB set, MemoryLimitMiddleware recycles a
+worker whose resident memory grew past it, once the response that
+crossed it has been sent.
+"""
+import os
+import re
+import resource
+import signal
+import tempfile
+import tracemalloc
+from collections import defaultdict
+
+from django.conf import settings
+
+from core.profiling import new_id
+from core.timing import APP_DIRS
+
+
+SNAPSHOT_ID = re.compile(r'^[\w-]+$')
+
+# allocations of tracemalloc and of the import system are noise
+FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+
+def rss_bytes():
+    """Return the resident memory of this process."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # the peak, in kilobytes on linux, where /proc exists anyway
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def status():
+    """Return the memory use and tracing state of this worker."""
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'pid': os.getpid(),
+        'rss_bytes': rss_bytes(),
+        'tracing': tracemalloc.is_tracing(),
+        'frames': tracemalloc.get_traceback_limit(),
+        'traced_bytes': current,
+        'traced_peak_bytes': peak,
+        'high_water_mb': settings.MEMORY_HIGH_WATER_MB,
+    }
+
+
+def start(frames):
+    """Start tracing allocations with tracebacks of some frames."""
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    tracemalloc.start(frames)
+
+
+def stop():
+    """Stop tracing, which also frees the traces."""
+    tracemalloc.stop()
+
+
+def snapshot_dir():
+    """Return the directory the snapshots are stored in."""
+    return settings.MEMORY_SNAPSHOT_DIR or os.path.join(
+        tempfile.gettempdir(), 'recipe-memory'
+    )
+
+
+def snapshot_path(snapshot_id):
+    """Return the file of a snapshot, None for an invalid id."""
+    if not SNAPSHOT_ID.match(snapshot_id):
+        return None
+    return os.path.join(snapshot_dir(), f'{snapshot_id}.snapshot')
+
+
+def take_snapshot():
+    """Take and store a snapshot, return (id, snapshot)."""
+    snapshot = tracemalloc.take_snapshot().filter_traces(FILTERS)
+    snapshot_id = new_id()
+    os.makedirs(snapshot_dir(), exist_ok=True)
+    snapshot.dump(snapshot_path(snapshot_id))
+    return snapshot_id, snapshot
+
+
+def load_snapshot(snapshot_id):
+    """Return a stored snapshot, None if there is no such snapshot."""
+    path = snapshot_path(snapshot_id)
+    if path is None or not os.path.exists(path):
+        return None
+    return tracemalloc.Snapshot.load(path)
+
+
+def list_snapshots():
+    """Return the stored snapshots, the newest first."""
+    directory = snapshot_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith('.snapshot'):
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        snapshots.append({
+            'id': name[:-len('.snapshot')],
+            'size': stat.st_size,
+            'created': stat.st_mtime,
+        })
+    return sorted(snapshots, key=lambda s: s['created'], reverse=True)
+
+
+def _site(traceback, group):
+    """Return where an allocation was made from our point of view."""
+    base = str(settings.BASE_DIR) + os.sep
+    # the frames are ordered from the oldest to the most recent
+    for frame in reversed(traceback):
+        if frame.filename.startswith(APP_DIRS):
+            filename = frame.filename[len(base):]
+            if group == 'file':
+                return filename
+            return f'{filename}:{frame.lineno}'
+
+    frame = traceback[-1]
+    if group == 'file':
+        return frame.filename
+    return f'{frame.filename}:{frame.lineno}'
+
+
+def top_sites(snapshot, base=None, group='line', limit=20):
+    """Return the allocation sites using the most memory.
+
+    With a base snapshot the sites that grew the most since are
+    returned instead. group is 'line' or 'file'.
+    """
+    if base is None:
+        stats = [
+            (stat.traceback, stat.size, stat.count, 0, 0)
+            for stat in snapshot.statistics('traceback')
+        ]
+    else:
+        stats = [
+            (stat.traceback, stat.size, stat.count,
+             stat.size_diff, stat.count_diff)
+            for stat in snapshot.compare_to(base, 'traceback')
+        ]
+
+    sites = defaultdict(lambda: [0, 0, 0, 0])
+    for traceback, size, count, size_diff, count_diff in stats:
+        site = sites[_site(traceback, group)]
+        site[0] += size
+        site[1] += count
+        site[2] += size_diff
+        site[3] += count_diff
+
+    key = 0 if base is None else 2
+    ordered = sorted(sites.items(), key=lambda i: i[1][key], reverse=True)
+    return [
+        {
+            'site': name,
+            'size': size,
+            'count': count,
+            'size_diff': size_diff,
+            'count_diff': count_diff,
+        }
+        for name, (size, count, size_diff, count_diff) in ordered[:limit]
+    ]
+
+
+def current_top_sites(limit=5):
+    """Return the top allocation sites now, empty when not tracing."""
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces(FILTERS)
+    return top_sites(snapshot, limit=limit)
+
+
+def over_high_water():
+    """Return True if this worker uses more memory than allowed."""
+    limit = settings.MEMORY_HIGH_WATER_MB
+    return bool(limit) and rss_bytes() > limit * 1024 * 1024
+
+
+def recycle():
+    """Ask the server to replace this worker.
+
+    gunicorn and uwsgi workers finish their requests and exit on
+    MEMORY_RECYCLE_SIGNAL, and the master starts a new one.
+    """
+    os.kill(os.getpid(), getattr(signal, settings.MEMORY_RECYCLE_SIGNAL))
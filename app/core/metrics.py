@@ -0,0 +1,101 @@
+"""
+Prometheus metrics of the API.
+
+When PROMETHEUS_MULTIPROC_DIR is set every worker process writes its
+values to mmapped files in that directory and the metrics view adds
+them up, so a scrape sees the whole server and not a single worker.
+"""
+import os
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+
+LABELS = ['view', 'action', 'method']
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Time spent processing a request.',
+    LABELS,
+    buckets=(
+        .005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10,
+    ),
+)
+REQUESTS = Counter(
+    'http_requests',
+    'Number of requests by response status.',
+    LABELS + ['status'],
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Number of database queries made by a request.',
+    LABELS,
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_TIME = Histogram(
+    'http_request_db_duration_seconds',
+    'Time a request spent waiting for the database.',
+    LABELS,
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes',
+    'Size of response bodies.',
+    LABELS,
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000),
+)
+
+CACHE_LOOKUPS = Counter(
+    'cache_lookups',
+    'Lookups of the two tier cache by tier and result.',
+    ['tier', 'result'],
+)
+CACHE_COMPUTES = Counter(
+    'cache_computes',
+    'Values computed by get_or_set of the two tier cache.',
+)
+SHED_REQUESTS = Counter(
+    'shed_requests',
+    'Requests turned away by admission control by class and reason.',
+    ['request_class', 'reason'],
+)
+
+
+def view_labels(request, view_func):
+    """Return the (view, action) labels of a resolved view.
+
+    DRF puts the view class on the function returned by as_view()
+    and, for viewsets, the mapping of http methods to actions.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return view_func.__name__, ''
+
+    actions = getattr(view_func, 'actions', None) or {}
+    return view_class.__name__, actions.get(request.method.lower(), '')
+
+
+def observe(labels, status, duration, queries, db_time, size):
+    """Record the metrics of a finished request."""
+    REQUEST_LATENCY.labels(*labels).observe(duration)
+    REQUESTS.labels(*labels, str(status)).inc()
+    DB_QUERIES.labels(*labels).observe(queries)
+    DB_TIME.labels(*labels).observe(db_time)
+    if size is not None:
+        RESPONSE_SIZE.labels(*labels).observe(size)
+
+
+def render():
+    """Return the metrics in the prometheus text format."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    return generate_latest(REGISTRY)
@@ -0,0 +1,378 @@
+"""
+Middlewares for the app.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.core.signals import request_finished
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from core import (
+    admission, budgets, memory, metrics, profiling, routers, timing,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _pin_key(credentials):
+    """Return the cache key used to pin a client to the primary."""
+    digest = hashlib.sha1(credentials.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+def _pin_cache():
+    """Return the cache the pins are kept in, shared by the workers."""
+    return caches[getattr(settings, 'DATABASE_REPLICA_PIN_CACHE', 'shared')]
+
+
+def _request_credentials(request):
+    """Return whatever identifies the client of a request, if anything."""
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if auth.startswith('Token '):
+        return auth.split(' ', 1)[1].strip()
+
+    return request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+
+class ReplicaRoutingMiddleware:
+    """Let safe requests read from replicas.
+
+    Once a client writes something it is pinned to the primary for
+    DATABASE_REPLICA_PIN_SECONDS so it can read its own writes, on
+    whichever worker its next request lands.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not routers.get_replicas():
+            return self.get_response(request)
+
+        credentials = _request_credentials(request)
+        pinned = bool(credentials) and _pin_cache().get(
+            _pin_key(credentials)
+        )
+        routers.begin_request(
+            allow_replica=request.method in SAFE_METHODS and not pinned
+        )
+        try:
+            response = self.get_response(request)
+            if routers.request_wrote():
+                self._pin(credentials, response)
+        finally:
+            routers.end_request()
+
+        return response
+
+    def _pin(self, credentials, response):
+        """Pin the client that made the request to the primary."""
+        seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5)
+        pins = _pin_cache()
+
+        # a freshly created token is not on the replicas yet,
+        # so the client has to use the primary with it as well
+        data = getattr(response, 'data', None)
+        if isinstance(data, dict) and data.get('token'):
+            pins.set(_pin_key(data['token']), True, seconds)
+
+        if credentials:
+            pins.set(_pin_key(credentials), True, seconds)
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Record prometheus metrics of every request, labeled by view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._metrics_labels = ('unresolved', '')
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        size = None if response.streaming else len(response.content)
+        metrics.observe(
+            (*request._metrics_labels, request.method),
+            response.status_code,
+            duration,
+            counter.count,
+            counter.duration,
+            size,
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_labels = metrics.view_labels(request, view_func)
+
+
+class TimingMiddleware:
+    """Time the phases of requests when REQUEST_TIMING is enabled.
+
+    Adds a Server-Timing header to the response and logs slow
+    requests with the queries they ran.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REQUEST_TIMING:
+            return self.get_response(request)
+
+        timer = timing.begin()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            timing.end()
+        total = time.perf_counter() - start
+
+        response['Server-Timing'] = timer.server_timing(total)
+        timer.log_if_slow(request, response, total)
+        return response
+
+
+class RequestProfileMiddleware:
+    """Profile single requests that carry a signed X-Profile header.
+
+    The id of the stored profile is returned in X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        value = request.headers.get(profiling.HEADER)
+        if not value or not profiling.is_valid(value):
+            return self.get_response(request)
+
+        sampler = profiling.Sampler(
+            profiling.new_id(),
+            settings.PROFILE_REQUEST_INTERVAL,
+            thread_ids={threading.get_ident()},
+        )
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+
+        response[profiling.ID_HEADER] = sampler.profile_id
+        return response
+
+
+class MemoryLimitMiddleware:
+    """Recycle the worker once it grew past MEMORY_HIGH_WATER_MB."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.recycling = False
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if self.recycling or not memory.over_high_water():
+            return response
+
+        self.recycling = True
+        logger.warning(
+            'worker %s uses %s bytes, over MEMORY_HIGH_WATER_MB, '
+            'recycling it. top allocation sites: %s',
+            os.getpid(), memory.rss_bytes(), memory.current_top_sites(),
+        )
+        # the signal is sent once the server sent the response
+        request_finished.connect(
+            self._recycle, weak=False, dispatch_uid='memory-recycle'
+        )
+        return response
+
+    def _recycle(self, **kwargs):
+        request_finished.disconnect(dispatch_uid='memory-recycle')
+        memory.recycle()
+
+
+class AdmissionMiddleware:
+    """Turn requests away with a 503 while the worker is overloaded.
+
+    See core.admission for when a request is admitted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_WORKER_LIMIT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._admission_class = None
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            if request._admission_class is not None:
+                admission.done(
+                    request._admission_class, time.perf_counter() - start
+                )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if admission.is_exempt(request):
+            return
+        request_class = admission.request_class(request, view_func)
+        retry_after = admission.admit(request, request_class)
+        if retry_after is None:
+            request._admission_class = request_class
+            return
+        response = JsonResponse(
+            {'detail': 'The server is busy, try again later.'}, status=503
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+class QueryBudgetMiddleware:
+    """Hold the views to the query budgets they declare.
+
+    What happens with a request over its budget depends on the
+    REQUEST_BUDGET_MODES, see core.budgets.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        modes = settings.REQUEST_BUDGET_MODES
+        if not modes:
+            return self.get_response(request)
+
+        tracker = request._budget_tracker = budgets.BudgetTracker()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            # reset once the transactions of the view are closed, so
+            # no rollback can undo it
+            stack.callback(tracker.reset_timeouts)
+            response = self.get_response(request)
+
+        tracker.check(request, modes)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tracker = getattr(request, '_budget_tracker', None)
+        if tracker is None:
+            return
+        tracker.budget = budgets.budget_for(request, view_func)
+        if tracker.budget and 'timeout' in settings.REQUEST_BUDGET_MODES:
+            tracker.timeout_ms = tracker.budget.timeout_ms
+
+    def process_exception(self, request, exception):
+        if budgets.is_timeout(exception):
+            return JsonResponse(
+                {'detail': 'The request took too long.'}, status=503
+            )
+
+
+class BrowserMiddleware:
+    """Run the BROWSER_MIDDLEWARE for every route but the API_PREFIXES.
+
+    The api views authenticate with tokens, so sessions, csrf, the
+    auth middleware and messages are only overhead for them. The
+    inner middleware are chained the way django chains MIDDLEWARE,
+    and their view, template response and exception hooks are called
+    from the hooks of this one.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(settings.API_PREFIXES)
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = get_response
+        for path in reversed(settings.BROWSER_MIDDLEWARE):
+            try:
+                middleware = import_string(path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_middleware.append(
+                    middleware.process_template_response
+                )
+            if hasattr(middleware, 'process_exception'):
+                self.exception_middleware.append(
+                    middleware.process_exception
+                )
+            handler = convert_exception_to_response(middleware)
+        self.browser_handler = handler
+
+    def is_api(self, request):
+        return request.path_info.startswith(self.prefixes)
+
+    def __call__(self, request):
+        if self.is_api(request):
+            return self.get_response(request)
+        return self.browser_handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_api(request):
+            return None
+        for process_view in self.view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_api(request):
+            return response
+        for process_template_response in self.template_response_middleware:
+            response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_api(request):
+            return None
+        for process_exception in self.exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db import migrations
+
+
+# the tables as they are at this migration, the sql is kept here
+# so later changes of core.partitioning do not change the migration.
+# (table, partition key, indexed columns, foreign keys, unique)
+TABLES = [
+    ('core_recipe', 'user_id', ['user_id'], {'user_id': 'core_user'}, None),
+    (
+        'core_recipe_tags', 'tag_id', ['recipe_id', 'tag_id'],
+        {'tag_id': 'core_tag'}, ('recipe_id', 'tag_id'),
+    ),
+    (
+        'core_recipe_ingredients', 'ingredient_id',
+        ['recipe_id', 'ingredient_id'],
+        {'ingredient_id': 'core_ingredient'},
+        ('recipe_id', 'ingredient_id'),
+    ),
+]
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = 'core_recipe'
+        )
+        """
+    )
+    return cursor.fetchone()[0]
+
+
+def rebuild(cursor, table, key, indexes, foreign_keys, unique, partitions):
+    """Recreate a table, partitioned or not, return the old one."""
+    old = f'{table}_old'
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+
+    partition_by = f' PARTITION BY HASH ("{key}")' if partitions else ''
+    cursor.execute(
+        f'CREATE TABLE "{table}" '
+        f'(LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        f'{partition_by}'
+    )
+    for remainder in range(partitions):
+        cursor.execute(
+            f'CREATE TABLE "{table}_p{remainder}" PARTITION OF "{table}" '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        )
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY "{table}".id')
+
+    primary_key = f'"id", "{key}"' if partitions else '"id"'
+    cursor.execute(f'ALTER TABLE "{table}" ADD PRIMARY KEY ({primary_key})')
+    if unique:
+        columns = ', '.join(f'"{column}"' for column in unique)
+        cursor.execute(f'ALTER TABLE "{table}" ADD UNIQUE ({columns})')
+    for column in indexes:
+        cursor.execute(f'CREATE INDEX ON "{table}" ("{column}")')
+
+    foreign_keys = dict(foreign_keys)
+    # a partitioned core_recipe has no unique id to reference
+    if not partitions and table != 'core_recipe':
+        foreign_keys['recipe_id'] = 'core_recipe'
+    for column, target in foreign_keys.items():
+        cursor.execute(
+            f'ALTER TABLE "{table}" '
+            f'ADD FOREIGN KEY ("{column}") REFERENCES "{target}" ("id") '
+            f'DEFERRABLE INITIALLY DEFERRED'
+        )
+    return old
+
+
+def convert(schema_editor, partitions):
+    with schema_editor.connection.cursor() as cursor:
+        old_tables = [
+            rebuild(cursor, *table, partitions) for table in TABLES
+        ]
+        for old in reversed(old_tables):
+            cursor.execute(f'DROP TABLE "{old}" CASCADE')
+
+
+def partition_recipes(apps, schema_editor):
+    """Partition the recipe tables if it is enabled."""
+    partitions = getattr(settings, 'RECIPE_PARTITIONS', 0)
+    if schema_editor.connection.vendor != 'postgresql' or not partitions:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return
+    convert(schema_editor, partitions)
+
+
+def unpartition_recipes(apps, schema_editor):
+    """Turn the recipe tables back into plain tables."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+    convert(schema_editor, 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_recipes, unpartition_recipes),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+# (table, link table, column of the link table), the sql is kept here
+# so later changes of core.counters do not change the migration
+COUNTED = [
+    ('core_tag', 'core_recipe_tags', 'tag_id'),
+    ('core_ingredient', 'core_recipe_ingredients', 'ingredient_id'),
+]
+
+
+def count_recipes(apps, schema_editor):
+    """Fill the recipe counters of existing tags and ingredients."""
+    with schema_editor.connection.cursor() as cursor:
+        for table, links, column in COUNTED:
+            cursor.execute(
+                f'UPDATE "{table}" SET "recipe_count" = ('
+                f'SELECT COUNT(*) FROM "{links}" '
+                f'WHERE "{links}"."{column}" = "{table}"."id")'
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_partition_recipes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def fill_snapshots(apps, schema_editor):
+    """Build the snapshots of existing recipes."""
+    Recipe = apps.get_model('core', 'Recipe')
+    recipe_ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        recipes = {pk: Recipe(pk=pk) for pk in batch}
+        for field, column in (('tags', 'tag'), ('ingredients', 'ingredient')):
+            snapshots = defaultdict(list)
+            links = getattr(Recipe, field).through.objects.filter(
+                recipe_id__in=batch
+            ).order_by(f'{column}_id').values_list(
+                'recipe_id', f'{column}_id', f'{column}__name'
+            )
+            for recipe_id, item_id, name in links:
+                snapshots[recipe_id].append({'id': item_id, 'name': name})
+            for pk, recipe in recipes.items():
+                setattr(recipe, f'{field}_snapshot', snapshots[pk])
+
+        Recipe.objects.bulk_update(
+            recipes.values(), ['tags_snapshot', 'ingredients_snapshot']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_snapshot',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_snapshot',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(fill_snapshots, migrations.RunPython.noop),
+    ]
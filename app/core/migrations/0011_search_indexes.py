@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+# the indexes as they are at this migration, the sql is kept here
+# so later changes of core.search do not change the migration
+SEARCH_INDEXES = {
+    'core_user': ['email'],
+    'core_recipe': ['title'],
+    'core_tag': ['name'],
+    'core_ingredient': ['name'],
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    """Create the indexes of the admin search on postgres."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS '
+                    f'"{table}_{column}_search_idx" ON "{table}" '
+                    f'(UPPER("{column}"::text) text_pattern_ops)'
+                )
+
+
+def drop_search_indexes(apps, schema_editor):
+    """Drop the indexes of the admin search."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                cursor.execute(
+                    f'DROP INDEX IF EXISTS "{table}_{column}_search_idx"'
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_changelog'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
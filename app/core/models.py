@@ -12,6 +12,8 @@ from django.contrib.auth.models import(
 )
 from django.conf import settings
 
+from core.querycache import CachedQuerySet
+
 
 # a function that determins the path where to store
 # the image files
@@ -76,6 +78,19 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField("Ingredient")
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    # lists opt in to the query cache with cached()
+    objects = CachedQuerySet.as_manager()
+
+    # copies of the (id, name) of the tags and ingredients so
+    # recipes can be listed without joining the link tables.
+    # kept in sync by the handlers in core.signals.
+    tags_snapshot = models.JSONField(default=list, blank=True)
+    ingredients_snapshot = models.JSONField(default=list, blank=True)
+
+    # bumped by every update through the api, which is only applied
+    # to the version the client read, see core.versioning
+    version = models.PositiveIntegerField(default=1)
+
     def __str__(self):
         return self.title
 
@@ -86,6 +101,12 @@ class Tag(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    # number of recipes using it, kept up to date by the recipe
+    # serializers. run reconcile_recipe_counts if it drifts.
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = CachedQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -96,5 +117,66 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    # number of recipes using it, kept up to date by the recipe
+    # serializers. run reconcile_recipe_counts if it drifts.
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = CachedQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+
+class IdempotencyKey(models.Model):
+    """Response of a request made with an Idempotency-Key header."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=255)
+
+    # hash of the request, a key can not be reused for another request
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+
+    # zlib compressed json of the response data
+    response = models.BinaryField(null=True)
+    headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'], name='unique_idempotency_key'
+            ),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class ChangeLog(models.Model):
+    """A change to a recipe, tag or ingredient of a user.
+
+    The id is used as the sync cursor of the changes API.
+    """
+
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE
+    )
+    kind = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=8)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changelog_user_id_idx'),
+        ]
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f'{self.action} {self.kind} {self.object_id}'
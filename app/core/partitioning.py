@@ -0,0 +1,159 @@
+"""
+Postgres hash partitioning of the recipe tables.
+
+Recipe is partitioned on user_id because every recipe query is scoped
+by the user. The tags/ingredients link tables have no user column, so
+they are partitioned on tag_id and ingredient_id. Filtering recipes by
+tags or ingredients then scans the link partitions of those tags and
+ingredients only. Reading the links of one recipe looks them up in
+the recipe_id index of every link partition.
+
+A partitioned core_recipe has no unique id column, only (id, user_id),
+so the link tables have no foreign key to it while partitioned. Django
+deletes the links of the recipes it deletes. Recipes deleted with raw
+sql leave their links behind.
+"""
+from collections import namedtuple
+
+from core import search
+
+
+PartitionedTable = namedtuple(
+    'PartitionedTable',
+    [
+        'name',
+        'key',
+        'indexes',
+        'foreign_keys',
+        'unique',
+    ],
+)
+
+RECIPE_TABLE = 'core_recipe'
+
+TABLES = [
+    PartitionedTable(
+        name=RECIPE_TABLE,
+        key='user_id',
+        indexes=['user_id'],
+        foreign_keys={'user_id': 'core_user'},
+        unique=None,
+    ),
+    PartitionedTable(
+        name='core_recipe_tags',
+        key='tag_id',
+        indexes=['recipe_id', 'tag_id'],
+        foreign_keys={'tag_id': 'core_tag'},
+        unique=('recipe_id', 'tag_id'),
+    ),
+    PartitionedTable(
+        name='core_recipe_ingredients',
+        key='ingredient_id',
+        indexes=['recipe_id', 'ingredient_id'],
+        foreign_keys={'ingredient_id': 'core_ingredient'},
+        unique=('recipe_id', 'ingredient_id'),
+    ),
+]
+
+
+def partition_name(table, remainder):
+    """Return the name of a partition of a table."""
+    return f'{table}_p{remainder}'
+
+
+def is_partitioned(connection, table=RECIPE_TABLE):
+    """Return True if the table is a partitioned table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT EXISTS (
+                SELECT 1 FROM pg_partitioned_table pt
+                JOIN pg_class c ON c.oid = pt.partrelid
+                WHERE c.relname = %s
+            )
+            """,
+            [table],
+        )
+        return cursor.fetchone()[0]
+
+
+def _rebuild(cursor, table, partitions):
+    """Move the table aside and recreate it, partitioned or not.
+
+    Returns the name of the old table, which the caller drops once
+    every table has been rebuilt.
+    """
+    old = f'{table.name}_old'
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table.name])
+    sequence = cursor.fetchone()[0]
+
+    # the id sequence is owned by the old table, without this
+    # it would be dropped together with it
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    cursor.execute(f'ALTER TABLE "{table.name}" RENAME TO "{old}"')
+
+    partition_by = f' PARTITION BY HASH ("{table.key}")' if partitions else ''
+    cursor.execute(
+        f'CREATE TABLE "{table.name}" '
+        f'(LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        f'{partition_by}'
+    )
+    for remainder in range(partitions):
+        cursor.execute(
+            f'CREATE TABLE "{partition_name(table.name, remainder)}" '
+            f'PARTITION OF "{table.name}" '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        )
+
+    cursor.execute(f'INSERT INTO "{table.name}" SELECT * FROM "{old}"')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY "{table.name}".id')
+
+    # unique constraints on a partitioned table must include the key
+    primary_key = f'"id", "{table.key}"' if partitions else '"id"'
+    cursor.execute(
+        f'ALTER TABLE "{table.name}" ADD PRIMARY KEY ({primary_key})'
+    )
+    # constraints and indexes are left unnamed so postgres picks
+    # names that do not clash with the ones of the old table
+    if table.unique:
+        columns = ', '.join(f'"{column}"' for column in table.unique)
+        cursor.execute(
+            f'ALTER TABLE "{table.name}" ADD UNIQUE ({columns})'
+        )
+    for column in table.indexes:
+        cursor.execute(f'CREATE INDEX ON "{table.name}" ("{column}")')
+
+    foreign_keys = dict(table.foreign_keys)
+    # core_recipe.id alone is not unique once it is partitioned,
+    # so the link tables can only reference it when it is not.
+    # django deletes the links itself when a recipe is deleted.
+    if not partitions and table.name != RECIPE_TABLE:
+        foreign_keys['recipe_id'] = RECIPE_TABLE
+    for column, target in foreign_keys.items():
+        cursor.execute(
+            f'ALTER TABLE "{table.name}" '
+            f'ADD FOREIGN KEY ("{column}") REFERENCES "{target}" ("id") '
+            f'DEFERRABLE INITIALLY DEFERRED'
+        )
+
+    return old
+
+
+def partition_tables(connection, partitions):
+    """Convert the recipe tables to hash partitioned tables.
+
+    Passing 0 partitions converts them back to plain tables.
+    Run it inside a transaction, the tables are locked while
+    the rows are copied.
+    """
+    with connection.cursor() as cursor:
+        old_tables = [
+            _rebuild(cursor, table, partitions) for table in TABLES
+        ]
+        for old in reversed(old_tables):
+            cursor.execute(f'DROP TABLE "{old}" CASCADE')
+
+    # the search index left with the old recipe table
+    search.create_search_indexes(
+        connection, {RECIPE_TABLE: search.SEARCH_INDEXES[RECIPE_TABLE]}
+    )
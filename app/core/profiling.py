@@ -0,0 +1,197 @@
+"""
+Statistical sampling profiler for live workers.
+
+A Sampler thread looks at the stacks of the other threads of the
+worker every few milliseconds and counts them, which costs the
+sampled threads next to nothing. Stacks are stored in the collapsed
+format of flamegraph.pl and speedscope, with the frames of our apps
+as file:function and runs of library frames folded into [package].
+Samples without any frame of our apps are dropped.
+
+Staff start a profile of a worker for some seconds through the debug
+api, or profile a single request with a signed X-Profile header.
+"""
+import os
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+from core.timing import APP_DIRS
+
+
+HEADER = 'X-Profile'
+ID_HEADER = 'X-Profile-Id'
+SIGNING_SALT = 'core.profiling'
+PROFILE_ID = re.compile(r'^[\w-]+$')
+
+_lock = threading.Lock()
+_running = None
+
+
+class ProfilerBusy(Exception):
+    """A profile of this worker is already running."""
+
+
+def _package(filename):
+    """Return the package a library file belongs to."""
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        top = filename.split(marker, 1)[1].split(os.sep, 1)[0]
+        return top.partition('.')[0]
+    return 'python'
+
+
+def collapse(frame):
+    """Return the collapsed stack of a frame, None without app frames."""
+    base = str(settings.BASE_DIR) + os.sep
+    names = []
+    in_app = False
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIRS):
+            names.append(f'{filename[len(base):]}:{frame.f_code.co_name}')
+            in_app = True
+        else:
+            name = f'[{_package(filename)}]'
+            if not names or names[-1] != name:
+                names.append(name)
+        frame = frame.f_back
+
+    if not in_app:
+        return None
+    return ';'.join(reversed(names))
+
+
+def profile_dir():
+    """Return the directory the profiles are stored in."""
+    return settings.PROFILE_DIR or os.path.join(
+        tempfile.gettempdir(), 'recipe-profiles'
+    )
+
+
+def profile_path(profile_id):
+    """Return the file of a profile, None for an invalid id."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(profile_dir(), f'{profile_id}.collapsed')
+
+
+def new_id():
+    """Return a new profile id, unique across the workers."""
+    return (
+        f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-'
+        f'{secrets.token_hex(3)}'
+    )
+
+
+def save(profile_id, stacks):
+    """Write collapsed stacks, the most sampled first."""
+    os.makedirs(profile_dir(), exist_ok=True)
+    path = profile_path(profile_id)
+    with open(f'{path}.tmp', 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    os.replace(f'{path}.tmp', path)
+
+
+def list_profiles():
+    """Return the stored profiles, the newest first."""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.endswith('.collapsed'):
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        profiles.append({
+            'id': name[:-len('.collapsed')],
+            'size': stat.st_size,
+            'created': stat.st_mtime,
+        })
+    return sorted(profiles, key=lambda p: p['created'], reverse=True)
+
+
+class Sampler(threading.Thread):
+    """Thread sampling the stacks of the other threads.
+
+    Runs for duration seconds, or until stop() without one, and then
+    stores the profile. thread_ids limits it to some threads.
+    """
+
+    def __init__(self, profile_id, interval, duration=None, thread_ids=None):
+        super().__init__(name='profiler', daemon=True)
+        self.profile_id = profile_id
+        self.interval = interval
+        self.duration = duration
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        deadline = None
+        if self.duration is not None:
+            deadline = time.monotonic() + self.duration
+        while not self._done.wait(self.interval):
+            self.sample()
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        save(self.profile_id, self.stacks)
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if self.thread_ids and thread_id not in self.thread_ids:
+                continue
+            stack = collapse(frame)
+            if stack:
+                self.stacks[stack] += 1
+        self.samples += 1
+
+    def stop(self):
+        """Stop sampling and wait until the profile is stored."""
+        self._done.set()
+        self.join()
+
+
+def start(seconds, interval):
+    """Profile this worker for some seconds in the background.
+
+    Returns the id of the profile, which is stored once it is done.
+    """
+    global _running
+    with _lock:
+        if _running is not None and _running.is_alive():
+            raise ProfilerBusy()
+        _running = Sampler(new_id(), interval, duration=seconds)
+        _running.start()
+        return _running.profile_id
+
+
+def sign():
+    """Return a signed value for the X-Profile header."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(
+        secrets.token_hex(8)
+    )
+
+
+def is_valid(value):
+    """Return True if a X-Profile header value is signed and recent."""
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            value, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
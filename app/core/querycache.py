@@ -0,0 +1,237 @@
+"""
+Cache of query results, invalidated per table.
+
+Querysets of CachedQuerySet opt in with cached(). Their results are
+cached under the compiled SQL and params together with the current
+generation of every table the SQL reads from. A write to a table,
+seen by an execute wrapper on every connection, bumps its generation
+once it is committed, so every cached result reading from it is
+missed from then on and expires on its own. This covers the ORM, bulk
+updates, m2m link tables like recipe.tags.add and raw SQL alike.
+
+Generations are read from the shared tier of the cache, so a write
+is seen by every worker right away. While the worker listens to the
+invalidation bus they are kept in its memory instead, and a bump
+evicts them everywhere, see core.invalidation. Results are immutable
+under their key and can stay in the local tier.
+
+Within a transaction that wrote to a table, queries reading from it
+skip the cache, they have to see the uncommitted rows and must not
+cache them for others.
+"""
+import hashlib
+import re
+import time
+
+from asgiref.local import Local
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
+from django.db.models.query import (
+    FlatValuesListIterable,
+    ModelIterable,
+    ValuesIterable,
+    ValuesListIterable,
+)
+
+from core import invalidation
+
+
+GENERATION_KEY = 'querycache:table:{}'
+
+WRITE = re.compile(r'\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"(\w+)"')
+TRUNCATE = re.compile(r'\s*TRUNCATE\s')
+QUOTED = re.compile(r'"(\w+)"')
+READ_TABLES = re.compile(r'(?:FROM|JOIN)\s+"(\w+)"')
+
+# results of other iterables, like named tuples, can not be pickled
+CACHEABLE_ITERABLES = (
+    ModelIterable,
+    ValuesIterable,
+    ValuesListIterable,
+    FlatValuesListIterable,
+)
+
+# alias -> tables written in the open transaction of that connection
+_state = Local()
+
+# table -> generation, while listening to the invalidation bus
+_generations = invalidation.LocalCache()
+
+
+def _on_table_changed(table):
+    if table:
+        _generations.evict(table)
+    else:
+        _generations.clear()
+
+
+invalidation.subscribe('table', _on_table_changed)
+
+
+def _dirty():
+    if not hasattr(_state, 'dirty'):
+        _state.dirty = {}
+    return _state.dirty
+
+
+def reset():
+    """Forget the tables written by the transactions of this thread."""
+    _dirty().clear()
+
+
+def _generation_cache():
+    """Return the cache tier shared by all the workers."""
+    return getattr(cache, 'shared', cache)
+
+
+def bump(tables):
+    """Give tables a new generation, missing their cached results."""
+    backend = _generation_cache()
+    for table in tables:
+        key = GENERATION_KEY.format(table)
+        try:
+            backend.incr(key)
+        except ValueError:
+            # nothing cached for it, or the generation was evicted
+            backend.add(key, time.time_ns(), None)
+        invalidation.publish('table', table)
+
+
+def _shared_generations(tables):
+    backend = _generation_cache()
+    keys = {table: GENERATION_KEY.format(table) for table in tables}
+    found = backend.get_many(keys.values())
+    for key in keys.values():
+        if key not in found:
+            # a new start, above any generation it had before
+            backend.add(key, time.time_ns(), None)
+            found[key] = backend.get(key)
+    return {table: found[key] for table, key in keys.items()}
+
+
+def generations(tables):
+    """Return the current generation of each table."""
+    since = invalidation.epoch()
+    known = {table: _generations.get(table) for table in tables}
+    missing = [table for table, value in known.items() if value is None]
+    if missing:
+        for table, value in _shared_generations(missing).items():
+            known[table] = value
+            _generations.set(table, value, since)
+    return [known[table] for table in tables]
+
+
+def written_tables(sql):
+    """Return the tables a statement writes to."""
+    match = WRITE.match(sql)
+    if match:
+        return [match.group(1)]
+    if TRUNCATE.match(sql):
+        return QUOTED.findall(sql)
+    return []
+
+
+def _written(connection, tables):
+    if not connection.in_atomic_block:
+        bump(tables)
+        return
+
+    dirty = _dirty().setdefault(connection.alias, set())
+    new = set(tables) - dirty
+    if new:
+        dirty.update(new)
+        transaction.on_commit(
+            lambda: _committed(connection.alias, new), using=connection.alias
+        )
+
+
+def _committed(alias, tables):
+    _dirty().get(alias, set()).difference_update(tables)
+    bump(tables)
+
+
+def track_writes(execute, sql, params, many, context):
+    """Execute wrapper bumping the tables a statement wrote to."""
+    result = execute(sql, params, many, context)
+    tables = written_tables(sql)
+    if tables:
+        _written(context['connection'], tables)
+    return result
+
+
+def install(connection):
+    """Track the writes made through a connection."""
+    # first in the list, so the wrappers that are popped again
+    # by connection.execute_wrapper() stay last
+    if track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, track_writes)
+
+
+def _is_dirty(tables):
+    """Return True if the open transaction wrote to any of the tables."""
+    for alias, dirty in _dirty().items():
+        if not dirty:
+            continue
+        if not connections[alias].in_atomic_block:
+            # rolled back, the commit would have cleaned it up
+            dirty.clear()
+        elif dirty.intersection(tables):
+            return True
+    return False
+
+
+def fetch(queryset, timeout):
+    """Return the cached results of a queryset, None to run it."""
+    if not issubclass(queryset._iterable_class, CACHEABLE_ITERABLES):
+        return None
+    if queryset.query.select_for_update:
+        return None
+    try:
+        sql, params = queryset.query.get_compiler(
+            using=queryset.db
+        ).as_sql()
+    except EmptyResultSet:
+        return None
+
+    tables = sorted(set(READ_TABLES.findall(sql)))
+    if not tables or _is_dirty(tables):
+        return None
+
+    fingerprint = repr((
+        queryset.db,
+        queryset._iterable_class.__name__,
+        sql,
+        params,
+        generations(tables),
+    ))
+    key = 'querycache:' + hashlib.sha256(fingerprint.encode()).hexdigest()
+    return cache.get_or_set(
+        key, lambda: list(queryset._iterable_class(queryset)), timeout
+    )
+
+
+class CachedQuerySet(models.QuerySet):
+    """QuerySet whose results can be read from the query cache."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_timeout = None
+
+    def cached(self, timeout=None):
+        """Return a copy whose results are cached for some seconds."""
+        clone = self._chain()
+        clone._cache_timeout = timeout or settings.QUERY_CACHE_TIMEOUT
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_timeout = self._cache_timeout
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_timeout:
+            self._result_cache = fetch(self, self._cache_timeout)
+        super()._fetch_all()
@@ -0,0 +1,119 @@
+"""
+Database router that sends safe reads to read replicas.
+"""
+import random
+import time
+
+from asgiref.local import Local
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+
+
+# per request routing state, set by ReplicaRoutingMiddleware.
+# asgiref's Local works for both threads and async tasks.
+_state = Local()
+
+# alias -> (checked_at, lag in seconds or None if unreachable)
+_lag_cache = {}
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+def get_replicas():
+    """Return the configured replica aliases."""
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def begin_request(allow_replica):
+    """Start routing for a request."""
+    _state.allow_replica = allow_replica
+    _state.replica = None
+    _state.wrote = False
+
+
+def end_request():
+    """Reset routing state once a request is finished."""
+    _state.allow_replica = False
+    _state.replica = None
+    _state.wrote = False
+
+
+def request_wrote():
+    """Return True if the current request sent anything to the primary."""
+    return getattr(_state, 'wrote', False)
+
+
+def _replica_lag(alias):
+    """Query the replication lag of a replica in seconds."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REPLICA_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def replica_lag(alias):
+    """Return the cached replication lag of a replica, None if it is down."""
+    interval = getattr(settings, 'DATABASE_REPLICA_LAG_CHECK_INTERVAL', 5)
+    now = time.monotonic()
+    cached = _lag_cache.get(alias)
+    if cached is not None and now - cached[0] < interval:
+        return cached[1]
+
+    try:
+        lag = _replica_lag(alias)
+    except DatabaseError:
+        lag = None
+    _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    """Return the replicas that are reachable and not lagging behind."""
+    max_lag = getattr(settings, 'DATABASE_REPLICA_MAX_LAG', 2)
+    healthy = []
+    for alias in get_replicas():
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            healthy.append(alias)
+    return healthy
+
+
+class ReplicaRouter:
+    """Route reads to a replica when the current request allows it."""
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_state, 'allow_replica', False):
+            return None
+
+        # we pick a replica once per request so all the reads
+        # of one response see the same snapshot of the data
+        if _state.replica is None:
+            replicas = healthy_replicas()
+            _state.replica = (
+                random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+            )
+        return _state.replica
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
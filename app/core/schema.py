@@ -0,0 +1,136 @@
+"""
+OpenAPI schema generated once and served from memory.
+
+Generating the schema introspects every view and serializer, so it is
+done once per deploy by the generate_schema command, or once per
+process on first use when OPENAPI_SCHEMA_DIR is not set. Both formats
+are kept gzipped and served with an ETag.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from drf_spectacular.renderers import (
+    OpenApiJsonRenderer,
+    OpenApiYamlRenderer,
+)
+from drf_spectacular.settings import spectacular_settings
+
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+Document = namedtuple('Document', ['content', 'compressed', 'etag'])
+
+# format -> Document of this process
+_documents = {}
+_lock = threading.Lock()
+
+
+def render():
+    """Generate the schema and return {format: rendered bytes}."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(
+        urlconf=spectacular_settings.SERVE_URLCONF
+    )
+    data = generator.get_schema(
+        request=None, public=spectacular_settings.SERVE_PUBLIC
+    )
+    return {
+        name: renderer().render(data, renderer_context={})
+        for name, renderer in RENDERERS.items()
+    }
+
+
+def file_path(directory, name):
+    """Return the path of the stored schema of a format."""
+    return os.path.join(directory, f'schema.{name}.gz')
+
+
+def _compress(content):
+    # a fixed mtime keeps the file, and so the etag, the same
+    # for the same schema
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def write(directory):
+    """Generate the schema and store it compressed, return the paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, content in render().items():
+        path = file_path(directory, name)
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(_compress(content))
+        os.replace(f'{path}.tmp', path)
+        paths.append(path)
+
+    reset()
+    return paths
+
+
+def _document(compressed):
+    etag = hashlib.sha256(compressed).hexdigest()[:32]
+    return Document(gzip.decompress(compressed), compressed, f'"{etag}"')
+
+
+def _load():
+    """Return {format: Document} from the stored files or generated."""
+    directory = settings.OPENAPI_SCHEMA_DIR
+    if directory:
+        try:
+            documents = {}
+            for name in RENDERERS:
+                with open(file_path(directory, name), 'rb') as f:
+                    documents[name] = _document(f.read())
+            return documents
+        except FileNotFoundError:
+            pass
+
+    return {
+        name: _document(_compress(content))
+        for name, content in render().items()
+    }
+
+
+def get(name):
+    """Return the Document of a format."""
+    document = _documents.get(name)
+    if document is None:
+        with _lock:
+            if not _documents:
+                _documents.update(_load())
+        document = _documents[name]
+    return document
+
+
+def reset():
+    """Forget the documents loaded by this process."""
+    _documents.clear()
+
+
+def response(request, name, media_type):
+    """Return the response serving the schema in a format."""
+    document = get(name)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and document.etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(document.compressed, content_type=media_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(document.content, content_type=media_type)
+
+    response['ETag'] = document.etag
+    patch_cache_control(
+        response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE
+    )
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+    return response
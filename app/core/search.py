@@ -0,0 +1,42 @@
+"""
+Indexes serving the prefix search of the admin.
+
+The admin searches with istartswith, which postgres runs as
+UPPER(column::text) LIKE 'TERM%'. An expression index with
+text_pattern_ops serves that whatever the collation of the database.
+"""
+
+
+SEARCH_INDEXES = {
+    'core_user': ['email'],
+    'core_recipe': ['title'],
+    'core_tag': ['name'],
+    'core_ingredient': ['name'],
+}
+
+
+def index_name(table, column):
+    """Return the name of the search index of a column."""
+    return f'{table}_{column}_search_idx'
+
+
+def create_search_indexes(connection, tables=SEARCH_INDEXES):
+    """Create the missing search indexes."""
+    with connection.cursor() as cursor:
+        for table, columns in tables.items():
+            for column in columns:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS '
+                    f'"{index_name(table, column)}" ON "{table}" '
+                    f'(UPPER("{column}"::text) text_pattern_ops)'
+                )
+
+
+def drop_search_indexes(connection, tables=SEARCH_INDEXES):
+    """Drop the search indexes."""
+    with connection.cursor() as cursor:
+        for table, columns in tables.items():
+            for column in columns:
+                cursor.execute(
+                    f'DROP INDEX IF EXISTS "{index_name(table, column)}"'
+                )
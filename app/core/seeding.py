@@ -0,0 +1,266 @@
+"""
+Fast generation of synthetic users, tags, ingredients and recipes.
+
+Rows are written with COPY on postgres (executemany elsewhere) instead
+of the orm, every user shares one pre-hashed password, and the recipe
+counters and snapshots are computed while generating so no signal or
+serializer code has to run.
+"""
+import io
+import json
+import random
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+
+
+TAG_WORDS = [
+    'dinner', 'lunch', 'breakfast', 'vegan', 'vegetarian', 'quick',
+    'dessert', 'healthy', 'spicy', 'italian', 'indian', 'persian',
+    'mexican', 'baking', 'soup', 'salad', 'snack', 'party', 'budget',
+    'comfort', 'grill', 'gluten free', 'low carb', 'seafood', 'kids',
+]
+INGREDIENT_WORDS = [
+    'salt', 'pepper', 'olive oil', 'garlic', 'onion', 'butter', 'flour',
+    'sugar', 'egg', 'milk', 'tomato', 'lemon', 'rice', 'chicken', 'beef',
+    'cheese', 'basil', 'cumin', 'saffron', 'potato', 'carrot', 'yogurt',
+    'chili', 'ginger', 'honey', 'parsley', 'mint', 'lentils', 'tofu',
+]
+DISHES = [
+    'stew', 'pasta', 'curry', 'pie', 'salad', 'soup', 'bowl', 'cake',
+    'tacos', 'risotto', 'kebab', 'omelette', 'pilaf', 'sandwich',
+]
+ADJECTIVES = [
+    'easy', 'classic', 'crispy', 'creamy', 'smoky', 'fresh', 'hearty',
+    'zesty', 'golden', 'rustic', 'sweet', 'tangy', 'roasted',
+]
+
+CHUNK_ROWS = 50000
+
+
+def zipf_cum_weights(count, exponent):
+    """Return cumulative Zipf weights of count ranks."""
+    return list(
+        accumulate(1 / (rank + 1) ** exponent for rank in range(count))
+    )
+
+
+def vocabulary(words, count):
+    """Return count distinct names built from words."""
+    names = list(words[:count])
+    index = 2
+    while len(names) < count:
+        names.extend(f'{word} {index}' for word in words)
+        index += 1
+    return names[:count]
+
+
+def _copy_value(value):
+    """Return a value in the postgres COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class TableWriter:
+    """Buffers rows of a table and writes them in chunks."""
+
+    def __init__(self, connection, table, columns):
+        self.connection = connection
+        self.table = table
+        self.columns = columns
+        self.rows = []
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        columns = ', '.join(f'"{column}"' for column in self.columns)
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == 'postgresql':
+                data = io.StringIO()
+                for row in self.rows:
+                    data.write('\t'.join(_copy_value(v) for v in row))
+                    data.write('\n')
+                data.seek(0)
+                cursor.copy_expert(
+                    f'COPY "{self.table}" ({columns}) FROM STDIN', data
+                )
+            else:
+                placeholders = ', '.join(['%s'] * len(self.columns))
+                cursor.executemany(
+                    f'INSERT INTO "{self.table}" ({columns}) '
+                    f'VALUES ({placeholders})',
+                    self.rows,
+                )
+        self.written += len(self.rows)
+        self.rows = []
+
+
+def reserve_ids(connection, table, count):
+    """Reserve count ids of a table, return the first one."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT pg_get_serial_sequence(%s, 'id')", [table]
+            )
+            sequence = cursor.fetchone()[0]
+            # moves the sequence past the whole block in one statement
+            cursor.execute(
+                'SELECT setval(%s, nextval(%s) + %s - 1)',
+                [sequence, sequence, count],
+            )
+            return cursor.fetchone()[0] - count + 1
+
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{table}"')
+        return cursor.fetchone()[0] + 1
+
+
+def generate(
+    connection,
+    users,
+    recipes,
+    tags_per_user=15,
+    ingredients_per_user=40,
+    password='changeme123',
+    seed=0,
+    exponent=1.1,
+):
+    """Generate the data and return the number of rows per table."""
+    rng = random.Random(seed)
+
+    # a few power users own most of the recipes
+    user_weights = zipf_cum_weights(users, exponent)
+    recipes_per_user = [0] * users
+    owners = rng.choices(range(users), cum_weights=user_weights, k=recipes)
+    for index in owners:
+        recipes_per_user[index] += 1
+
+    user_id = reserve_ids(connection, 'core_user', users)
+    tag_id = reserve_ids(connection, 'core_tag', users * tags_per_user)
+    ingredient_id = reserve_ids(
+        connection, 'core_ingredient', users * ingredients_per_user
+    )
+    recipe_id = reserve_ids(connection, 'core_recipe', recipes)
+
+    writers = {
+        'users': TableWriter(connection, 'core_user', [
+            'id', 'password', 'last_login', 'is_superuser', 'email',
+            'name', 'is_active', 'is_staff',
+        ]),
+        'tags': TableWriter(
+            connection, 'core_tag', ['id', 'name', 'user_id', 'recipe_count']
+        ),
+        'ingredients': TableWriter(
+            connection,
+            'core_ingredient',
+            ['id', 'name', 'user_id', 'recipe_count'],
+        ),
+        'recipes': TableWriter(connection, 'core_recipe', [
+            'id', 'user_id', 'title', 'description', 'time_minutes',
+            'price', 'link', 'image', 'tags_snapshot', 'ingredients_snapshot',
+            'version',
+        ]),
+        'recipe_tags': TableWriter(
+            connection, 'core_recipe_tags', ['recipe_id', 'tag_id']
+        ),
+        'recipe_ingredients': TableWriter(
+            connection,
+            'core_recipe_ingredients',
+            ['recipe_id', 'ingredient_id'],
+        ),
+    }
+
+    # hashing is slow on purpose, so every user gets the same hash
+    password_hash = make_password(password)
+    tag_names = vocabulary(TAG_WORDS, tags_per_user)
+    ingredient_names = vocabulary(INGREDIENT_WORDS, ingredients_per_user)
+    # popular tags and ingredients are picked far more often
+    tag_weights = zipf_cum_weights(tags_per_user, exponent)
+    ingredient_weights = zipf_cum_weights(ingredients_per_user, exponent)
+
+    for index in range(users):
+        writers['users'].add([
+            user_id, password_hash, None, False,
+            f'seed{seed}-user{index}@example.com', f'User {index}',
+            True, False,
+        ])
+        tag_ids = range(tag_id, tag_id + tags_per_user)
+        ingredient_ids = range(
+            ingredient_id, ingredient_id + ingredients_per_user
+        )
+        tag_counts = [0] * tags_per_user
+        ingredient_counts = [0] * ingredients_per_user
+
+        for _ in range(recipes_per_user[index]):
+            picked_tags = sorted(set(rng.choices(
+                range(tags_per_user), cum_weights=tag_weights,
+                k=rng.randint(0, 4),
+            )))
+            picked_ingredients = sorted(set(rng.choices(
+                range(ingredients_per_user), cum_weights=ingredient_weights,
+                k=rng.randint(2, 10),
+            )))
+            for tag in picked_tags:
+                tag_counts[tag] += 1
+                writers['recipe_tags'].add([recipe_id, tag_ids[tag]])
+            for ingredient in picked_ingredients:
+                ingredient_counts[ingredient] += 1
+                writers['recipe_ingredients'].add(
+                    [recipe_id, ingredient_ids[ingredient]]
+                )
+
+            writers['recipes'].add([
+                recipe_id, user_id,
+                f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}',
+                '', rng.randint(5, 180), f'{rng.uniform(1, 99):.2f}', '',
+                None,
+                json.dumps([
+                    {'id': tag_ids[t], 'name': tag_names[t]}
+                    for t in picked_tags
+                ]),
+                json.dumps([
+                    {'id': ingredient_ids[i], 'name': ingredient_names[i]}
+                    for i in picked_ingredients
+                ]),
+                1,
+            ])
+            recipe_id += 1
+
+        for position, name in enumerate(tag_names):
+            writers['tags'].add(
+                [tag_ids[position], name, user_id, tag_counts[position]]
+            )
+        for position, name in enumerate(ingredient_names):
+            writers['ingredients'].add([
+                ingredient_ids[position], name, user_id,
+                ingredient_counts[position],
+            ])
+
+        user_id += 1
+        tag_id += tags_per_user
+        ingredient_id += ingredients_per_user
+
+    # foreign keys are only checked when the transaction commits,
+    # so it does not matter which table got flushed first
+    order = [
+        'users', 'tags', 'ingredients', 'recipes',
+        'recipe_tags', 'recipe_ingredients',
+    ]
+    for name in order:
+        writers[name].flush()
+    return {name: writers[name].written for name in order}
@@ -0,0 +1,223 @@
+"""
+Signal handlers for the core models.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+
+from rest_framework.authtoken.models import Token
+
+from core.models import ChangeLog, Ingredient, Recipe, Tag
+from core import changes, counters, invalidation, querycache, snapshots
+
+
+def _on_links_changed(field):
+    """Return a handler keeping the snapshot of a m2m field in sync."""
+
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        if not reverse:
+            if action in ('post_add', 'post_remove', 'post_clear'):
+                snapshots.refresh_recipe_snapshot(instance, field)
+                changes.log_change(instance, ChangeLog.UPDATED)
+            return
+
+        # changed from the tag or ingredient side, a clear does
+        # not tell which recipes it touched so we look before
+        if action == 'pre_clear':
+            instance._cleared_recipe_ids = list(
+                instance.recipe_set.values_list('id', flat=True)
+            )
+            return
+        if action == 'post_clear':
+            recipe_ids = instance.__dict__.pop('_cleared_recipe_ids', [])
+        elif action in ('post_add', 'post_remove'):
+            recipe_ids = list(pk_set)
+        else:
+            return
+
+        snapshots.refresh_recipe_snapshots(recipe_ids, [field])
+        changes.log_changes(
+            instance.user_id, Recipe, recipe_ids, ChangeLog.UPDATED
+        )
+
+    return handler
+
+
+for _field in snapshots.SNAPSHOT_FIELDS:
+    m2m_changed.connect(
+        _on_links_changed(_field),
+        sender=getattr(Recipe, _field).through,
+        weak=False,
+        dispatch_uid=f'recipe-{_field}-snapshot',
+    )
+
+
+def _linked(field, instance, reverse, pk_set=None):
+    """Return {id: recipes} of the tags or ingredients of some links.
+
+    The links of a recipe, or of a tag or ingredient when reverse,
+    limited to the other side being in pk_set if given.
+    """
+    through = getattr(Recipe, field).through
+    column = counters.COUNTED_FIELDS[field]
+    if reverse:
+        links = through.objects.filter(**{column: instance.pk})
+        if pk_set is not None:
+            links = links.filter(recipe_id__in=pk_set)
+        return {instance.pk: links.count()}
+
+    links = through.objects.filter(recipe_id=instance.pk)
+    if pk_set is not None:
+        links = links.filter(**{f'{column}__in': pk_set})
+    return {item_id: 1 for item_id in links.values_list(column, flat=True)}
+
+
+def _uncount(model, linked):
+    # one update per number of recipes lost, usually just one
+    by_recipes = defaultdict(list)
+    for item_id, recipes in linked.items():
+        by_recipes[recipes].append(item_id)
+    for recipes, ids in by_recipes.items():
+        counters.adjust_recipe_counts(model, ids, -recipes)
+
+
+def _on_links_counted(field):
+    """Return a handler keeping the recipe counts of a m2m field."""
+    model = Recipe._meta.get_field(field).related_model
+
+    def handler(sender, instance, action, reverse, pk_set, **kwargs):
+        uncounted = f'_uncounted_{field}'
+        if action in ('pre_remove', 'pre_clear'):
+            # only the links that exist are removed, so we look before
+            instance.__dict__[uncounted] = _linked(
+                field, instance, reverse, pk_set
+            )
+        elif action in ('post_remove', 'post_clear'):
+            _uncount(model, instance.__dict__.pop(uncounted, {}))
+        elif action == 'post_add' and reverse:
+            counters.adjust_recipe_counts(
+                model, [instance.pk], len(pk_set)
+            )
+        elif action == 'post_add':
+            counters.adjust_recipe_counts(model, pk_set, 1)
+
+    return handler
+
+
+def _on_recipe_deleting(sender, instance, **kwargs):
+    # the links of a deleted recipe go without m2m_changed
+    for field in counters.COUNTED_FIELDS:
+        model = Recipe._meta.get_field(field).related_model
+        _uncount(model, _linked(field, instance, reverse=False))
+
+
+for _field in counters.COUNTED_FIELDS:
+    m2m_changed.connect(
+        _on_links_counted(_field),
+        sender=getattr(Recipe, _field).through,
+        weak=False,
+        dispatch_uid=f'recipe-{_field}-counts',
+    )
+
+pre_delete.connect(
+    _on_recipe_deleting, sender=Recipe, dispatch_uid='recipe-counts'
+)
+
+
+def _on_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    action = ChangeLog.CREATED if created else ChangeLog.UPDATED
+    changes.log_change(instance, action)
+
+
+def _on_deleted(sender, instance, **kwargs):
+    changes.log_change(instance, ChangeLog.DELETED)
+
+
+for _model in changes.KINDS:
+    post_save.connect(
+        _on_saved, sender=_model, dispatch_uid=f'{_model.__name__}-saved'
+    )
+    post_delete.connect(
+        _on_deleted, sender=_model, dispatch_uid=f'{_model.__name__}-deleted'
+    )
+
+
+def _on_user_deleting(sender, instance, **kwargs):
+    changes.user_deleting(instance.pk)
+
+
+def _on_user_deleted(sender, instance, **kwargs):
+    changes.user_deleted(instance.pk)
+
+
+pre_delete.connect(
+    _on_user_deleting, sender=get_user_model(), dispatch_uid='user-deleting'
+)
+post_delete.connect(
+    _on_user_deleted, sender=get_user_model(), dispatch_uid='user-deleted'
+)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    querycache.install(connection)
+
+
+connection_created.connect(
+    _on_connection_created, dispatch_uid='query-cache-writes'
+)
+
+
+# topics of the invalidation bus, see core.invalidation
+TOPICS = {
+    get_user_model(): 'user',
+    Recipe: 'recipe',
+    Tag: 'tag',
+    Ingredient: 'ingredient',
+    Token: 'token',
+}
+
+
+def _publish(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # the key of a token is a secret, the messages name its user
+    key = instance.user_id if sender is Token else instance.pk
+    invalidation.publish(TOPICS[sender], key)
+
+
+def _publish_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidation.publish('recipe', instance.pk)
+    elif pk_set:
+        for recipe_id in pk_set:
+            invalidation.publish('recipe', recipe_id)
+    else:
+        # a clear from the tag or ingredient side
+        invalidation.publish('recipe')
+
+
+for _model, _topic in TOPICS.items():
+    post_save.connect(
+        _publish, sender=_model, dispatch_uid=f'{_topic}-saved-publish'
+    )
+    post_delete.connect(
+        _publish, sender=_model, dispatch_uid=f'{_topic}-deleted-publish'
+    )
+
+for _field in snapshots.SNAPSHOT_FIELDS:
+    m2m_changed.connect(
+        _publish_links,
+        sender=getattr(Recipe, _field).through,
+        dispatch_uid=f'recipe-{_field}-publish',
+    )
@@ -0,0 +1,58 @@
+"""
+Denormalized (id, name) snapshots of the tags and ingredients of recipes.
+
+They let a page of recipes be listed from the recipe table alone.
+"""
+from collections import defaultdict
+
+from core.models import Recipe
+
+
+# recipe field -> (snapshot field, column of the link table)
+SNAPSHOT_FIELDS = {
+    'tags': ('tags_snapshot', 'tag'),
+    'ingredients': ('ingredients_snapshot', 'ingredient'),
+}
+
+
+def build_snapshots(field, recipe_ids):
+    """Return {recipe id: snapshot} of a m2m field for the recipes."""
+    column = SNAPSHOT_FIELDS[field][1]
+    through = getattr(Recipe, field).through
+    links = through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by(f'{column}_id').values_list(
+        'recipe_id', f'{column}_id', f'{column}__name'
+    )
+
+    snapshots = defaultdict(list)
+    for recipe_id, item_id, name in links:
+        snapshots[recipe_id].append({'id': item_id, 'name': name})
+    return snapshots
+
+
+def refresh_recipe_snapshot(recipe, field):
+    """Rebuild one snapshot of a recipe, in memory and in the database."""
+    snapshot_field = SNAPSHOT_FIELDS[field][0]
+    snapshot = build_snapshots(field, [recipe.pk])[recipe.pk]
+    setattr(recipe, snapshot_field, snapshot)
+    Recipe.objects.filter(pk=recipe.pk).update(**{snapshot_field: snapshot})
+
+
+def refresh_recipe_snapshots(recipe_ids, fields=('tags', 'ingredients')):
+    """Rebuild the snapshots of many recipes."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+
+    recipes = {pk: Recipe(pk=pk) for pk in recipe_ids}
+    for field in fields:
+        snapshot_field = SNAPSHOT_FIELDS[field][0]
+        snapshots = build_snapshots(field, recipe_ids)
+        for pk, recipe in recipes.items():
+            setattr(recipe, snapshot_field, snapshots[pk])
+
+    Recipe.objects.bulk_update(
+        recipes.values(),
+        [SNAPSHOT_FIELDS[field][0] for field in fields],
+    )
@@ -0,0 +1,187 @@
+"""
+Stale-while-revalidate serving of the list endpoints.
+
+Every successful list response is kept in the cache per view, user
+and query string, for LIST_STALE_MAX_AGE seconds. It is rewritten at
+most every LIST_STALE_KEEP_INTERVAL seconds, the hot path of a list
+does not write the whole list to the cache on every request. When listing fails
+on the database, because it timed out or postgres is failing over,
+the kept response is served instead, with Age and Warning headers,
+and one background refresh per list runs in the cluster.
+
+A failure also puts the worker under pressure for
+LIST_STALE_PRESSURE_SECONDS. Meanwhile lists with a kept response are
+served from it right away, so their latency stays flat instead of
+piling up workers behind a struggling database. A refresh that
+succeeds ends the pressure.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from rest_framework.response import Response
+
+from core import budgets
+
+
+logger = logging.getLogger(__name__)
+
+# monotonic time until which this worker is under pressure
+_pressure = {'until': 0}
+
+
+def under_pressure():
+    """Return True while this worker avoids the database for lists."""
+    return time.monotonic() < _pressure['until']
+
+
+def pressure():
+    """Note a database failure of this worker."""
+    _pressure['until'] = (
+        time.monotonic() + settings.LIST_STALE_PRESSURE_SECONDS
+    )
+
+
+def relieve():
+    """Note the database answers this worker again."""
+    _pressure['until'] = 0
+
+
+def key(request, view):
+    """Return the cache key of the lists of a user and query."""
+    path = hashlib.sha256(request.get_full_path().encode()).hexdigest()
+    return f'stale:{type(view).__name__}:{request.user.pk}:{path}'
+
+
+def keep(key, data):
+    """Keep the data of a good response."""
+    cache.set(key, (time.time(), data), settings.LIST_STALE_MAX_AGE)
+    cache.set(f'{key}:kept', True, settings.LIST_STALE_KEEP_INTERVAL)
+
+
+def kept_recently(key):
+    """Return True if the data was kept less than an interval ago.
+
+    Only a small marker is read, not the kept data itself.
+    """
+    return cache.get(f'{key}:kept') is not None
+
+
+def get(key):
+    """Return (age in seconds, data) of a kept response, or None."""
+    kept = cache.get(key)
+    if kept is None:
+        return None
+    age = time.time() - kept[0]
+    if age > settings.LIST_STALE_MAX_AGE:
+        return None
+    return age, kept[1]
+
+
+def refresh(key, compute, timeout_ms=None):
+    """Compute the data again and keep it, return True if it worked."""
+    tracker = budgets.BudgetTracker()
+    tracker.timeout_ms = timeout_ms
+    try:
+        with connections['default'].execute_wrapper(tracker):
+            data = compute()
+    except DatabaseError:
+        logger.warning('refreshing %s failed', key, exc_info=True)
+        pressure()
+        return False
+
+    keep(key, data)
+    relieve()
+    # the next stale response may refresh it again right away
+    cache.delete(f'{key}:refresh')
+    return True
+
+
+def _refresh_thread(key, compute, timeout_ms):
+    try:
+        refresh(key, compute, timeout_ms)
+    finally:
+        # the connections of this thread would stay open otherwise
+        connections.close_all()
+
+
+def refresh_in_background(key, compute, timeout_ms=None):
+    """Refresh kept data in a thread, unless a refresh is running.
+
+    A failed refresh keeps the lock until it expires, so a database
+    in trouble gets one try per list every pressure period.
+    """
+    if not cache.add(
+        f'{key}:refresh', True, settings.LIST_STALE_PRESSURE_SECONDS
+    ):
+        return False
+    threading.Thread(
+        target=_refresh_thread,
+        args=(key, compute, timeout_ms),
+        name='stale-refresh',
+        daemon=True,
+    ).start()
+    return True
+
+
+def response(age, data, warning):
+    """Return the response serving kept data."""
+    return Response(data, headers={
+        'Age': str(int(age)),
+        'Warning': warning,
+    })
+
+
+class StaleListMixin:
+    """Serve the kept list when listing on the database fails.
+
+    Views get their list data from list_data(), which the background
+    refreshes call as well.
+    """
+
+    def list_data(self):
+        """Return the serialized data of the list."""
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_serializer(queryset, many=True).data
+
+    def _refresh_timeout(self):
+        budget = getattr(self, 'budgets', {}).get('list')
+        return budget.timeout_ms if budget else None
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LIST_STALE_MAX_AGE:
+            return Response(self.list_data())
+
+        stale_key = key(request, self)
+        if under_pressure():
+            kept = get(stale_key)
+            if kept is not None:
+                refresh_in_background(
+                    stale_key, self.list_data, self._refresh_timeout()
+                )
+                return response(*kept, '110 - "Response is Stale"')
+
+        try:
+            data = self.list_data()
+        except DatabaseError:
+            kept = get(stale_key)
+            if kept is None:
+                raise
+            logger.warning(
+                'serving a stale list of %s', type(self).__name__,
+                exc_info=True,
+            )
+            pressure()
+            refresh_in_background(
+                stale_key, self.list_data, self._refresh_timeout()
+            )
+            return response(*kept, '111 - "Revalidation Failed"')
+
+        if not kept_recently(stale_key):
+            keep(stale_key, data)
+        return Response(data)
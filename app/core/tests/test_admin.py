@@ -6,6 +6,11 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.test import Client
 
+from decimal import Decimal
+
+from core.admin import EstimatedCountPaginator
+from core.models import Ingredient, Recipe, Tag
+
 
 class AdminSiteTests(TestCase):
 
@@ -46,4 +51,91 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
 
-        self.assertEqual(res.status_code, 302)
\ No newline at end of file
+        self.assertEqual(res.status_code, 302)
+
+
+class RecipeAdminTests(TestCase):
+    """Test the admin pages of recipes, tags and ingredients."""
+
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='akjsdh3'
+        )
+        self.client.force_login(self.admin_user)
+        self.tag = Tag.objects.create(user=self.admin_user, name='Vegan')
+        self.recipe = Recipe.objects.create(
+            user=self.admin_user,
+            title='Lentil soup',
+            time_minutes=20,
+            price=Decimal('3.50'),
+        )
+        self.recipe.tags.add(self.tag)
+
+    def test_recipe_search(self):
+        """Test recipes are searched by the start of the title."""
+        Recipe.objects.create(
+            user=self.admin_user,
+            title='Pasta',
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        url = reverse('admin:core_recipe_changelist')
+        res = self.client.get(url, {'q': 'lentil'})
+
+        self.assertContains(res, 'Lentil soup')
+        self.assertNotContains(res, 'Pasta')
+
+    def test_recipe_change_page_autocompletes_tags(self):
+        """Test the change page does not list every tag."""
+        Tag.objects.create(user=self.admin_user, name='Unused tag')
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+        res = self.client.get(url)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, 'admin-autocomplete')
+        self.assertNotContains(res, 'Unused tag')
+
+    def test_recipe_change_bumps_version(self):
+        """Test saving a recipe in the admin bumps its version."""
+        # the form requires an image and an ingredient
+        ingredient = Ingredient.objects.create(
+            user=self.admin_user, name='Lentils'
+        )
+        self.recipe.ingredients.add(ingredient)
+        self.recipe.image = 'uploads/recipe/soup.jpg'
+        self.recipe.save()
+        url = reverse('admin:core_recipe_change', args=[self.recipe.id])
+        payload = {
+            'user': self.admin_user.id,
+            'title': 'Red lentil soup',
+            'time_minutes': 25,
+            'price': '3.50',
+            'link': '',
+            'description': '',
+            'tags': [self.tag.id],
+            'ingredients': [ingredient.id],
+        }
+
+        res = self.client.post(url, payload)
+
+        self.assertEqual(res.status_code, 302)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Red lentil soup')
+        self.assertEqual(self.recipe.version, 2)
+
+    def test_tag_changelist(self):
+        """Test the tag changelist works."""
+        url = reverse('admin:core_tag_changelist')
+        res = self.client.get(url, {'q': 'veg'})
+
+        self.assertContains(res, 'Vegan')
+
+    def test_small_counts_are_exact(self):
+        """Test results below the limit are counted exactly."""
+        paginator = EstimatedCountPaginator(
+            Recipe.objects.order_by('id'), 100
+        )
+
+        self.assertEqual(paginator.count, 1)
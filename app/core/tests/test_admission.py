@@ -0,0 +1,133 @@
+"""
+Tests for the admission control of requests.
+"""
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, RequestFactory
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import admission
+from recipe.views import RecipeViewSet
+from user.views import CreateTokenView
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class AdmissionTests(SimpleTestCase):
+    """Test which requests are admitted."""
+
+    def setUp(self):
+        admission.reset()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        admission.reset()
+
+    def test_request_classes(self):
+        """Test requests are classed like their throttle scope."""
+        upload = RecipeViewSet.as_view(
+            {'post': 'upload_image'}, throttle_scope='upload'
+        )
+        login = CreateTokenView.as_view()
+        recipes = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+        get, post = self.factory.get('/'), self.factory.post('/')
+
+        self.assertEqual(admission.request_class(post, upload), 'upload')
+        self.assertEqual(admission.request_class(post, login), 'login')
+        self.assertEqual(admission.request_class(get, recipes), 'read')
+        self.assertEqual(admission.request_class(post, recipes), 'write')
+
+    def test_class_concurrency_limit(self):
+        """Test a class is limited to its concurrency."""
+        request = self.factory.post('/')
+        for _ in range(2):
+            self.assertIsNone(admission.admit(request, 'upload'))
+
+        self.assertIsNotNone(admission.admit(request, 'upload'))
+
+        admission.done('upload', 0.1)
+        self.assertIsNone(admission.admit(request, 'upload'))
+
+    def test_reads_admitted_while_uploads_shed(self):
+        """Test a busy worker sheds uploads before reads."""
+        request = self.factory.get('/')
+        with self.settings(ADMISSION_WORKER_LIMIT=8):
+            for _ in range(2):
+                self.assertIsNone(admission.admit(request, 'read'))
+
+            self.assertIsNotNone(admission.admit(request, 'upload'))
+            self.assertIsNone(admission.admit(request, 'read'))
+
+    def test_slow_class_limit_shrinks(self):
+        """Test fewer requests of a class run while it is slow."""
+        request = self.factory.get('/')
+        self.assertIsNone(admission.admit(request, 'read'))
+        admission.done('read', 3.2)
+
+        # 32 requests * 0.2s target / 3.2s latency
+        for _ in range(2):
+            self.assertIsNone(admission.admit(request, 'read'))
+        retry_after = admission.admit(request, 'read')
+
+        self.assertEqual(retry_after, 4)
+
+    def test_long_queued_request_shed(self):
+        """Test a request that waited too long at the proxy is shed."""
+        started = int((time.time() - 2) * 1000)
+        request = self.factory.get(
+            '/', HTTP_X_REQUEST_START=f't={started}'
+        )
+
+        self.assertEqual(admission.admit(request, 'read'), 1)
+
+    def test_queue_time_units(self):
+        """Test X-Request-Start is read in seconds, ms and microseconds."""
+        now = 1700000000.0
+        for value in ('t=1699999999.5', '1699999999500', '1699999999500000'):
+            request = self.factory.get('/', HTTP_X_REQUEST_START=value)
+            self.assertAlmostEqual(
+                admission.queue_seconds(request, now), 0.5, places=3
+            )
+        self.assertIsNone(admission.queue_seconds(self.factory.get('/')))
+
+
+class AdmissionMiddlewareTests(TestCase):
+    """Test the middleware turning requests away."""
+
+    def setUp(self):
+        admission.reset()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        admission.reset()
+
+    def test_request_admitted_and_released(self):
+        """Test an admitted request is no longer in flight after it."""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(admission._in_flight['total'], 0)
+
+    @patch('core.admission.admit', return_value=3)
+    def test_shed_request(self, admit):
+        """Test a shed request gets a 503 with Retry-After."""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '3')
+
+    @patch('core.admission.admit', return_value=3)
+    def test_exempt_paths_admitted(self, admit):
+        """Test the metrics are served to an overloaded worker."""
+        self.client.get('/metrics/')
+
+        admit.assert_not_called()
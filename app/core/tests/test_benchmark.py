@@ -0,0 +1,123 @@
+"""
+Tests for the benchmark suite.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from core import benchmark
+
+
+def results(p95, queries):
+    """Return results of a single scenario."""
+    return {
+        'scenarios': {
+            'recipe-list': {'p95_ms': p95, 'queries_per_request': queries},
+        },
+    }
+
+
+class BenchmarkTests(TestCase):
+    """Test running and comparing benchmarks."""
+
+    def setUp(self):
+        # the data is seeded in the test database and rolled back,
+        # the uploaded images go to a directory removed after
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def test_percentile(self):
+        """Test nearest rank percentiles."""
+        values = list(range(1, 101))
+
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([], 99), 0.0)
+
+    def test_compare_flags_regressions(self):
+        """Test slower or chattier scenarios are regressions."""
+        baseline = results(10.0, 2)
+
+        self.assertEqual(benchmark.compare(results(11.0, 2), baseline), [])
+        self.assertEqual(
+            len(benchmark.compare(results(13.0, 2), baseline)), 1
+        )
+        self.assertEqual(
+            len(benchmark.compare(results(10.0, 3), baseline)), 1
+        )
+
+    def test_run_saves_results(self):
+        """Test the command runs scenarios and writes json results."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command(
+                'benchmark',
+                requests=2,
+                concurrency=1,
+                scenarios=['recipe-list', 'tag-list'],
+                output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as f:
+                saved = json.load(f)
+
+        self.assertEqual(
+            set(saved['scenarios']), {'recipe-list', 'tag-list'}
+        )
+        stats = saved['scenarios']['recipe-list']
+        self.assertEqual(stats['errors'], 0)
+        self.assertGreater(stats['queries_per_request'], 0)
+
+    def test_baseline_regression_fails(self):
+        """Test the command fails when the baseline is beaten."""
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            benchmark.save(results(0.0, 0), baseline)
+
+            with self.assertRaises(CommandError):
+                call_command(
+                    'benchmark',
+                    requests=1,
+                    concurrency=1,
+                    scenarios=['recipe-list'],
+                    baseline=baseline,
+                    stdout=StringIO(),
+                )
+
+    def test_upload_kept_in_media_root(self):
+        """Test uploaded images go to the temporary media root."""
+        out = StringIO()
+        call_command(
+            'benchmark',
+            requests=1,
+            concurrency=1,
+            scenarios=['recipe-upload-image'],
+            stdout=out,
+        )
+
+        self.assertIn('recipe-upload-image', out.getvalue())
+        uploads = [
+            name
+            for _, _, names in os.walk(self.media.name)
+            for name in names
+        ]
+        self.assertTrue(uploads)
+
+    def test_compare_stacks(self):
+        """Test the api is measured with and without browser middleware."""
+        compared = benchmark.compare_stacks(requests=2, only=['tag-list'])
+
+        self.assertEqual(set(compared['saved_p50_ms']), {'tag-list'})
+        self.assertEqual(
+            compared['full']['scenarios']['tag-list']['errors'], 0
+        )
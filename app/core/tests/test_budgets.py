@@ -0,0 +1,117 @@
+"""
+Tests for the query budgets of the views.
+"""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import budgets
+from core.budgets import Budget
+from core.middleware import QueryCounter
+from core.models import Recipe
+from recipe.views import RecipeViewSet
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class QueryBudgetTests(TestCase):
+    """Test enforcing the budgets of views."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+        for i in range(3):
+            Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+
+    def test_budget_for_action(self):
+        """Test the budget is looked up by the viewset action."""
+        view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+        factory = RequestFactory()
+
+        self.assertEqual(
+            budgets.budget_for(factory.get(RECIPES_URL), view),
+            RecipeViewSet.budgets['list'],
+        )
+        self.assertIsNone(budgets.budget_for(factory.post(RECIPES_URL), view))
+
+    def test_list_within_budget(self):
+        """Test listing recipes stays within its budget."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(REQUEST_BUDGET_MODES=['raise'])
+    def test_over_budget_raises(self):
+        """Test a request over its budget raises in raise mode."""
+        with patch.object(
+            RecipeViewSet, 'budgets', {'list': Budget(queries=0)}
+        ):
+            with self.assertRaises(budgets.QueryBudgetExceeded):
+                self.client.get(RECIPES_URL)
+
+    @override_settings(REQUEST_BUDGET_MODES=['log'])
+    def test_over_budget_logged(self):
+        """Test a request over its budget is logged in log mode."""
+        with patch.object(
+            RecipeViewSet, 'budgets', {'list': Budget(queries=0)}
+        ):
+            with self.assertLogs('core.budgets', 'WARNING'):
+                res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_statement_timeout_set_and_reset(self):
+        """Test the timeout is set before the first query and reset."""
+        tracker = budgets.BudgetTracker()
+        tracker.timeout_ms = 1234
+        with connection.execute_wrapper(tracker):
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW statement_timeout')
+                self.assertEqual(cursor.fetchone()[0], '1234ms')
+
+        tracker.reset_timeouts()
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+
+    def test_timeout_reset_not_counted(self):
+        """Test the reset of the timeout is not a query of the request."""
+        counter = QueryCounter()
+        with patch.object(
+            RecipeViewSet, 'budgets', {'list': Budget(timeout_ms=1234)}
+        ):
+            with connection.execute_wrapper(counter):
+                res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(counter.count, res.wsgi_request._budget_tracker.count)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+
+    def test_runaway_query_cancelled(self):
+        """Test a query over the timeout is cancelled."""
+        tracker = budgets.BudgetTracker()
+        tracker.timeout_ms = 50
+        with self.assertRaises(OperationalError) as error:
+            with transaction.atomic():
+                with connection.execute_wrapper(tracker):
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT pg_sleep(1)')
+
+        self.assertTrue(budgets.is_timeout(error.exception))
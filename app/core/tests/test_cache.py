@@ -0,0 +1,197 @@
+"""
+Tests for the two tier cache.
+"""
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from core import cache as tiered
+
+
+def make_cache(name, **options):
+    """Return a two tier cache with its own local tier."""
+    tiered._locals.pop(name, None)
+    return tiered.TieredCache(name, {'OPTIONS': options})
+
+
+class TieredCacheTests(SimpleTestCase):
+    """Test reading and writing through both tiers."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.cache = make_cache('test', MAX_ENTRIES=3, LOCAL_TIMEOUT=60)
+
+    def test_read_from_shared_tier(self):
+        """Test a value of another worker is read and kept locally."""
+        self.cache.set('key', 'value')
+        self.cache.local.clear()
+
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertIsNot(
+            self.cache.local.get(self.cache.make_key('key')), tiered.MISSING
+        )
+
+    def test_local_tier_is_bounded(self):
+        """Test the least recently used values leave the local tier."""
+        for key in 'abcd':
+            self.cache.set(key, key)
+
+        self.assertEqual(len(self.cache.local.data), 3)
+        self.assertIs(
+            self.cache.local.get(self.cache.make_key('a')), tiered.MISSING
+        )
+        self.assertEqual(self.cache.get('a'), 'a')
+
+    def test_local_copy_expires(self):
+        """Test a local copy is dropped after LOCAL_TIMEOUT."""
+        cache = make_cache('short', LOCAL_TIMEOUT=0.01)
+        cache.set('key', 'old')
+        caches['shared'].set(cache.make_key('key'), 'new')
+        self.assertEqual(cache.get('key'), 'old')
+
+        time.sleep(0.02)
+
+        self.assertEqual(cache.get('key'), 'new')
+
+    def test_values_are_copied(self):
+        """Test changing a value read does not change the cached one."""
+        self.cache.set('key', ['a'])
+
+        self.cache.get('key').append('b')
+
+        self.assertEqual(self.cache.get('key'), ['a'])
+
+    def test_versioned_keys(self):
+        """Test values of another version are not read."""
+        self.cache.set('key', 'v1')
+
+        self.cache.incr_version('key')
+
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(self.cache.get('key', version=2), 'v1')
+
+    def test_incr_skips_local_tier(self):
+        """Test counters are always read from the shared tier."""
+        self.cache.set('count', 1)
+        caches['shared'].incr(self.cache.make_key('count'), 5)
+
+        self.assertEqual(self.cache.incr('count'), 7)
+        self.assertEqual(self.cache.get('count'), 7)
+
+
+class StampedeTests(SimpleTestCase):
+    """Test values are computed once when many need them."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.cache = make_cache('stampede', LOCK_TIMEOUT=5)
+        self.computed = 0
+
+    def compute(self, seconds=0):
+        self.computed += 1
+        time.sleep(seconds)
+        return f'value {self.computed}'
+
+    def test_computed_once(self):
+        """Test a cached value is not computed again."""
+        self.cache.get_or_set('key', self.compute, 60)
+
+        value = self.cache.get_or_set('key', self.compute, 60)
+
+        self.assertEqual(value, 'value 1')
+        self.assertEqual(self.computed, 1)
+
+    def test_single_flight_in_worker(self):
+        """Test threads needing a missing value compute it once."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.get_or_set('key', lambda: self.compute(0.1), 60)
+            ))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(results, ['value 1'] * 10)
+
+    def test_wait_for_other_worker(self):
+        """Test a missing value another worker computes is waited for."""
+        key = self.cache.make_key('key')
+        self.assertTrue(self.cache._lock(key))
+        timer = threading.Timer(0.05, lambda: caches['shared'].set(
+            key, tiered.Entry('theirs', time.time() + 60, 0.05)
+        ))
+        timer.start()
+
+        value = self.cache.get_or_set('key', self.compute, 60)
+
+        timer.join()
+        self.assertEqual(value, 'theirs')
+        self.assertEqual(self.computed, 0)
+
+    @patch('core.cache.random.random', return_value=0.5)
+    def test_early_expiration(self, random):
+        """Test a value about to expire is recomputed by a reader."""
+        key = self.cache.make_key('key')
+        caches['shared'].set(key, tiered.Entry('old', time.time() + 1, 10))
+
+        value = self.cache.get_or_set('key', self.compute, 60)
+
+        self.assertEqual(value, 'value 1')
+
+    @patch('core.cache.random.random', return_value=0.5)
+    def test_old_value_while_other_worker_refreshes(self, random):
+        """Test the old value is used while another worker refreshes."""
+        key = self.cache.make_key('key')
+        caches['shared'].set(key, tiered.Entry('old', time.time() + 1, 10))
+        self.assertTrue(self.cache._lock(key))
+
+        value = self.cache.get_or_set('key', self.compute, 60)
+
+        self.assertEqual(value, 'old')
+        self.assertEqual(self.computed, 0)
+
+    @patch('core.cache.random.random', return_value=0.5)
+    def test_fresh_value_not_recomputed(self, random):
+        """Test a value far from expiring is not recomputed early."""
+        key = self.cache.make_key('key')
+        caches['shared'].set(
+            key, tiered.Entry('cached', time.time() + 3600, 0.001)
+        )
+
+        value = self.cache.get_or_set('key', self.compute, 60)
+
+        self.assertEqual(value, 'cached')
+
+
+class FileLockTests(SimpleTestCase):
+    """Test the lock used with the file based shared tier."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'key.lock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lock_taken_once(self):
+        """Test only the first caller gets the lock."""
+        self.assertTrue(tiered._file_lock(self.path, 30))
+        self.assertFalse(tiered._file_lock(self.path, 30))
+
+    def test_stale_lock_taken_over(self):
+        """Test a lock older than its timeout is taken over."""
+        tiered._file_lock(self.path, 30)
+        old = time.time() - 60
+        os.utime(self.path, (old, old))
+
+        self.assertTrue(tiered._file_lock(self.path, 30))
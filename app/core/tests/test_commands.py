@@ -1,14 +1,21 @@
+from io import StringIO
 from unittest.mock import patch
 
 # error that psycopg2 throws when db is not ready
 from psycopg2 import OperationalError as Psycopg2Error
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 
 # Error that django throws when db is not ready
 from django.db.utils import OperationalError
 
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth import get_user_model
+
+from decimal import Decimal
+
+from core.models import Recipe, Tag, Ingredient
 
 
 @patch('core.management.commands.wait_for_db.Command.check')
@@ -37,3 +44,100 @@ class CommandTests(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+class ReconcileRecipeCountsTests(TestCase):
+    """Test the reconcile_recipe_counts command."""
+
+    def test_reconcile_fixes_counts(self):
+        """Test drifted recipe counts are recounted."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        recipe = Recipe.objects.create(
+            user=user,
+            title='recipe',
+            time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        used = Tag.objects.create(user=user, name='used')
+        unused = Tag.objects.create(user=user, name='unused', recipe_count=3)
+        recipe.tags.add(used)
+
+        call_command('reconcile_recipe_counts')
+
+        used.refresh_from_db()
+        unused.refresh_from_db()
+        self.assertEqual(used.recipe_count, 1)
+        self.assertEqual(unused.recipe_count, 0)
+
+
+class SeedDataTests(TestCase):
+    """Test the seed_data command."""
+
+    def test_seed_data(self):
+        """Test generating users, recipes and their links."""
+        call_command(
+            'seed_data', users=5, recipes=50, tags_per_user=4,
+            ingredients_per_user=6, seed=1, stdout=StringIO(),
+        )
+
+        users = get_user_model().objects.filter(
+            email__startswith='seed1-'
+        )
+        self.assertEqual(users.count(), 5)
+        self.assertTrue(users[0].check_password('changeme123'))
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertEqual(Tag.objects.count(), 20)
+        self.assertEqual(Ingredient.objects.count(), 30)
+
+    def test_seed_data_counters_and_snapshots(self):
+        """Test generated counters and snapshots match the links."""
+        call_command(
+            'seed_data', users=3, recipes=30, seed=2, stdout=StringIO(),
+        )
+
+        for tag in Tag.objects.all():
+            self.assertEqual(tag.recipe_count, tag.recipe_set.count())
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                [item['id'] for item in recipe.ingredients_snapshot],
+                sorted(recipe.ingredients.values_list('id', flat=True)),
+            )
+
+    def test_seed_data_deterministic(self):
+        """Test the same seed generates the same recipes."""
+        call_command(
+            'seed_data', users=2, recipes=10, seed=3, stdout=StringIO()
+        )
+        first = list(Recipe.objects.order_by('id').values_list(
+            'title', 'time_minutes', 'price'
+        ))
+        Recipe.objects.all().delete()
+        get_user_model().objects.all().delete()
+
+        call_command(
+            'seed_data', users=2, recipes=10, seed=3, stdout=StringIO()
+        )
+        second = list(Recipe.objects.order_by('id').values_list(
+            'title', 'time_minutes', 'price'
+        ))
+        self.assertEqual(first, second)
+
+    def test_seed_data_invalid_options(self):
+        """Test every invalid option is reported by name."""
+        invalid = [
+            ({'users': 0}, 'Need at least one user.'),
+            ({'recipes': -1}, 'Recipes can not be negative.'),
+            ({'tags_per_user': 0}, 'Need at least one tag per user.'),
+            (
+                {'ingredients_per_user': 0},
+                'Need at least one ingredient per user.',
+            ),
+        ]
+        for options, message in invalid:
+            with self.subTest(options=options):
+                with self.assertRaisesMessage(CommandError, message):
+                    call_command('seed_data', stdout=StringIO(), **options)
+
+        self.assertFalse(Recipe.objects.exists())
@@ -0,0 +1,81 @@
+"""
+Tests for the recipe counters of tags and ingredients.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, Tag
+
+
+class RecipeCountTests(TestCase):
+    """Test the counters follow the links however they change."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.other_tag = Tag.objects.create(user=self.user, name='Lunch')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipes = [
+            Recipe.objects.create(
+                user=self.user,
+                title=f'recipe {index}',
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+            for index in range(3)
+        ]
+
+    def assertCounts(self, tag, other_tag, salt=0):
+        for obj, count in (
+            (self.tag, tag), (self.other_tag, other_tag), (self.salt, salt)
+        ):
+            obj.refresh_from_db()
+            self.assertEqual(obj.recipe_count, count)
+
+    def test_links_of_a_recipe(self):
+        """Test adding, removing and clearing from the recipe side."""
+        recipe = self.recipes[0]
+        recipe.tags.add(self.tag, self.other_tag)
+        # adding again is not counted again
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.salt)
+        self.assertCounts(1, 1, 1)
+
+        recipe.tags.remove(self.tag)
+        # removing what is not linked is not counted
+        recipe.tags.remove(self.tag)
+        self.assertCounts(0, 1, 1)
+
+        recipe.tags.set([self.tag])
+        self.assertCounts(1, 0, 1)
+
+        recipe.tags.clear()
+        self.assertCounts(0, 0, 1)
+
+    def test_links_of_a_tag(self):
+        """Test adding, removing and clearing from the tag side."""
+        self.tag.recipe_set.add(*self.recipes)
+        self.assertCounts(3, 0)
+
+        self.tag.recipe_set.remove(self.recipes[0], self.recipes[0])
+        self.assertCounts(2, 0)
+
+        self.tag.recipe_set.clear()
+        self.assertCounts(0, 0)
+
+    def test_deleted_recipes(self):
+        """Test deleting recipes one by one or in bulk uncounts them."""
+        for recipe in self.recipes:
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.salt)
+        self.recipes[0].tags.add(self.other_tag)
+
+        self.recipes[0].delete()
+        self.assertCounts(2, 0, 2)
+
+        Recipe.objects.filter(user=self.user).delete()
+        self.assertCounts(0, 0, 0)
@@ -0,0 +1,157 @@
+"""
+Tests for the event stream of the changes.
+"""
+import asyncio
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase
+
+from rest_framework.authtoken.models import Token
+
+from core import events
+from core.models import Recipe
+
+
+def scope(token=None, path=events.PATH, headers=()):
+    """Return the ASGI scope of a request to the stream."""
+    headers = list(headers)
+    if token:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': b'',
+        'headers': headers,
+    }
+
+
+class Connection:
+    """Fake ASGI connection recording what the app sends.
+
+    Create it inside the event loop running the app, the events bind
+    to the loop on python 3.9.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.closed = asyncio.Event()
+        self.sent = asyncio.Event()
+
+    async def receive(self):
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.messages.append(message)
+        self.sent.set()
+
+    def body(self):
+        return b''.join(m.get('body', b'') for m in self.messages)
+
+
+class ListenerTests(SimpleTestCase):
+    """Test dispatching notifications to the streams."""
+
+    def test_dispatch_wakes_user_streams(self):
+        """Test a notification only wakes the streams of its user."""
+        listener = events.Listener()
+
+        async def scenario():
+            # no task is needed for dispatching
+            listener._task = asyncio.ensure_future(asyncio.sleep(0))
+            mine = listener.subscribe(1, 5)
+            other = listener.subscribe(2, 5)
+            listener.dispatch('1:7')
+            listener.dispatch('1:6')
+            return mine, other
+
+        mine, other = async_to_sync(scenario)()
+
+        self.assertTrue(mine.changed.is_set())
+        self.assertEqual(mine.last_id, 7)
+        self.assertFalse(other.changed.is_set())
+
+    def test_other_paths_go_to_django(self):
+        """Test requests to other paths are passed on."""
+        calls = []
+
+        async def application(scope, receive, send):
+            calls.append(scope['path'])
+
+        app = events.EventStreamApp(application)
+        async_to_sync(app)(scope(path='/api/recipe/recipes/'), None, None)
+
+        self.assertEqual(calls, ['/api/recipe/recipes/'])
+
+
+class EventStreamAuthTests(TransactionTestCase):
+    """Test authentication of the stream.
+
+    The stream closes old connections like a django request does,
+    which would end the transaction of a TestCase.
+    """
+
+    def test_token_required(self):
+        """Test streams without a valid token are refused."""
+        app = events.EventStreamApp(None)
+
+        async def scenario():
+            connection = Connection()
+            await app(scope('invalid'), connection.receive, connection.send)
+            return connection
+
+        connection = async_to_sync(scenario)()
+
+        self.assertEqual(connection.messages[0]['status'], 401)
+
+
+class EventStreamTests(TransactionTestCase):
+    """Test streaming changes, notifications need committed writes."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_change_is_streamed(self):
+        """Test a change of the user is sent as an event."""
+        app = events.EventStreamApp(None)
+
+        def create_recipe():
+            return Recipe.objects.create(
+                user=self.user,
+                title='Soup',
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+
+        async def scenario():
+            connection = Connection()
+            stream = asyncio.ensure_future(app(
+                scope(self.token.key), connection.receive, connection.send
+            ))
+            while b'retry' not in connection.body():
+                connection.sent.clear()
+                await asyncio.wait_for(connection.sent.wait(), 5)
+
+            await sync_to_async(create_recipe)()
+            while b'event: changes' not in connection.body():
+                connection.sent.clear()
+                await asyncio.wait_for(connection.sent.wait(), 5)
+
+            connection.closed.set()
+            await stream
+            # lets the listener close its connection
+            await asyncio.sleep(0.1)
+            return connection
+
+        connection = async_to_sync(scenario)()
+
+        self.assertEqual(connection.messages[0]['status'], 200)
+        self.assertIn(b'id: ', connection.body())
+        self.assertEqual(events.listener.count, 0)
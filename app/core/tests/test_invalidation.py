@@ -0,0 +1,232 @@
+"""
+Tests for the invalidation bus of the in-memory caches.
+"""
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import invalidation, querycache
+from core.models import Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def wait_for(condition, seconds=5):
+    """Wait until condition() is true, return whether it became true."""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class ListeningTestCase(TestCase):
+    """Run the tests as if the worker was listening to the bus."""
+
+    def setUp(self):
+        invalidation._listening.set()
+        invalidation.clear_caches()
+
+    def tearDown(self):
+        invalidation._listening.clear()
+        invalidation.clear_caches()
+
+
+class LocalCacheTests(ListeningTestCase):
+    """Test values kept in the memory of the worker."""
+
+    def test_kept_while_listening(self):
+        """Test values are only kept while listening."""
+        local_cache = invalidation.LocalCache()
+        local_cache.set('key', 'value', invalidation.epoch())
+        self.assertEqual(local_cache.get('key'), 'value')
+
+        invalidation._listening.clear()
+
+        self.assertIsNone(local_cache.get('key'))
+
+    def test_outdated_value_not_kept(self):
+        """Test a value read before a message arrived is not kept."""
+        local_cache = invalidation.LocalCache()
+        since = invalidation.epoch()
+
+        invalidation.dispatch('tag:1')
+        local_cache.set('key', 'value', since)
+
+        self.assertIsNone(local_cache.get('key'))
+
+
+class PublishTests(ListeningTestCase):
+    """Test changes of the models are published."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+
+    def test_saved_model_published(self):
+        """Test saving a tag sends a message about it."""
+        received = []
+        with patch.dict(invalidation._handlers, {'tag': [received.append]}):
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+
+        self.assertEqual(received, [str(tag.pk)])
+
+    def test_token_published_by_user(self):
+        """Test messages about tokens name the user, not the key."""
+        received = []
+        with patch.dict(invalidation._handlers, {'token': [received.append]}):
+            Token.objects.create(user=self.user)
+
+        self.assertEqual(received, [str(self.user.pk)])
+
+    def test_generations_kept_until_bumped(self):
+        """Test table generations are read once until a bump."""
+        querycache.reset()
+        tables = ['core_tag']
+        generation = querycache.generations(tables)
+
+        with patch.object(
+            querycache, '_shared_generations'
+        ) as shared_generations:
+            self.assertEqual(querycache.generations(tables), generation)
+        shared_generations.assert_not_called()
+
+        querycache.bump(tables)
+
+        self.assertNotEqual(querycache.generations(tables), generation)
+
+
+class CachedTokenTests(ListeningTestCase):
+    """Test the tokens looked up once per worker."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.token = Token.objects.create(user=self.user)
+        querycache.reset()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_cached(self):
+        """Test a known token is not looked up again."""
+        self.client.get(TAGS_URL)
+
+        with patch(
+            'rest_framework.authentication.TokenAuthentication'
+            '.authenticate_credentials'
+        ) as lookup:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        lookup.assert_not_called()
+
+    def test_deleted_token_evicted(self):
+        """Test a deleted token stops working right away."""
+        self.client.get(TAGS_URL)
+
+        self.token.delete()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_deactivated_user_evicted(self):
+        """Test the token of a deactivated user stops working."""
+        self.client.get(TAGS_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 401)
+
+
+class BusListenerTests(TransactionTestCase):
+    """Test the messages reach the listener of every worker."""
+
+    def test_notify_delivered(self):
+        """Test a committed change is delivered through postgres."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        received = []
+        listener = invalidation.BusListener()
+        with patch.dict(invalidation._handlers, {'tag': [received.append]}):
+            listener.start()
+            try:
+                self.assertTrue(wait_for(invalidation.is_listening))
+                tag = Tag.objects.create(user=user, name='Vegan')
+
+                # once by the worker publishing it, once through postgres
+                self.assertTrue(wait_for(
+                    lambda: received.count(str(tag.pk)) == 2
+                ))
+            finally:
+                listener.stop()
+
+        self.assertFalse(invalidation.is_listening())
+
+
+@patch('core.invalidation.BusListener')
+class StartTests(SimpleTestCase):
+    """Test the listener is started per worker, not on import."""
+
+    def setUp(self):
+        self.listener = dict(invalidation._listener)
+
+    def tearDown(self):
+        request_started.disconnect(dispatch_uid='invalidation-bus')
+        invalidation._listener.update(self.listener)
+
+    def test_started_by_first_request(self, listener_class):
+        """Test the listener starts once, with the first request."""
+        invalidation._listener.update(pid=None, thread=None)
+        invalidation.start()
+        listener_class.assert_not_called()
+
+        request_started.send(sender=None)
+        request_started.send(sender=None)
+
+        listener_class.return_value.start.assert_called_once()
+
+    def test_started_again_after_fork(self, listener_class):
+        """Test a forked worker starts its own listener."""
+        invalidation._listener.update(pid=-1, thread=None)
+        invalidation.start()
+
+        request_started.send(sender=None)
+
+        listener_class.return_value.start.assert_called_once()
+
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    })
+    def test_not_started_without_memory_caches(self, listener_class):
+        """Test workers without in-memory caches do not listen."""
+        invalidation._listener.update(pid=None, thread=None)
+        invalidation.start()
+
+        request_started.send(sender=None)
+
+        listener_class.assert_not_called()
@@ -0,0 +1,170 @@
+"""
+Tests for the memory diagnostics.
+"""
+import signal
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import memory
+
+
+MEMORY_URL = reverse('debug:memory')
+SNAPSHOTS_URL = reverse('debug:snapshots')
+
+leaked = []
+
+
+def leak():
+    """Allocate memory that stays allocated."""
+    leaked.append([object() for _ in range(10000)])
+
+
+class MemoryTestCase(TestCase):
+    """Store snapshots in a temporary directory, stop tracing after."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            MEMORY_SNAPSHOT_DIR=self.directory.name
+        )
+        self.settings.enable()
+        self.was_tracing = tracemalloc.is_tracing()
+
+    def tearDown(self):
+        if not self.was_tracing:
+            tracemalloc.stop()
+        leaked.clear()
+        self.settings.disable()
+        self.directory.cleanup()
+
+
+class MemoryTests(MemoryTestCase):
+    """Test snapshots and allocation sites."""
+
+    def test_top_sites_point_to_app_code(self):
+        """Test allocations are attributed to the app line making them."""
+        memory.start(10)
+        leak()
+        snapshot_id, snapshot = memory.take_snapshot()
+
+        sites = memory.top_sites(snapshot, group='file', limit=5)
+
+        self.assertEqual(sites[0]['site'], 'core/tests/test_memory.py')
+        self.assertIsNotNone(memory.load_snapshot(snapshot_id))
+
+    def test_compare_snapshots(self):
+        """Test the growth between two snapshots is reported."""
+        memory.start(10)
+        base_id, base = memory.take_snapshot()
+        leak()
+        snapshot_id, snapshot = memory.take_snapshot()
+
+        sites = memory.top_sites(snapshot, base=memory.load_snapshot(base_id))
+
+        self.assertTrue(sites[0]['site'].startswith(
+            'core/tests/test_memory.py:'
+        ))
+        self.assertGreater(sites[0]['size_diff'], 0)
+
+    def test_invalid_snapshot_id(self):
+        """Test ids can not point outside the snapshot directory."""
+        self.assertIsNone(memory.load_snapshot('../secrets'))
+
+
+class MemoryApiTests(MemoryTestCase):
+    """Test the staff only memory api."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123'
+        )
+
+    def test_staff_required(self):
+        """Test users that are not staff can not see the memory use."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(user)
+
+        res = self.client.get(MEMORY_URL)
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_snapshot_needs_tracing(self):
+        """Test no snapshot is taken while tracing is off."""
+        self.client.force_authenticate(self.staff)
+        self.client.post(MEMORY_URL, {'trace': False}, format='json')
+
+        res = self.client.post(SNAPSHOTS_URL)
+
+        self.assertEqual(res.status_code, 409)
+
+    def test_take_and_compare_snapshots(self):
+        """Test snapshots are taken, listed and compared."""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.post(
+            MEMORY_URL, {'trace': True, 'frames': 10}, format='json'
+        )
+        self.assertTrue(res.data['tracing'])
+        base_id = self.client.post(SNAPSHOTS_URL).data['id']
+        leak()
+        res = self.client.post(SNAPSHOTS_URL)
+        self.assertEqual(res.status_code, 201)
+        snapshot_id = res.data['id']
+
+        res = self.client.get(SNAPSHOTS_URL)
+        self.assertEqual(
+            {s['id'] for s in res.data}, {base_id, snapshot_id}
+        )
+
+        res = self.client.get(
+            reverse('debug:snapshot', args=[snapshot_id]),
+            {'base': base_id, 'group': 'file'},
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            'core/tests/test_memory.py',
+            [s['site'] for s in res.data['sites'] if s['size_diff'] > 0],
+        )
+
+    def test_unknown_snapshot(self):
+        """Test a missing snapshot is a 404."""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.get(reverse('debug:snapshot', args=['missing']))
+
+        self.assertEqual(res.status_code, 404)
+
+
+class MemoryLimitTests(TestCase):
+    """Test workers over the high-water mark are recycled."""
+
+    @override_settings(MEMORY_HIGH_WATER_MB=0)
+    @patch('core.memory.os.kill')
+    def test_no_limit(self, kill):
+        """Test nothing happens without a high-water mark."""
+        self.client.get(reverse('api-schema'))
+
+        kill.assert_not_called()
+
+    @override_settings(MEMORY_HIGH_WATER_MB=1)
+    @patch('core.memory.os.kill')
+    def test_recycle_over_limit(self, kill):
+        """Test the worker is signalled once, after the response."""
+        with self.assertLogs('core.middleware', 'WARNING'):
+            res = self.client.get(reverse('api-schema'))
+        self.client.get(reverse('api-schema'))
+
+        self.assertEqual(res.status_code, 200)
+        kill.assert_called_once()
+        self.assertEqual(kill.call_args[0][1], signal.SIGTERM)
@@ -0,0 +1,65 @@
+"""
+Tests for the metrics endpoint.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from prometheus_client import REGISTRY
+
+from rest_framework.test import APIClient
+
+
+METRICS_URL = reverse('metrics')
+
+
+class MetricsTests(TestCase):
+    """Test recording and exposing metrics."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics_labeled_by_view(self):
+        """Test request metrics are labeled with the view and action."""
+        labels = {'view': 'RecipeViewSet', 'action': 'list', 'method': 'GET'}
+        samples = {
+            'http_request_duration_seconds_count': labels,
+            'http_request_db_queries_count': labels,
+            'http_requests_total': {**labels, 'status': '200'},
+        }
+        before = {
+            name: REGISTRY.get_sample_value(name, sample_labels) or 0
+            for name, sample_labels in samples.items()
+        }
+
+        self.client.get(reverse('recipe:recipe-list'))
+
+        for name, sample_labels in samples.items():
+            self.assertEqual(
+                REGISTRY.get_sample_value(name, sample_labels),
+                before[name] + 1,
+            )
+
+    def test_metrics_exposed(self):
+        """Test the metrics are served in the prometheus format."""
+        self.client.get(reverse('recipe:recipe-list'))
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            'http_request_duration_seconds_count{', res.content.decode()
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_required(self):
+        """Test the metrics need the token when one is configured."""
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, 403)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, 200)
@@ -0,0 +1,58 @@
+"""
+Tests for running the browser middleware outside of the api only.
+"""
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+
+class BrowserMiddlewareTests(TestCase):
+    """Test the api skips the session, csrf and messages middleware."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def test_api_skips_browser_middleware(self):
+        """Test api requests get no session or frame options."""
+        res = self.client.get(
+            reverse('recipe:recipe-list'),
+            HTTP_AUTHORIZATION=f'Token {self.token.key}',
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+        self.assertNotIn('X-Frame-Options', res)
+
+    def test_api_post_needs_no_csrf_token(self):
+        """Test token authenticated writes work without csrf."""
+        res = self.client.post(
+            reverse('recipe:recipe-list'),
+            {'title': 'Soup', 'time_minutes': 5, 'price': '1.00'},
+            HTTP_AUTHORIZATION=f'Token {self.token.key}',
+        )
+
+        self.assertEqual(res.status_code, 201)
+
+    def test_admin_runs_browser_middleware(self):
+        """Test the admin still gets sessions, csrf and frame options."""
+        res = self.client.get(reverse('admin:login'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(hasattr(res.wsgi_request, 'session'))
+        self.assertIn('csrftoken', res.cookies)
+        self.assertEqual(res['X-Frame-Options'], 'DENY')
+
+    def test_admin_csrf_enforced(self):
+        """Test the csrf check of the admin still runs."""
+        self.client = self.client_class(enforce_csrf_checks=True)
+        res = self.client.post(
+            reverse('admin:login'),
+            {'username': 'user@example.com', 'password': 'testpass123'},
+        )
+
+        self.assertEqual(res.status_code, 403)
@@ -0,0 +1,156 @@
+"""
+Tests for partitioning the recipe tables.
+"""
+import re
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import partitioning
+from core.models import Ingredient, Recipe, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+PARTITIONS = 4
+
+
+def create_recipe(user, title):
+    """Create and return a sample recipe."""
+    return Recipe.objects.create(
+        user=user,
+        title=title,
+        time_minutes=10,
+        price=Decimal('5.00'),
+    )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs postgres.')
+class PartitionPruningTests(TestCase):
+    """Test recipe queries only scan the partition of the user."""
+
+    def setUp(self):
+        # the conversion runs inside the test transaction,
+        # so it is rolled back after every test
+        if not partitioning.is_partitioned(connection):
+            partitioning.partition_tables(connection, PARTITIONS)
+        # the queries of cached lists would not run
+        cache.clear()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+        self.tag = Tag.objects.create(user=self.user, name='Dinner')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipe = create_recipe(self.user, 'recipe1')
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.salt)
+
+        # other users recipes, tags and ingredients end up in the
+        # other partitions
+        for index in range(PARTITIONS * 2):
+            other = get_user_model().objects.create_user(
+                f'user{index}@example.com', 'testpass123'
+            )
+            recipe = create_recipe(other, f'other recipe {index}')
+            recipe.tags.add(Tag.objects.create(user=other, name='Lunch'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=other, name='Salt')
+            )
+
+    def _scanned_partitions(self, queries, table):
+        """Return the partitions of a table scanned by the recipe queries.
+
+        The tags and ingredients of every listed recipe are looked up
+        by recipe_id, which is not the key of the link tables, so only
+        the queries of the recipe table itself are looked at.
+        """
+        scanned = set()
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or f'{table}"' not in sql:
+                    continue
+                if 'FROM "core_recipe" ' not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                scanned.update(re.findall(rf'{table}_p\d+', plan))
+        return scanned
+
+    def _assert_pruned(self, url, params=None, tables=('core_recipe',)):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params)
+
+        self.assertEqual(res.status_code, 200)
+        for table in tables:
+            self.assertEqual(
+                len(self._scanned_partitions(queries, table)), 1, table
+            )
+
+    def test_tables_partitioned(self):
+        """Test the recipe tables are converted."""
+        for table in partitioning.TABLES:
+            self.assertTrue(
+                partitioning.is_partitioned(connection, table.name)
+            )
+
+    def test_list_pruned(self):
+        """Test listing recipes scans one partition."""
+        self._assert_pruned(RECIPES_URL)
+
+    def test_detail_pruned(self):
+        """Test retrieving a recipe scans one partition."""
+        url = reverse('recipe:recipe-detail', args=[self.recipe.id])
+        self._assert_pruned(url)
+
+    def test_filter_pruned(self):
+        """Test filtering by a tag scans one partition of each table."""
+        self._assert_pruned(
+            RECIPES_URL,
+            {'tags': str(self.tag.id)},
+            tables=['core_recipe', 'core_recipe_tags'],
+        )
+
+    def test_ingredient_filter_pruned(self):
+        """Test filtering by an ingredient scans one link partition."""
+        self._assert_pruned(
+            RECIPES_URL,
+            {'ingredients': str(self.salt.id)},
+            tables=['core_recipe', 'core_recipe_ingredients'],
+        )
+
+    def test_links_kept(self):
+        """Test links between recipes and tags work after conversion."""
+        res = self.client.get(RECIPES_URL, {'tags': str(self.tag.id)})
+
+        self.assertEqual([r['id'] for r in res.data], [self.recipe.id])
+
+    def test_link_foreign_keys(self):
+        """Test the links still reference their tags and ingredients."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT conrelid::regclass::text, confrelid::regclass::text
+                FROM pg_constraint
+                WHERE contype = 'f' AND conrelid::regclass::text IN (
+                    'core_recipe_tags', 'core_recipe_ingredients'
+                )
+                """
+            )
+            foreign_keys = set(cursor.fetchall())
+
+        self.assertEqual(foreign_keys, {
+            ('core_recipe_tags', 'core_tag'),
+            ('core_recipe_ingredients', 'core_ingredient'),
+        })
@@ -0,0 +1,146 @@
+"""
+Tests for the sampling profiler.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import profiling
+
+
+PROFILES_URL = reverse('debug:profiles')
+TOKEN_URL = reverse('debug:profile-token')
+
+
+def busy(seconds):
+    """Keep the thread busy in this module for a while."""
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(1000))
+
+
+class ProfilerTests(TestCase):
+    """Test sampling and storing stacks."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PROFILE_DIR=self.directory.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_collapse_keeps_app_frames(self):
+        """Test app frames are kept and library frames folded."""
+        stack = profiling.collapse(sys._getframe())
+
+        self.assertTrue(stack.endswith(
+            'core/tests/test_profiling.py:test_collapse_keeps_app_frames'
+        ))
+        self.assertIn('[python]', stack)
+
+    def test_sampler_stores_stacks(self):
+        """Test the sampled stacks of a thread are stored."""
+        sampler = profiling.Sampler(
+            'test-profile', 0.001, thread_ids={threading.get_ident()}
+        )
+        sampler.start()
+        busy(0.1)
+        sampler.stop()
+
+        self.assertGreater(sampler.samples, 0)
+        with open(profiling.profile_path('test-profile')) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertIn('core/tests/test_profiling.py:busy', lines[0])
+        self.assertTrue(lines[0].rsplit(' ', 1)[1].isdigit())
+
+    def test_invalid_profile_id(self):
+        """Test ids can not point outside the profile directory."""
+        self.assertIsNone(profiling.profile_path('../secrets'))
+
+
+class ProfileApiTests(TestCase):
+    """Test the staff only profiling api."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(PROFILE_DIR=self.directory.name)
+        self.settings.enable()
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_superuser(
+            'admin@example.com', 'testpass123'
+        )
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_staff_required(self):
+        """Test users that are not staff can not profile."""
+        user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(user)
+
+        res = self.client.post(PROFILES_URL, {'seconds': 1})
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_profile_worker(self):
+        """Test a started profile can be downloaded once done."""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.post(PROFILES_URL, {'seconds': 0.2})
+        self.assertEqual(res.status_code, 202)
+        profile_id = res.data['id']
+
+        res = self.client.post(PROFILES_URL, {'seconds': 0.2})
+        self.assertEqual(res.status_code, 409)
+
+        profiling._running.join(5)
+        res = self.client.get(PROFILES_URL)
+        self.assertIn(profile_id, [p['id'] for p in res.data])
+
+        res = self.client.get(reverse('debug:profile', args=[profile_id]))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['Content-Type'], 'text/plain')
+
+    def test_invalid_duration(self):
+        """Test profiles longer than allowed are refused."""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.post(PROFILES_URL, {'seconds': 3600})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_profile_single_request(self):
+        """Test a request with a signed header gets profiled."""
+        self.client.force_authenticate(self.staff)
+        value = self.client.post(TOKEN_URL).data['value']
+
+        res = self.client.get(
+            reverse('recipe:recipe-list'), HTTP_X_PROFILE=value
+        )
+
+        profile_id = res['X-Profile-Id']
+        self.assertTrue(os.path.exists(profiling.profile_path(profile_id)))
+
+    def test_unsigned_header_ignored(self):
+        """Test a header without a valid signature is ignored."""
+        self.client.force_authenticate(self.staff)
+
+        res = self.client.get(
+            reverse('recipe:recipe-list'), HTTP_X_PROFILE='forged'
+        )
+
+        self.assertNotIn('X-Profile-Id', res)
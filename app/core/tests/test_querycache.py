@@ -0,0 +1,142 @@
+"""
+Tests for the query result cache.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import querycache
+from core.models import Recipe, Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class QueryCacheTests(TestCase):
+    """Test caching and invalidating query results."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        # as if the rows above were committed
+        querycache.reset()
+
+    def tags(self):
+        return list(
+            Tag.objects.filter(user=self.user).order_by('id').cached()
+        )
+
+    def test_results_cached(self):
+        """Test a cached queryset runs its query once."""
+        self.tags()
+
+        with self.assertNumQueries(0):
+            tags = self.tags()
+
+        self.assertEqual(tags, [self.tag])
+
+    def test_opt_in(self):
+        """Test querysets are not cached without cached()."""
+        list(Tag.objects.filter(user=self.user))
+
+        with self.assertNumQueries(1):
+            list(Tag.objects.filter(user=self.user))
+
+    def test_committed_write_invalidates(self):
+        """Test a committed write to a table misses its results."""
+        self.tags()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.filter(id=self.tag.id).update(name='Vegetarian')
+
+        self.assertEqual(self.tags()[0].name, 'Vegetarian')
+
+    def test_uncommitted_write_skips_cache(self):
+        """Test the writing transaction reads its own rows."""
+        self.tags()
+
+        Tag.objects.filter(id=self.tag.id).update(name='Vegetarian')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tags()[0].name, 'Vegetarian')
+
+    def test_link_table_write_invalidates(self):
+        """Test adding a m2m link misses results joining the links."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5,
+            price=Decimal('1.00'),
+        )
+        querycache.reset()
+        assigned = Tag.objects.filter(recipe__isnull=False).cached()
+        self.assertEqual(list(assigned), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(self.tag)
+
+        self.assertEqual(list(assigned.all()), [self.tag])
+
+    def test_written_tables(self):
+        """Test the tables written by statements are found."""
+        self.assertEqual(
+            querycache.written_tables('INSERT INTO "core_tag" ("name")'),
+            ['core_tag'],
+        )
+        self.assertEqual(
+            querycache.written_tables('UPDATE "core_recipe" SET "x" = 1'),
+            ['core_recipe'],
+        )
+        self.assertEqual(
+            querycache.written_tables(
+                'DELETE FROM "core_recipe_tags" WHERE "id" IN (1)'
+            ),
+            ['core_recipe_tags'],
+        )
+        self.assertEqual(
+            querycache.written_tables('TRUNCATE "core_tag", "core_user";'),
+            ['core_tag', 'core_user'],
+        )
+        self.assertEqual(
+            querycache.written_tables('SELECT "id" FROM "core_tag"'), []
+        )
+
+    @override_settings(QUERY_CACHE_TIMEOUT=0)
+    def test_turned_off(self):
+        """Test nothing is cached with a timeout of 0."""
+        self.tags()
+
+        with self.assertNumQueries(1):
+            self.tags()
+
+
+class CachedListApiTests(TestCase):
+    """Test the list endpoints read through the query cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        querycache.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_tag_list_cached(self):
+        """Test listing tags again runs fewer queries."""
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(TAGS_URL)
+        with CaptureQueriesContext(connection) as second:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+        self.assertLess(len(second), len(first))
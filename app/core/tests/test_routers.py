@@ -0,0 +1,114 @@
+"""
+Tests for the read replica router.
+"""
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends import locmem
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, override_settings
+
+from core import routers
+from core.middleware import ReplicaRoutingMiddleware
+from core.models import Recipe
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+@patch('core.routers._replica_lag', return_value=0)
+class ReplicaRouterTests(SimpleTestCase):
+    """Test routing reads to replicas."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = routers.ReplicaRouter()
+        routers._lag_cache.clear()
+        caches['shared'].clear()
+
+    def _route(self, request, write=False):
+        """Run a request through the middleware and return the read db."""
+        used = {}
+
+        def view(request):
+            used['db'] = self.router.db_for_read(Recipe)
+            if write:
+                self.router.db_for_write(Recipe)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        return used['db']
+
+    def test_safe_request_reads_from_replica(self, patched_lag):
+        """Test GET requests read from a replica."""
+        request = self.factory.get('/', HTTP_AUTHORIZATION='Token abc')
+
+        self.assertEqual(self._route(request), 'replica_0')
+
+    def test_unsafe_request_reads_from_primary(self, patched_lag):
+        """Test POST requests read from the primary."""
+        request = self.factory.post('/', HTTP_AUTHORIZATION='Token abc')
+
+        self.assertIsNone(self._route(request))
+
+    def test_client_pinned_after_write(self, patched_lag):
+        """Test a client reads its own writes from the primary."""
+        self._route(
+            self.factory.post('/', HTTP_AUTHORIZATION='Token abc'),
+            write=True,
+        )
+
+        pinned = self.factory.get('/', HTTP_AUTHORIZATION='Token abc')
+        other = self.factory.get('/', HTTP_AUTHORIZATION='Token xyz')
+        self.assertIsNone(self._route(pinned))
+        self.assertEqual(self._route(other), 'replica_0')
+
+    def test_client_pinned_on_other_workers(self, patched_lag):
+        """Test a pin is seen by workers with the production caches."""
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        production = {
+            **settings.CACHES,
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location.name,
+            },
+        }
+        used = {}
+
+        def other_worker():
+            # nothing of the memory of this worker, only what it shares
+            with patch.dict(locmem._caches, clear=True):
+                used['db'] = self._route(
+                    self.factory.get('/', HTTP_AUTHORIZATION='Token abc')
+                )
+
+        with override_settings(CACHES=production):
+            self._route(
+                self.factory.post('/', HTTP_AUTHORIZATION='Token abc'),
+                write=True,
+            )
+            worker = threading.Thread(target=other_worker)
+            worker.start()
+            worker.join()
+
+        self.assertIsNone(used['db'])
+
+    @override_settings(DATABASE_REPLICA_MAX_LAG=2)
+    def test_lagging_replica_falls_back_to_primary(self, patched_lag):
+        """Test a replica lagging too far behind is not used."""
+        patched_lag.return_value = 10
+        request = self.factory.get('/', HTTP_AUTHORIZATION='Token abc')
+
+        self.assertEqual(self._route(request), 'default')
+
+    def test_no_request_reads_from_primary(self, patched_lag):
+        """Test reads outside of a request are not routed to replicas."""
+        self.assertIsNone(self.router.db_for_read(Recipe))
+
+    def test_replicas_not_migrated(self, patched_lag):
+        """Test migrations only run on the primary."""
+        self.assertFalse(self.router.allow_migrate('replica_0', 'core'))
+        self.assertIsNone(self.router.allow_migrate('default', 'core'))
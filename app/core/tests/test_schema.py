@@ -0,0 +1,80 @@
+"""
+Tests for the pre-generated OpenAPI schema.
+"""
+import gzip
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from drf_spectacular.views import SpectacularAPIView
+
+from core import schema
+
+
+SCHEMA_URL = reverse('api-schema')
+JSON_TYPE = 'application/vnd.oai.openapi+json'
+
+
+class SchemaTests(TestCase):
+    """Test serving the cached schema."""
+
+    def setUp(self):
+        schema.reset()
+
+    def tearDown(self):
+        schema.reset()
+
+    def test_cached_schema_matches_live_generation(self):
+        """Test the served schema is the one generated per request."""
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT=JSON_TYPE)
+
+        live = SpectacularAPIView.as_view()(
+            RequestFactory().get(SCHEMA_URL, HTTP_ACCEPT=JSON_TYPE)
+        )
+        live.render()
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.content), json.loads(live.content))
+
+    def test_yaml_is_default(self):
+        """Test the schema is served as yaml without an accept header."""
+        res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res['Content-Type'], 'application/vnd.oai.openapi')
+        self.assertTrue(res.content.startswith(b'openapi:'))
+
+    def test_etag_not_modified(self):
+        """Test a request with the current etag gets a 304."""
+        res = self.client.get(SCHEMA_URL)
+        self.assertIn('max-age', res['Cache-Control'])
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+
+    def test_gzip_served_when_accepted(self):
+        """Test the compressed schema is served as it is stored."""
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertTrue(
+            gzip.decompress(res.content).startswith(b'openapi:')
+        )
+
+    def test_generate_schema_command(self):
+        """Test the command writes the files that are then served."""
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('generate_schema', directory=directory)
+            path = schema.file_path(directory, 'json')
+            self.assertTrue(os.path.exists(path))
+            with open(path, 'rb') as f:
+                stored = gzip.decompress(f.read())
+
+            with override_settings(OPENAPI_SCHEMA_DIR=directory):
+                res = self.client.get(SCHEMA_URL, HTTP_ACCEPT=JSON_TYPE)
+
+        self.assertEqual(res.content, stored)
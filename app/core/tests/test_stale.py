@@ -0,0 +1,152 @@
+"""
+Tests for serving stale lists while the database fails.
+"""
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import stale
+from core.models import Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+LIST_DATA = 'recipe.views.TagViewSet.list_data'
+
+
+def fail():
+    raise OperationalError('canceling statement due to statement timeout')
+
+
+class StaleListTests(TestCase):
+    """Test the tag list falls back to the last good response."""
+
+    def setUp(self):
+        cache.clear()
+        stale.relieve()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        stale.relieve()
+
+    @patch('core.stale.refresh_in_background')
+    def test_kept_response_served_on_failure(self, refresh):
+        """Test the last good list is served when the database fails."""
+        self.client.get(TAGS_URL)
+
+        with patch(LIST_DATA, side_effect=fail):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+        self.assertIn('111', res['Warning'])
+        self.assertIn('Age', res)
+        refresh.assert_called_once()
+        self.assertTrue(stale.under_pressure())
+
+    def test_failure_without_kept_response(self):
+        """Test the failure goes on without a kept response."""
+        with patch(LIST_DATA, side_effect=fail):
+            with self.assertRaises(OperationalError):
+                self.client.get(TAGS_URL)
+
+    @patch('core.stale.refresh_in_background')
+    def test_too_old_response_not_served(self, refresh):
+        """Test a response older than LIST_STALE_MAX_AGE is not served."""
+        self.client.get(TAGS_URL)
+
+        later = time.time() + 3600
+        with patch(LIST_DATA, side_effect=fail), \
+                patch('core.stale.time.time', return_value=later):
+            with self.assertRaises(OperationalError):
+                self.client.get(TAGS_URL)
+
+    @patch('core.stale.refresh_in_background')
+    def test_served_right_away_under_pressure(self, refresh):
+        """Test a worker under pressure does not wait on the database."""
+        self.client.get(TAGS_URL)
+        stale.pressure()
+
+        with patch(LIST_DATA) as list_data:
+            res = self.client.get(TAGS_URL)
+
+        list_data.assert_not_called()
+        self.assertIn('110', res['Warning'])
+        refresh.assert_called_once()
+
+    def test_kept_list_not_rewritten(self):
+        """Test a recently kept list is not written again."""
+        self.client.get(TAGS_URL)
+
+        with patch('core.stale.keep') as keep:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        keep.assert_not_called()
+
+    @override_settings(LIST_STALE_KEEP_INTERVAL=0)
+    def test_old_kept_list_rewritten(self):
+        """Test a list kept longer than the interval ago is rewritten."""
+        self.client.get(TAGS_URL)
+
+        with patch('core.stale.keep') as keep:
+            self.client.get(TAGS_URL)
+
+        keep.assert_called_once()
+
+    def test_other_users_not_served(self):
+        """Test kept lists are per user."""
+        self.client.get(TAGS_URL)
+        other = get_user_model().objects.create_user(
+            'other@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(other)
+
+        with patch(LIST_DATA, side_effect=fail):
+            with self.assertRaises(OperationalError):
+                self.client.get(TAGS_URL)
+
+
+class RefreshTests(TestCase):
+    """Test refreshing kept lists."""
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        stale.relieve()
+
+    @patch('core.stale.threading.Thread')
+    def test_one_refresh_at_a_time(self, thread):
+        """Test a list is only refreshed by one thread at a time."""
+        self.assertTrue(stale.refresh_in_background('key', list))
+        self.assertFalse(stale.refresh_in_background('key', list))
+
+        thread.assert_called_once()
+
+    def test_refresh_ends_pressure(self):
+        """Test a successful refresh keeps the data and ends pressure."""
+        stale.pressure()
+
+        self.assertTrue(stale.refresh('key', lambda: ['fresh']))
+
+        self.assertEqual(stale.get('key')[1], ['fresh'])
+        self.assertFalse(stale.under_pressure())
+
+    def test_failed_refresh(self):
+        """Test a failed refresh leaves the worker under pressure."""
+        self.assertFalse(stale.refresh('key', fail))
+
+        self.assertIsNone(stale.get('key'))
+        self.assertTrue(stale.under_pressure())
@@ -0,0 +1,119 @@
+"""
+Tests for the token bucket throttle.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import throttling
+from core.models import Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def rates(**scopes):
+    """Return REST_FRAMEWORK settings with the given throttle rates."""
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': scopes}
+
+
+class ThrottleTests(TestCase):
+    """Test throttling API requests."""
+
+    def setUp(self):
+        throttling.reset()
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        throttling.reset()
+
+    @override_settings(REST_FRAMEWORK=rates(read='2/min', write='100/min'))
+    def test_reads_throttled(self):
+        """Test reads over the rate are rejected with Retry-After."""
+        for _ in range(2):
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    @override_settings(REST_FRAMEWORK=rates(read='1/min', write='100/min'))
+    def test_scopes_separate(self):
+        """Test running out of reads does not block writes."""
+        self.client.get(RECIPES_URL)
+        self.assertEqual(
+            self.client.get(RECIPES_URL).status_code,
+            status.HTTP_429_TOO_MANY_REQUESTS,
+        )
+
+        res = self.client.post(
+            RECIPES_URL,
+            {'title': 'recipe', 'time_minutes': 5, 'price': '1.00'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(
+        REST_FRAMEWORK=rates(read='100/min', write='100/min', upload='1/min')
+    )
+    def test_uploads_throttled(self):
+        """Test image uploads are counted against the upload rate."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='recipe', time_minutes=5, price='1.00'
+        )
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+        self.client.post(url, {'image': 'not an image'}, format='multipart')
+
+        res = self.client.post(
+            url, {'image': 'not an image'}, format='multipart'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(
+            self.client.post(
+                RECIPES_URL,
+                {'title': 'recipe', 'time_minutes': 5, 'price': '1.00'},
+            ).status_code,
+            status.HTTP_201_CREATED,
+        )
+
+    @override_settings(REST_FRAMEWORK=rates(login='1/min'))
+    def test_login_attempts_throttled(self):
+        """Test token creation has its own per client limit."""
+        client = APIClient()
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        client.post(TOKEN_URL, payload)
+
+        res = client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(
+        REST_FRAMEWORK=rates(read='5/min'), THROTTLE_SYNC_INTERVAL=0
+    )
+    def test_usage_of_other_workers_counted(self):
+        """Test usage shared through the cache limits this worker."""
+        self.client.get(RECIPES_URL)
+
+        # another worker let 4 more requests of this client through
+        key = f'throttle:read:user:{self.user.pk}:{int(time.time() // 60)}'
+        cache.incr(key, 4)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
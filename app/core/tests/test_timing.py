@@ -0,0 +1,63 @@
+"""
+Tests for request timing.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import timing
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+@override_settings(REQUEST_TIMING=True, SLOW_REQUEST_SAMPLE_RATE=1.0)
+class TimingTests(TestCase):
+    """Test the Server-Timing header and slow request log."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@example.com', 'testpass123'
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=60000)
+    def test_server_timing_header(self):
+        """Test the phases of a request are in the Server-Timing header."""
+        res = self.client.get(RECIPES_URL)
+
+        header = res['Server-Timing']
+        for phase in ('auth', 'serialize', 'render', 'db', 'total'):
+            self.assertIn(f'{phase};dur=', header)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_logged(self):
+        """Test slow requests are logged with their queries."""
+        with self.assertLogs('core.timing', 'WARNING') as logs:
+            self.client.get(RECIPES_URL)
+
+        record = json.loads(logs.records[0].args[0])
+        self.assertEqual(record['view'], 'RecipeViewSet')
+        self.assertEqual(record['action'], 'list')
+        self.assertGreater(record['query_count'], 0)
+        self.assertIn('core_recipe', record['queries'][0]['sql'])
+        self.assertTrue(record['queries'][0]['call_site'])
+
+    @override_settings(REQUEST_TIMING=False)
+    def test_timing_disabled(self):
+        """Test nothing is added when timing is disabled."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertFalse(res.has_header('Server-Timing'))
+
+    def test_fingerprint_collapses_lists(self):
+        """Test IN lists of any length get the same fingerprint."""
+        self.assertEqual(
+            timing.fingerprint('SELECT 1 WHERE id IN (%s, %s)'),
+            timing.fingerprint('SELECT 1 WHERE id IN (%s)'),
+        )
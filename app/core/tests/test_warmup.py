@@ -0,0 +1,70 @@
+"""
+Tests for the worker warm-up.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from core import schema, warmup
+
+
+IMPORT_TIME_OUTPUT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2100 |       5300 |     django.db
+import time:       900 |       9000 |   django
+"""
+
+
+class WarmupTests(TestCase):
+    """Test warming up a worker."""
+
+    def tearDown(self):
+        schema.reset()
+
+    def test_run_all_steps(self):
+        """Test every warm-up step runs without errors."""
+        report = warmup.run()
+
+        self.assertEqual(list(report), [name for name, _ in warmup.STEPS])
+        for step in report.values():
+            self.assertNotIn('error', step)
+
+    def test_failing_step_reported(self):
+        """Test a failing step is reported and the others still run."""
+
+        def fail():
+            raise RuntimeError('no luck')
+
+        steps = warmup.STEPS
+        warmup.STEPS = [('failing', fail)] + steps
+        try:
+            report = warmup.run()
+        finally:
+            warmup.STEPS = steps
+
+        self.assertEqual(report['failing']['error'], 'no luck')
+        self.assertIn('urls', report)
+
+    def test_warmup_command(self):
+        """Test the command reports the steps."""
+        out = StringIO()
+        call_command('warmup', stdout=out)
+
+        self.assertIn('serializers:', out.getvalue())
+        self.assertIn('Warm-up done.', out.getvalue())
+
+
+class ImportProfileTests(SimpleTestCase):
+    """Test reading the output of python -X importtime."""
+
+    def test_parse_import_times(self):
+        """Test the times and nesting of the imports are parsed."""
+        entries = warmup.parse_import_times(IMPORT_TIME_OUTPUT)
+
+        self.assertEqual(entries, [
+            (0.12, 0.12, 1, '_io'),
+            (5.3, 2.1, 2, 'django.db'),
+            (9.0, 0.9, 1, 'django'),
+        ])
@@ -0,0 +1,136 @@
+"""
+Token bucket throttling kept in process memory.
+
+Every worker keeps its own buckets, so checking a request costs no
+network round trip. Once per THROTTLE_SYNC_INTERVAL a bucket adds the
+requests it let through to a counter in the shared cache and takes
+back what the other workers used, so a client can not get the full
+rate from every worker.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+# key -> Bucket, shared by the threads of the worker
+_buckets = {}
+MAX_BUCKETS = 100000
+
+
+class Bucket:
+    """Tokens of one client and scope in this worker."""
+
+    __slots__ = ('tokens', 'updated', 'synced', 'pending')
+
+    def __init__(self, capacity, now):
+        self.tokens = float(capacity)
+        self.updated = now
+        self.synced = now
+        self.pending = 0
+
+    def refill(self, capacity, per_second, now):
+        self.tokens = min(
+            capacity, self.tokens + (now - self.updated) * per_second
+        )
+        self.updated = now
+
+
+def parse_rate(rate):
+    """Return (requests, seconds) of a rate like '10/min'."""
+    num, period = rate.split('/')
+    duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return int(num), duration
+
+
+def reset():
+    """Forget all the buckets of this worker."""
+    _buckets.clear()
+
+
+def _prune(now):
+    """Drop the buckets that are full again anyway."""
+    for key, bucket in list(_buckets.items()):
+        if now - bucket.updated > 3600:
+            _buckets.pop(key, None)
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """Throttle requests per client with separate read/write scopes.
+
+    Views can set throttle_scope to use another scope, like the
+    upload and login scopes.
+    """
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def get_rate(self, scope):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+
+    def get_ident_key(self, request, scope):
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{scope}:{ident}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = self.get_rate(scope)
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        per_second = capacity / period
+        key = self.get_ident_key(request, scope)
+        now = time.monotonic()
+
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if len(_buckets) >= MAX_BUCKETS:
+                _prune(now)
+            bucket = _buckets.setdefault(key, Bucket(capacity, now))
+
+        # a race between threads of this worker can only let a
+        # request or two more through, so there is no lock here
+        bucket.refill(capacity, per_second, now)
+        if now - bucket.synced >= settings.THROTTLE_SYNC_INTERVAL:
+            self._sync(key, bucket, capacity, period, now)
+
+        self.wait_seconds = 0
+        if bucket.tokens < 1:
+            self.wait_seconds = (1 - bucket.tokens) / per_second
+            return False
+
+        bucket.tokens -= 1
+        bucket.pending += 1
+        return True
+
+    def _sync(self, key, bucket, capacity, period, now):
+        """Share the usage of this worker through the cache."""
+        window = int(time.time() // period)
+        shared_key = f'{key}:{window}'
+        pending, bucket.pending = bucket.pending, 0
+        bucket.synced = now
+
+        cache.add(shared_key, 0, period * 2)
+        try:
+            used = cache.incr(shared_key, pending)
+        except ValueError:
+            # the key expired between add and incr
+            cache.set(shared_key, pending, period * 2)
+            used = pending
+
+        # what everybody used in this window is gone for us as well
+        bucket.tokens = min(bucket.tokens, max(0, capacity - used))
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
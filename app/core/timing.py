@@ -0,0 +1,225 @@
+"""
+Per request timing of the auth, db, serialization and render phases.
+
+Enabled with the REQUEST_TIMING setting. TimingMiddleware starts a
+RequestTimer for every request and TimedViewMixin marks the phases
+of the DRF views.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+from asgiref.local import Local
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_state = Local()
+
+# the packages of this project, used to find where a query came from
+APP_DIRS = tuple(
+    os.path.join(str(settings.BASE_DIR), app) + os.sep
+    for app in ('recipe', 'user', 'core')
+)
+# frames that are part of the instrumentation or of the orm itself
+SKIPPED_FILES = (
+    __file__,
+    os.path.join(str(settings.BASE_DIR), 'core', 'middleware.py'),
+)
+DJANGO_DB_DIR = os.path.join('django', 'db') + os.sep
+
+PLACEHOLDER_LIST = re.compile(r'\(\s*%s(\s*,\s*%s)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Return the sql with lists of placeholders collapsed.
+
+    Queries from the orm already have %s placeholders instead of
+    values, so only IN lists and bulk inserts differ between runs.
+    """
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()[:300]
+
+
+def call_site():
+    """Return file:line of the code that made the current query.
+
+    The innermost frame in our apps wins, otherwise the innermost
+    frame outside of the orm, like a DRF serializer.
+    """
+    library_frame = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename in SKIPPED_FILES or DJANGO_DB_DIR in filename:
+            frame = frame.f_back
+            continue
+        in_app = filename.startswith(APP_DIRS)
+        if in_app and os.sep + 'tests' + os.sep not in filename:
+            return _describe(frame)
+        if library_frame is None:
+            library_frame = frame
+        frame = frame.f_back
+
+    return _describe(library_frame) if library_frame else ''
+
+
+def _describe(frame):
+    """Return a short description of a frame."""
+    filename = frame.f_code.co_filename
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f'{filename}:{frame.f_lineno} {frame.f_code.co_name}'
+
+
+class RequestTimer:
+    """Collects the timings of one request."""
+
+    def __init__(self):
+        self.phases = {}
+        self.db_time = 0.0
+        self.query_count = 0
+        self.queries = {}
+        self._starts = {}
+
+    def start(self, phase):
+        self._starts[phase] = (time.perf_counter(), self.db_time)
+
+    def stop(self, phase, exclude_db=False):
+        """Stop a phase, optionally leaving out the db time spent in it."""
+        started = self._starts.pop(phase, None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started[0]
+        if exclude_db:
+            duration -= self.db_time - started[1]
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper recording every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            self.query_count += 1
+
+            key = fingerprint(sql)
+            entry = self.queries.get(key)
+            if entry is None:
+                entry = self.queries[key] = {
+                    'sql': key,
+                    'count': 0,
+                    'ms': 0.0,
+                    'call_site': call_site(),
+                }
+            entry['count'] += 1
+            entry['ms'] += duration * 1000
+
+    def server_timing(self, total):
+        """Return the value of the Server-Timing header."""
+        parts = [
+            f'{phase};dur={duration * 1000:.1f}'
+            for phase, duration in self.phases.items()
+        ]
+        parts.append(
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{self.query_count} queries"'
+        )
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+    def record(self, request, response, total):
+        """Return a structured record of the request."""
+        queries = sorted(
+            self.queries.values(), key=lambda q: q['ms'], reverse=True
+        )
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request, '_metrics_labels', ('', ''))[0],
+            'action': getattr(request, '_metrics_labels', ('', ''))[1],
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'phases_ms': {
+                phase: round(duration * 1000, 1)
+                for phase, duration in self.phases.items()
+            },
+            'db_ms': round(self.db_time * 1000, 1),
+            'query_count': self.query_count,
+            'queries': [
+                {**query, 'ms': round(query['ms'], 1)}
+                for query in queries[:10]
+            ],
+        }
+
+    def log_if_slow(self, request, response, total):
+        """Write a sampled log record when the request was slow."""
+        threshold = settings.SLOW_REQUEST_THRESHOLD_MS / 1000
+        if total < threshold:
+            return
+        if random.random() >= settings.SLOW_REQUEST_SAMPLE_RATE:
+            return
+
+        record = self.record(request, response, total)
+        logger.warning('slow request %s', json.dumps(record))
+
+
+def begin():
+    """Start timing the current request."""
+    _state.timer = RequestTimer()
+    return _state.timer
+
+
+def end():
+    """Stop timing the current request."""
+    _state.timer = None
+
+
+def current():
+    """Return the timer of the current request, if it is timed."""
+    return getattr(_state, 'timer', None)
+
+
+class TimedViewMixin:
+    """Mark the auth, serialization and render phases of a DRF view."""
+
+    def initial(self, request, *args, **kwargs):
+        timer = current()
+        if timer is None:
+            return super().initial(request, *args, **kwargs)
+
+        # authentication, permission and throttling checks
+        timer.start('auth')
+        try:
+            super().initial(request, *args, **kwargs)
+        finally:
+            timer.stop('auth')
+
+        # the handler time outside of the database is mostly
+        # spent turning objects into primitives in serializers
+        timer.start('serialize')
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        timer = current()
+        if timer is not None and hasattr(response, 'add_post_render_callback'):
+            timer.stop('serialize', exclude_db=True)
+            timer.start('render')
+            response.add_post_render_callback(
+                lambda rendered: timer.stop('render')
+            )
+        return response
@@ -0,0 +1,33 @@
+"""
+URL mappings for the staff only debug API.
+"""
+from django.urls import path
+
+from core import views
+
+app_name = 'debug'
+
+urlpatterns = [
+    path('profiles/', views.ProfileListView.as_view(), name='profiles'),
+    path(
+        'profiles/token/',
+        views.ProfileTokenView.as_view(),
+        name='profile-token',
+    ),
+    path(
+        'profiles/<str:profile_id>/',
+        views.ProfileDetailView.as_view(),
+        name='profile',
+    ),
+    path('memory/', views.MemoryView.as_view(), name='memory'),
+    path(
+        'memory/snapshots/',
+        views.SnapshotListView.as_view(),
+        name='snapshots',
+    ),
+    path(
+        'memory/snapshots/<str:snapshot_id>/',
+        views.SnapshotDetailView.as_view(),
+        name='snapshot',
+    ),
+]
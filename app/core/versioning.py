@@ -0,0 +1,66 @@
+"""
+Optimistic concurrency control of updates.
+
+A versioned model has a version column, bumped by every update with a
+conditional UPDATE ... SET version = version + 1 WHERE version = ?.
+A client that read version 3, sent as If-Match: "3" or as the version
+field, only changes the row while it still is at version 3. Otherwise
+nothing is written and it gets a 412, so concurrent edits from two
+devices do not clobber each other and no row is locked while the
+client edits.
+"""
+from django.db.models import F
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The object was changed since it was read.'
+    default_code = 'precondition_failed'
+
+
+def etag(version):
+    """Return the ETag of a version."""
+    return f'"{version}"'
+
+
+def if_match(request):
+    """Return the versions an If-Match header accepts.
+
+    None means any version, without the header or with *. Weak and
+    malformed tags match no version.
+    """
+    value = request.META.get('HTTP_IF_MATCH')
+    if not value or value.strip() == '*':
+        return None
+    versions = set()
+    for tag in parse_etags(value):
+        if tag.startswith('"') and tag[1:-1].isdigit():
+            versions.add(int(tag[1:-1]))
+    return versions
+
+
+def claim(instance, versions=None):
+    """Bump the version of an instance if it is one of versions.
+
+    Raises PreconditionFailed if it was at another version. The row
+    stays locked by the UPDATE until the transaction ends, so a
+    concurrent claim of the same version waits and then fails.
+    Returns the new version, set on the instance as well.
+    """
+    rows = type(instance)._base_manager.filter(pk=instance.pk)
+    if versions is not None:
+        rows = rows.filter(version__in=versions)
+    if not rows.update(version=F('version') + 1):
+        raise PreconditionFailed
+
+    if versions is not None and len(versions) == 1:
+        instance.version = next(iter(versions)) + 1
+    else:
+        instance.version = type(instance)._base_manager.filter(
+            pk=instance.pk
+        ).values_list('version', flat=True).get()
+    return instance.version
@@ -0,0 +1,201 @@
+"""
+Views for the core app.
+"""
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden
+
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+from prometheus_client import CONTENT_TYPE_LATEST
+from rest_framework import status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import metrics as core_metrics
+from core import memory, profiling, schema
+
+
+def metrics(request):
+    """Expose the prometheus metrics of the server."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        auth = request.META.get('HTTP_AUTHORIZATION', '')
+        if auth != f'Bearer {token}':
+            return HttpResponseForbidden()
+
+    return HttpResponse(
+        core_metrics.render(), content_type=CONTENT_TYPE_LATEST
+    )
+
+
+class SchemaView(SpectacularAPIView):
+    """Serve the pre-generated OpenAPI schema."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        # other languages are rare enough to be generated live
+        if settings.USE_I18N and request.GET.get('lang'):
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        return schema.response(request, renderer.format, renderer.media_type)
+
+
+class DebugView(APIView):
+    """Base view of the staff only debug api of a worker."""
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAdminUser]
+
+
+class ProfileListView(DebugView):
+    """List the stored profiles or start profiling this worker."""
+
+    @extend_schema(exclude=True)
+    def get(self, request):
+        return Response(profiling.list_profiles())
+
+    @extend_schema(exclude=True)
+    def post(self, request):
+        try:
+            seconds = float(request.data.get('seconds', 10))
+            interval_ms = float(request.data.get('interval_ms', 10))
+        except (TypeError, ValueError):
+            seconds = interval_ms = 0
+        if not 0 < seconds <= settings.PROFILE_MAX_SECONDS or interval_ms < 1:
+            return Response(
+                {'detail': 'seconds must be between 0 and '
+                           f'{settings.PROFILE_MAX_SECONDS}, interval_ms '
+                           'at least 1.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            profile_id = profiling.start(seconds, interval_ms / 1000)
+        except profiling.ProfilerBusy:
+            return Response(
+                {'detail': 'This worker is already being profiled.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {'id': profile_id, 'pid': os.getpid(), 'seconds': seconds},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class ProfileDetailView(DebugView):
+    """Download the collapsed stacks of a finished profile."""
+
+    @extend_schema(exclude=True)
+    def get(self, request, profile_id):
+        path = profiling.profile_path(profile_id)
+        if path is None or not os.path.exists(path):
+            raise NotFound('No such profile, or it is still running.')
+        return FileResponse(
+            open(path, 'rb'),
+            as_attachment=True,
+            filename=os.path.basename(path),
+            content_type='text/plain',
+        )
+
+
+class ProfileTokenView(DebugView):
+    """Return a signed X-Profile header value to profile one request."""
+
+    @extend_schema(exclude=True)
+    def post(self, request):
+        return Response({
+            'header': profiling.HEADER,
+            'value': profiling.sign(),
+            'max_age': settings.PROFILE_TOKEN_MAX_AGE,
+        })
+
+
+class MemoryView(DebugView):
+    """Show the memory use of this worker, turn tracing on or off."""
+
+    @extend_schema(exclude=True)
+    def get(self, request):
+        return Response(memory.status())
+
+    @extend_schema(exclude=True)
+    def post(self, request):
+        if request.data.get('trace') in (True, 'true', '1', 1):
+            try:
+                frames = int(request.data.get('frames', 25))
+            except (TypeError, ValueError):
+                frames = 0
+            if not 1 <= frames <= 100:
+                return Response(
+                    {'detail': 'frames must be between 1 and 100.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            memory.start(frames)
+        else:
+            memory.stop()
+        return Response(memory.status())
+
+
+class SnapshotListView(DebugView):
+    """List the stored snapshots or take one in this worker."""
+
+    @extend_schema(exclude=True)
+    def get(self, request):
+        return Response(memory.list_snapshots())
+
+    @extend_schema(exclude=True)
+    def post(self, request):
+        if not memory.status()['tracing']:
+            return Response(
+                {'detail': 'Tracing is off in this worker.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        snapshot_id, snapshot = memory.take_snapshot()
+        return Response(
+            {
+                'id': snapshot_id,
+                **memory.status(),
+                'sites': memory.top_sites(snapshot),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class SnapshotDetailView(DebugView):
+    """Show the top allocation sites of a snapshot.
+
+    With ?base=<id> the growth since that snapshot is shown instead,
+    ?group=file groups the sites by file and ?limit= sets how many.
+    """
+
+    def _load(self, snapshot_id):
+        snapshot = memory.load_snapshot(snapshot_id)
+        if snapshot is None:
+            raise NotFound(f'No snapshot {snapshot_id}.')
+        return snapshot
+
+    @extend_schema(exclude=True)
+    def get(self, request, snapshot_id):
+        snapshot = self._load(snapshot_id)
+        base_id = request.query_params.get('base')
+        base = self._load(base_id) if base_id else None
+        group = request.query_params.get('group', 'line')
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+
+        return Response({
+            'id': snapshot_id,
+            'base': base_id,
+            'sites': memory.top_sites(
+                snapshot,
+                base=base,
+                group='file' if group == 'file' else 'line',
+                limit=limit,
+            ),
+        })
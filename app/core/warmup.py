@@ -0,0 +1,180 @@
+"""
+Warm-up of a new worker before it serves requests.
+
+Django and DRF build a lot lazily on the first request: the url
+resolvers, the fields of the serializers, the DRF setting classes,
+the OpenAPI schema and the Pillow plugins. The wsgi and asgi entry
+points build them here instead, when the WARMUP setting is on, so the
+first requests of a worker are as fast as the others.
+
+The steps only build python objects. A preforking server imports the
+entry points once before forking, and its workers share what was built
+there. Database connections are not opened here. A connection opened
+before the fork would be shared by every worker, and under asgi it
+would belong to the thread of the event loop.
+"""
+import io
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from decimal import Decimal
+
+from PIL import Image
+
+from django.conf import settings
+from django.urls import URLResolver, get_resolver
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from core import schema
+from recipe import serializers as recipe_serializers
+from user import serializers as user_serializers
+
+
+logger = logging.getLogger(__name__)
+
+DRF_SETTINGS = [
+    'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES',
+    'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_THROTTLE_CLASSES',
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_SCHEMA_CLASS',
+]
+
+
+def _urls():
+    """Compile the url patterns and build the reverse lookups."""
+
+    def walk(resolver):
+        resolver.reverse_dict
+        for pattern in resolver.url_patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern)
+
+    walk(get_resolver())
+
+
+def _drf():
+    """Import the classes DRF loads from its settings on first use."""
+    for name in DRF_SETTINGS:
+        getattr(api_settings, name)
+    JSONRenderer().render({'warm': ['up', Decimal('1.00')]})
+
+
+def _serializers():
+    """Build the fields of every serializer of the api."""
+    for module in (recipe_serializers, user_serializers):
+        for obj in vars(module).values():
+            if (
+                isinstance(obj, type)
+                and issubclass(obj, BaseSerializer)
+                and obj.__module__ == module.__name__
+            ):
+                obj().fields
+
+
+def _schema():
+    """Generate or load the OpenAPI schema."""
+    schema.get('yaml')
+
+
+def _pillow():
+    """Register the Pillow plugins and load the jpeg encoder."""
+    Image.init()
+    Image.new('RGB', (8, 8)).save(io.BytesIO(), format='JPEG')
+
+
+STEPS = [
+    ('urls', _urls),
+    ('drf', _drf),
+    ('serializers', _serializers),
+    ('schema', _schema),
+    ('pillow', _pillow),
+]
+
+
+def run():
+    """Run the warm-up steps and return a report of each one.
+
+    A failing step is logged and reported, a worker that could not
+    warm up still works, only slower at first.
+    """
+    report = {}
+    for name, step in STEPS:
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as exc:
+            logger.warning('warm-up step %s failed', name, exc_info=True)
+            error = str(exc)
+
+        report[name] = {
+            'ms': round((time.perf_counter() - start) * 1000, 1),
+            'modules_imported': len(sys.modules) - modules,
+        }
+        if error:
+            report[name]['error'] = error
+    return report
+
+
+def on_startup():
+    """Warm up the worker if WARMUP is on, called by the entry points."""
+    if not settings.WARMUP:
+        return
+    start = time.perf_counter()
+    report = run()
+    logger.info(
+        'worker warmed up in %.1fms %s',
+        (time.perf_counter() - start) * 1000,
+        json.dumps(report),
+    )
+
+
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_import_times(output):
+    """Return (cumulative ms, self ms, depth, module) of -X importtime."""
+    entries = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            entries.append((
+                int(cumulative) / 1000,
+                int(own) / 1000,
+                (len(indent) - 1) // 2,
+                module,
+            ))
+    return entries
+
+
+def import_profile(module='app.wsgi', top=20):
+    """Return the slowest imports of a module in a fresh interpreter.
+
+    The warm-up is turned off, so this is the cost of the imports
+    alone. Entries are sorted by their cumulative time.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=str(settings.BASE_DIR),
+        env={**os.environ, 'WARMUP': '0'},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    entries = [
+        entry for entry in parse_import_times(result.stderr)
+        if entry[3] != module
+    ]
+    return sorted(entries, reverse=True)[:top]
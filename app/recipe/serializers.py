@@ -9,6 +9,7 @@ from core.models import (
     Tag,
     Ingredient,
 )
+from core import versioning
 
 
 
@@ -30,6 +31,22 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for Ingredient with the number of its recipes."""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
+class TagCountSerializer(TagSerializer):
+    """Serializer for Tags with the number of their recipes."""
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for recipes."""
 
@@ -39,12 +56,18 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ['id', 'title', 'time_minutes', 'price', 'link', 'tags', 'ingredients']
+        fields = [
+            'id', 'title', 'time_minutes', 'price', 'link', 'tags',
+            'ingredients', 'version',
+        ]
         read_only_fields = ['id']
+        # sent back on updates, the version the client changed
+        extra_kwargs = {'version': {'required': False}}
 
     def _get_or_create_tags(self, tags, recipe):
         """Handle getting or creating tags as needed."""
         auth_user = self.context['request'].user
+        tag_objs = []
 
         for tag in tags:
             tag_obj, created = Tag.objects.get_or_create(
@@ -55,14 +78,21 @@ class RecipeSerializer(serializers.ModelSerializer):
                 # it is supported automatically
                 **tag
             )
-            recipe.tags.add(tag_obj)
+            tag_objs.append(tag_obj)
+
+        # adding them all at once is a single insert
+        # and a single refresh of the recipe snapshot
+        recipe.tags.add(*tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed."""
         auth_user = self.context['request'].user
+        ingredient_objs = []
         for ingredient in ingredients:
             ingredient_obj, created = Ingredient.objects.get_or_create(user=auth_user, **ingredient)
-            recipe.ingredients.add(ingredient_obj)
+            ingredient_objs.append(ingredient_obj)
+
+        recipe.ingredients.add(*ingredient_objs)
 
 
 
@@ -77,6 +107,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         # tag names for recipe creation so we pop it
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
+        validated_data.pop('version', None)
         recipe = Recipe.objects.create(**validated_data)
 
         self._get_or_create_tags(tags, recipe)
@@ -86,10 +117,21 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
     def update(self, instance, validated_data):
-        """Update a recipe."""
+        """Update a recipe if it is still at the version the client read.
+
+        The versions of an If-Match header are passed to save() as
+        if_match, the version field has to match as well.
+        """
+        versions = validated_data.pop('if_match', None)
+        version = validated_data.pop('version', None)
+        if version is not None:
+            versions = {version} if versions is None else versions & {version}
+        # before anything is written, a conflict leaves the recipe as is
+        versioning.claim(instance, versions)
 
         tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('ingredients', None)
+        # the recipe counts follow the links, see core.counters
         if tags is not None:
             instance.tags.clear()
             self._get_or_create_tags(tags, instance)
@@ -106,6 +148,15 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 
+class RecipeListSerializer(RecipeSerializer):
+    """Serializer for listing recipes from their tag/ingredient snapshots."""
+
+    tags = TagSerializer(many=True, read_only=True, source='tags_snapshot')
+    ingredients = IngredientSerializer(
+        many=True, read_only=True, source='ingredients_snapshot'
+    )
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view."""
 
@@ -0,0 +1,158 @@
+"""
+Tests for the changes API.
+"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import (
+    Recipe,
+    Tag,
+)
+
+
+CHANGES_URL = reverse('recipe:changes')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def recipe_url(recipe_id):
+    """Create and return a recipe detail url."""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def tag_url(tag_id):
+    """Create and return a tag detail url."""
+    return reverse('recipe:tag-detail', args=[tag_id])
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a new user."""
+    return get_user_model().objects.create_user(email, password)
+
+
+class PublicChangesApiTests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to read changes."""
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateChangesApiTests(TestCase):
+    """Test authenticated API requests."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+
+    def test_created_recipe_listed(self):
+        """Test a created recipe is listed once with its data."""
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 30,
+            'price': Decimal('5.50'),
+            'tags': [{'name': 'Indian'}],
+        }
+        self.client.post(RECIPES_URL, payload, format='json')
+
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe_changes = [
+            c for c in res.data['changes'] if c['type'] == 'recipe'
+        ]
+        self.assertEqual(len(recipe_changes), 1)
+        self.assertEqual(recipe_changes[0]['action'], 'created')
+        self.assertEqual(recipe_changes[0]['data']['title'], 'Curry')
+        self.assertEqual(len(recipe_changes[0]['data']['tags']), 1)
+
+    def test_cursor_returns_only_new_changes(self):
+        """Test reading again from a cursor skips seen changes."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=Decimal('1')
+        )
+        res = self.client.get(CHANGES_URL)
+        cursor = res.data['cursor']
+
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+        self.assertEqual(res.data['changes'], [])
+        self.assertEqual(res.data['cursor'], cursor)
+
+        self.client.patch(recipe_url(recipe.id), {'title': 'Stew'})
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+
+        self.assertEqual(len(res.data['changes']), 1)
+        self.assertEqual(res.data['changes'][0]['action'], 'updated')
+        self.assertEqual(res.data['changes'][0]['data']['title'], 'Stew')
+
+    def test_deleted_recipe_tombstone(self):
+        """Test deleting a recipe is listed without data."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=Decimal('1')
+        )
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        self.client.delete(recipe_url(recipe.id))
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+
+        self.assertEqual(res.data['changes'], [{
+            'type': 'recipe',
+            'id': recipe.id,
+            'action': 'deleted',
+            'data': None,
+        }])
+
+    def test_deleted_tag_tombstone(self):
+        """Test deleting a tag lists it and the recipes using it."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = Recipe.objects.create(
+            user=self.user, title='Salad', time_minutes=5, price=Decimal('1')
+        )
+        recipe.tags.add(tag)
+        cursor = self.client.get(CHANGES_URL).data['cursor']
+
+        self.client.delete(tag_url(tag.id))
+        res = self.client.get(CHANGES_URL, {'cursor': cursor})
+
+        listed = {(c['type'], c['id']): c for c in res.data['changes']}
+        self.assertEqual(listed[('tag', tag.id)]['action'], 'deleted')
+        self.assertEqual(listed[('recipe', recipe.id)]['data']['tags'], [])
+
+    def test_limit_pages_changes(self):
+        """Test changes are paged with has_more."""
+        for i in range(3):
+            Tag.objects.create(user=self.user, name=f'Tag {i}')
+
+        res = self.client.get(CHANGES_URL, {'limit': 2})
+        self.assertEqual(len(res.data['changes']), 2)
+        self.assertTrue(res.data['has_more'])
+
+        res = self.client.get(
+            CHANGES_URL, {'limit': 2, 'cursor': res.data['cursor']}
+        )
+        self.assertEqual(len(res.data['changes']), 1)
+        self.assertFalse(res.data['has_more'])
+
+    def test_changes_limited_to_user(self):
+        """Test changes of other users are not listed."""
+        other = create_user(email='other@example.com')
+        Tag.objects.create(user=other, name='Other')
+
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.data['changes'], [])
+
+    def test_invalid_cursor(self):
+        """Test an invalid cursor returns an error."""
+        res = self.client.get(CHANGES_URL, {'cursor': 'not a cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
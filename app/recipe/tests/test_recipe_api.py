@@ -2,6 +2,7 @@
 Tests for recipe API.
 """
 
+from datetime import timedelta
 from decimal import Decimal
 import tempfile
 import os
@@ -10,12 +11,14 @@ from PIL import Image
 
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import (
+    IdempotencyKey,
     Recipe,
     Tag,
     Ingredient,
@@ -473,8 +476,203 @@ class PrivateRecipeApiTests(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_recipe_counts_follow_changes(self):
+        """Test tag and ingredient recipe counts are kept up to date."""
+        payload = {
+            'title': 'some recipe',
+            'time_minutes': 20,
+            'price': Decimal('4.50'),
+            'tags': [{'name': 'Lunch'}],
+            'ingredients': [{'name': 'Salt'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        url = detail_url(res.data['id'])
+        lunch = Tag.objects.get(user=self.user, name='Lunch')
+        salt = Ingredient.objects.get(user=self.user, name='Salt')
+        self.assertEqual(lunch.recipe_count, 1)
+        self.assertEqual(salt.recipe_count, 1)
+
+        self.client.patch(url, {'tags': [{'name': 'Dinner'}]}, format='json')
+        lunch.refresh_from_db()
+        dinner = Tag.objects.get(user=self.user, name='Dinner')
+        self.assertEqual(lunch.recipe_count, 0)
+        self.assertEqual(dinner.recipe_count, 1)
+
+        self.client.delete(url)
+        dinner.refresh_from_db()
+        salt.refresh_from_db()
+        self.assertEqual(dinner.recipe_count, 0)
+        self.assertEqual(salt.recipe_count, 0)
+
+    def test_list_reads_snapshots(self):
+        """Test listing recipes uses the tag and ingredient snapshots."""
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        recipe.tags.add(tag)
+        recipe.ingredients.add(ingredient)
+
+        recipe.refresh_from_db()
+        self.assertEqual(
+            recipe.tags_snapshot, [{'id': tag.id, 'name': 'Vegan'}]
+        )
+
+        # the tags and ingredients are not read from the link tables
+        Recipe.tags.through.objects.all().delete()
+        Recipe.ingredients.through.objects.all().delete()
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            res.data[0]['tags'], [{'id': tag.id, 'name': 'Vegan'}]
+        )
+        self.assertEqual(
+            res.data[0]['ingredients'],
+            [{'id': ingredient.id, 'name': 'Tofu'}],
+        )
+
+    @override_settings(RECIPE_LIST_SNAPSHOTS=False)
+    def test_list_without_snapshots(self):
+        """Test listing recipes from the link tables stays in budget."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        for _ in range(3):
+            recipe = create_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        # the tests raise when a view runs over its query budget
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipes = Recipe.objects.filter(user=self.user).order_by('-id')
+        serializer = RecipeSerializer(recipes, many=True)
+        self.assertEqual(res.data, serializer.data)
+
+    def test_create_recipe_idempotent(self):
+        """Test retrying a create with the same key replays the response."""
+        payload = {
+            'title': 'sample recipe',
+            'time_minutes': 30,
+            'price': Decimal('20.50'),
+        }
+        res1 = self.client.post(
+            RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-1'
+        )
+        res2 = self.client.post(
+            RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-1'
+        )
+
+        self.assertEqual(res1.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res2.data, res1.data)
+        self.assertEqual(res2['Idempotent-Replayed'], 'true')
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_expired_idempotency_key_reused(self):
+        """Test a key runs the request again once it expired."""
+        payload = {'title': 'one', 'time_minutes': 5, 'price': Decimal('1.00')}
+        self.client.post(RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-3')
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        res = self.client.post(
+            RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-3'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_PURGE_SAMPLE_RATE=1)
+    def test_expired_idempotency_keys_purged(self):
+        """Test sampled keyed requests delete the expired keys."""
+        other = create_user(email='other@example.com', password='test123')
+        IdempotencyKey.objects.create(user=other, key='old', fingerprint='')
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        payload = {'title': 'one', 'time_minutes': 5, 'price': Decimal('1.00')}
+
+        self.client.post(RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-4')
+
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list('key', flat=True)),
+            ['key-4'],
+        )
+
+    def test_idempotency_key_reused_for_other_request(self):
+        """Test a key can not be reused with another payload."""
+        payload = {'title': 'one', 'time_minutes': 5, 'price': Decimal('1.00')}
+        self.client.post(RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-2')
+
+        payload['title'] = 'two'
+        res = self.client.post(
+            RECIPES_URL, payload, HTTP_IDEMPOTENCY_KEY='key-2'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_update_bumps_version(self):
+        """Test every update bumps the version and returns its ETag."""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+
+        res = self.client.get(url)
+        self.assertEqual(res['ETag'], '"1"')
+
+        res = self.client.patch(url, {'title': 'new title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['version'], 2)
+        self.assertEqual(res['ETag'], '"2"')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.version, 2)
+
+    def test_update_with_current_if_match(self):
+        """Test an update of the version read is applied."""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.patch(
+            detail_url(recipe.id), {'title': 'new title'}, HTTP_IF_MATCH='"1"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'new title')
+
+    def test_update_with_outdated_if_match(self):
+        """Test an update of an outdated version fails with 412."""
+        recipe = create_recipe(user=self.user, title='original title')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        Recipe.objects.filter(id=recipe.id).update(version=2)
+        payload = {'title': 'new title', 'tags': [{'name': 'Lunch'}]}
+
+        res = self.client.patch(
+            detail_url(recipe.id), payload, format='json', HTTP_IF_MATCH='"1"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'original title')
+        self.assertEqual(recipe.version, 2)
+        self.assertEqual(list(recipe.tags.all()), [tag])
 
+    def test_update_with_outdated_version_field(self):
+        """Test the version field is checked like If-Match."""
+        recipe = create_recipe(user=self.user, title='original title')
+        Recipe.objects.filter(id=recipe.id).update(version=2)
 
+        res = self.client.patch(
+            detail_url(recipe.id), {'title': 'new title', 'version': 1}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'original title')
 
 
 class ImageUploadTests(TestCase):
@@ -519,4 +717,69 @@ class ImageUploadTests(TestCase):
         payload = {'image': 'not an image'}
         res = self.client.post(url, payload, format='multipart')
 
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_image_idempotent(self):
+        """Test retrying an upload with the same key does not write again."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            img = Image.new('RGB', (10, 10))
+            img.save(image_file, format='JPEG')
+            image_file.seek(0)
+            res1 = self.client.post(
+                url, {'image': image_file}, format='multipart',
+                HTTP_IDEMPOTENCY_KEY='upload-1',
+            )
+            self.recipe.refresh_from_db()
+            first_image = self.recipe.image.name
+
+            image_file.seek(0)
+            res2 = self.client.post(
+                url, {'image': image_file}, format='multipart',
+                HTTP_IDEMPOTENCY_KEY='upload-1',
+            )
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(res1.status_code, status.HTTP_200_OK)
+        self.assertEqual(res2.data, res1.data)
+        self.assertEqual(res2['ETag'], res1['ETag'])
+        self.assertEqual(self.recipe.image.name, first_image)
+
+    def test_upload_image_bumps_version(self):
+        """Test a new image bumps the version like an update."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.post(
+                url, {'image': image_file}, format='multipart',
+                HTTP_IF_MATCH='"1"',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['ETag'], '"2"')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.version, 2)
+
+        res = self.client.patch(
+            detail_url(self.recipe.id), {'title': 'new title'},
+            HTTP_IF_MATCH='"1"',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_upload_image_outdated_if_match(self):
+        """Test an upload to an outdated version fails with 412."""
+        Recipe.objects.filter(id=self.recipe.id).update(version=2)
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.post(
+                url, {'image': image_file}, format='multipart',
+                HTTP_IF_MATCH='"1"',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
@@ -154,4 +154,67 @@ class PrivateTagApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
\ No newline at end of file
+        self.assertEqual(len(res.data), 1)
+
+    def test_list_tags_with_counts(self):
+        """Test listing tags with the number of their recipes."""
+
+        tag1 = Tag.objects.create(user=self.user, name='tag1')
+        Tag.objects.create(user=self.user, name='tag2')
+        payload = {
+            'title': 'recipe1',
+            'time_minutes': 9,
+            'price': Decimal('6.40'),
+            'tags': [{'name': 'tag1'}],
+        }
+        self.client.post(
+            reverse('recipe:recipe-list'), payload, format='json'
+        )
+
+        res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        counts = {tag['id']: tag['recipe_count'] for tag in res.data}
+        self.assertEqual(counts[tag1.id], 1)
+        self.assertEqual(sorted(counts.values()), [0, 1])
+
+    def test_list_tags_invalid_with_counts(self):
+        """Test with_counts other than 0 or 1 is a bad request."""
+        res = self.client.get(TAGS_URL, {'with_counts': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('with_counts', res.data)
+
+    def test_rename_tag_updates_recipe_snapshot(self):
+        """Test renaming a tag renames it in the recipes using it."""
+        tag = Tag.objects.create(user=self.user, name='old name')
+        recipe = Recipe.objects.create(
+            title='recipe1',
+            time_minutes=9,
+            price=Decimal('6.40'),
+            user=self.user,
+        )
+        recipe.tags.add(tag)
+
+        self.client.patch(detail_url(tag.id), {'name': 'new name'})
+
+        recipe.refresh_from_db()
+        self.assertEqual(
+            recipe.tags_snapshot, [{'id': tag.id, 'name': 'new name'}]
+        )
+
+    def test_delete_tag_updates_recipe_snapshot(self):
+        """Test deleting a tag removes it from the recipes using it."""
+        tag = Tag.objects.create(user=self.user, name='tag1')
+        recipe = Recipe.objects.create(
+            title='recipe1',
+            time_minutes=9,
+            price=Decimal('6.40'),
+            user=self.user,
+        )
+        recipe.tags.add(tag)
+
+        self.client.delete(detail_url(tag.id))
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tags_snapshot, [])
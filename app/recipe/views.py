@@ -1,5 +1,8 @@
 """Views for recipe APIs."""
 
+from django.conf import settings
+from django.db import transaction
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
@@ -7,23 +10,51 @@ from drf_spectacular.utils import (
     OpenApiTypes,
 )
 from rest_framework import (
+    generics,
     viewsets,
     mixins,
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
 from core.models import (
+    ChangeLog,
     Recipe,
     Tag,
     Ingredient,
 )
+from core import changes, versioning
+from core.authentication import CachedTokenAuthentication
+from core.budgets import Budget
+from core.idempotency import idempotent
+from core.snapshots import refresh_recipe_snapshots
+from core.stale import StaleListMixin
+from core.timing import TimedViewMixin
 from recipe import serializers
 
 
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    'Idempotency-Key',
+    OpenApiTypes.STR,
+    location=OpenApiParameter.HEADER,
+    description='Retries with the same key get the first response back.'
+)
+
+IF_MATCH_PARAMETER = OpenApiParameter(
+    'If-Match',
+    OpenApiTypes.STR,
+    location=OpenApiParameter.HEADER,
+    description='ETag of the version read, the update fails with 412 '
+                'if the recipe changed since.'
+)
+
+DEFAULT_CHANGES = 100
+MAX_CHANGES = 500
+
+
 # because we need to add filtering manually to the docs
 @extend_schema_view(
     list=extend_schema(
@@ -39,21 +70,33 @@ from recipe import serializers
                 description='Comma separated list of ingredient IDs to filter'
             )
         ]
-    )
+    ),
+    create=extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER]),
+    update=extend_schema(parameters=[IF_MATCH_PARAMETER]),
+    partial_update=extend_schema(parameters=[IF_MATCH_PARAMETER]),
+    upload_image=extend_schema(parameters=[IDEMPOTENCY_KEY_PARAMETER]),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(TimedViewMixin, StaleListMixin, viewsets.ModelViewSet):
     """View for manage recipe APIs."""
 
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # set to 'upload' by the upload_image action, as_view only
+    # accepts the attributes a view has
+    throttle_scope = None
+    # the most queries and the statement timeout of the reads,
+    # enforced by QueryBudgetMiddleware
+    budgets = {
+        'list': Budget(queries=4, timeout_ms=2000),
+        'retrieve': Budget(queries=6, timeout_ms=1000),
+    }
 
     def _params_to_ints(self, params):
         """Convert params that are comma separated ids to a list of ints."""
         return [int(id) for id in params.split(',')]
 
-
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
         tags = self.request.query_params.get('tags')
@@ -69,10 +112,20 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         # using distinct here because we dont want duplicates
         # in our list of ingredients filtered by tags and ingredients
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
         ).order_by('-id').distinct()
 
+        # lists are read far more often than they change, the
+        # other actions read the row they are about to change
+        if self.action == 'list':
+            queryset = queryset.cached()
+            # without the snapshots the tags and ingredients of
+            # every recipe are serialized from the link tables
+            if not settings.RECIPE_LIST_SNAPSHOTS:
+                queryset = queryset.prefetch_related('tags', 'ingredients')
+        return queryset
+
     def get_serializer_class(self):
         """Return the serializer class for the request."""
 
@@ -81,26 +134,68 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # as an exception and in normal cases, return the
         # recipeDetailSerializer
         if self.action == 'list':
+            if settings.RECIPE_LIST_SNAPSHOTS:
+                return serializers.RecipeListSerializer
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
 
         return self.serializer_class
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Create a recipe, only once per Idempotency-Key."""
+        return super().create(request, *args, **kwargs)
+
+    # the writes and their change log rows are committed together
+    @transaction.atomic
     def perform_create(self, serializer):
         """Create a new recipe."""
         serializer.save(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """Return a recipe with the ETag of its version."""
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = versioning.etag(response.data['version'])
+        return response
+
+    def update(self, request, *args, **kwargs):
+        """Update a recipe, only at the version of If-Match if given."""
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = versioning.etag(response.data['version'])
+        return response
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Update a recipe."""
+        serializer.save(if_match=versioning.if_match(self.request))
 
-    @action(methods=['POST'], detail=True, url_path='upload_image')
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Delete a recipe, the counters of its links follow."""
+        instance.delete()
+
+    # uploads are throttled separately from other writes
+    @action(
+        methods=['POST'],
+        detail=True,
+        url_path='upload_image',
+        throttle_scope='upload',
+    )
+    @idempotent
     def upload_image(self, request, pk=None):
         """upload an image to recipe."""
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # a new image is a change like any other, see perform_update
+            with transaction.atomic():
+                versioning.claim(recipe, versioning.if_match(request))
+                serializer.save()
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+            response['ETag'] = versioning.etag(recipe.version)
+            return response
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -115,17 +210,27 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0, 1],
                 description='Filter by items assigned to recipe.'
-            )
+            ),
+            OpenApiParameter(
+                'with_counts',
+                OpenApiTypes.INT, enum=[0, 1],
+                description='Include the number of recipes of each item.'
+            ),
         ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.ListModelMixin,
+class BaseRecipeAttrViewSet(TimedViewMixin,
+                            StaleListMixin,
+                            mixins.ListModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin,
                             viewsets.GenericViewSet):
     """Base ViewSet for recipe attributes(like tag and ingredient)."""
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    budgets = {
+        'list': Budget(queries=3, timeout_ms=1000),
+    }
 
     def get_queryset(self):
         """Retrieve tags for authenticated user."""
@@ -135,10 +240,47 @@ class BaseRecipeAttrViewSet(mixins.ListModelMixin,
         queryset = self.queryset
         if assigned_only:
             queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
         ).order_by('-name').distinct()
 
+        if self.action == 'list':
+            queryset = queryset.cached()
+        return queryset
+
+    def get_serializer_class(self):
+        """Return the serializer class for the request."""
+
+        # the counts are read from the recipe_count column
+        # so including them does not cost an extra query
+        with_counts = self.request.query_params.get('with_counts', '0')
+        if with_counts not in ('0', '1'):
+            raise ValidationError({'with_counts': 'Must be 0 or 1.'})
+        if self.action == 'list' and with_counts == '1':
+            return self.count_serializer_class
+
+        return self.serializer_class
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        """Update the item and the snapshots of recipes using it."""
+        instance = serializer.save()
+        recipe_ids = list(instance.recipe_set.values_list('id', flat=True))
+        refresh_recipe_snapshots(recipe_ids, [self.recipe_field])
+        changes.log_changes(
+            instance.user_id, Recipe, recipe_ids, ChangeLog.UPDATED
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Delete the item and drop it from the snapshots of recipes."""
+        recipe_ids = list(instance.recipe_set.values_list('id', flat=True))
+        instance.delete()
+        refresh_recipe_snapshots(recipe_ids, [self.recipe_field])
+        changes.log_changes(
+            instance.user_id, Recipe, recipe_ids, ChangeLog.UPDATED
+        )
+
 
 # is it also possible to use ModelViewSet
 # idk why the tutorial uses GenericViewSet
@@ -147,11 +289,100 @@ class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database."""
 
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage Ingredients in the database."""
 
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter(
+            'cursor',
+            OpenApiTypes.STR,
+            description='Cursor returned by the previous call, '
+                        'leave out for all changes.'
+        ),
+        OpenApiParameter(
+            'limit',
+            OpenApiTypes.INT,
+            description=f'Maximum number of changes, up to {MAX_CHANGES}.'
+        ),
+    ],
+    responses=OpenApiTypes.OBJECT,
+)
+class ChangesView(TimedViewMixin, generics.GenericAPIView):
+    """List the changes of recipes, tags and ingredients after a cursor."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    budgets = {
+        'get': Budget(queries=8, timeout_ms=2000),
+    }
+    serializer_classes = {
+        'recipe': serializers.RecipeDetailSerializer,
+        'tag': serializers.TagSerializer,
+        'ingredient': serializers.IngredientSerializer,
+    }
+    querysets = {
+        'recipe': Recipe.objects.prefetch_related('tags', 'ingredients'),
+        'tag': Tag.objects.all(),
+        'ingredient': Ingredient.objects.all(),
+    }
+
+    def get(self, request):
+        try:
+            after = changes.decode_cursor(request.query_params.get('cursor'))
+            limit = int(request.query_params.get('limit', DEFAULT_CHANGES))
+        except ValueError:
+            return Response(
+                {'detail': 'Invalid cursor or limit.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = min(max(limit, 1), MAX_CHANGES)
+
+        merged, last_id, has_more = changes.read_changes(
+            request.user, after, limit
+        )
+
+        # one query per kind for the objects that still exist
+        objects = {}
+        for kind, queryset in self.querysets.items():
+            ids = [
+                object_id for (k, object_id), change in merged.items()
+                if k == kind and change != ChangeLog.DELETED
+            ]
+            if ids:
+                for obj in queryset.filter(user=request.user, id__in=ids):
+                    objects[(kind, obj.id)] = obj
+
+        results = []
+        for (kind, object_id), change in merged.items():
+            data = None
+            if change != ChangeLog.DELETED:
+                obj = objects.get((kind, object_id))
+                if obj is None:
+                    # deleted later on, the tombstone is on a later page
+                    continue
+                data = self.serializer_classes[kind](
+                    obj, context=self.get_serializer_context()
+                ).data
+            results.append({
+                'type': kind,
+                'id': object_id,
+                'action': change,
+                'data': data,
+            })
+
+        return Response({
+            'changes': results,
+            'cursor': changes.encode_cursor(last_id),
+            'has_more': has_more,
+        })